@@ -1,3 +1,5 @@
+import os
+import threading
 import pandas as pd
 import numpy as np
 import pickle
@@ -7,8 +9,130 @@ from flask_cors import CORS
 from config import Config
 from .models.content import ImprovedContentBased 
 from .models.hybrid import HybridRecommender
+from .models.online import OnlineUpdater
+from .models.ann import RandomProjectionLSH
+from .models.precomputed import PrecomputedRecommendations
+from .models.trending import TrendingModel
+from .models.segments import SegmentPopularity
+from .utils.data_helpers import load_user_demographics
+from .utils.result_cache import RecommendationCache
+from .models.artifacts import load_artifacts, current_artifacts_dir
 from .database.connection import init_db 
 
+def load_models(all_movies_df, ratings_df):
+    """
+    Load the served models: the published memory-mapped model set, else the
+    pickles, else train them
+
+    Returns:
+        Tuple of (hybrid_system, content_model, precomputed_recs)
+    """
+    # Memory-mapped model set published by scripts/train_models.py, pickle otherwise
+    hybrid_system = None
+    model_path = None
+    from_arrays = False
+    artifacts_dir = current_artifacts_dir(Config.MODELS_DIR)
+    if artifacts_dir is not None:
+        try:
+            hybrid_system = load_artifacts(artifacts_dir)
+            model_path = os.path.join(artifacts_dir, 'manifest.json')
+            from_arrays = True
+            print(f"Hybrid Recommender loaded (memory-mapped, {artifacts_dir}).")
+        except Exception as e:
+            print(f"Erreur chargement model arrays: {e}")
+
+    if hybrid_system is None:
+        try:
+            with open(Config.HYBRID_MODEL_PATH, 'rb') as f:
+                hybrid_system = pickle.load(f)
+            model_path = Config.HYBRID_MODEL_PATH
+            print("Hybrid Recommender loaded.")
+        except Exception as e:
+            print(f"Erreur chargement hybrid_system: {e}. Initialisation...")
+            hybrid_system = HybridRecommender(all_movies_df, ratings_df)
+
+    if getattr(hybrid_system, 'trending_model', None) is None and 'unix_timestamp' in ratings_df.columns:
+        # Models trained before the trending model existed
+        hybrid_system.trending_model = TrendingModel(all_movies_df, ratings_df)
+        print("Trending model built from rating timestamps.")
+
+    if getattr(hybrid_system, 'segment_model', None) is None and not ratings_df.empty:
+        users_df = load_user_demographics()
+        if users_df is not None:
+            hybrid_system.segment_model = SegmentPopularity(all_movies_df, ratings_df, users_df)
+            print(f"Segment popularity built ({len(hybrid_system.segment_model)} segments).")
+
+    # The index published with the loaded model set, else the one at the configured path
+    ann_index_path = Config.CF_ANN_INDEX_PATH
+    if from_arrays:
+        version_index_path = os.path.join(
+            os.path.dirname(artifacts_dir), os.path.basename(Config.CF_ANN_INDEX_PATH)
+        )
+        if os.path.exists(version_index_path):
+            ann_index_path = version_index_path
+    if hybrid_system.cf_model is not None and os.path.exists(ann_index_path):
+        try:
+            ann_index = RandomProjectionLSH.load(ann_index_path)
+            if hybrid_system.cf_model.attach_ann_index(ann_index):
+                print("CF ANN index loaded.")
+        except Exception as e:
+            print(f"Erreur chargement ANN index: {e}")
+
+    # Dense CF similarities built now, not by the first requests on the pool threads
+    hybrid_system.prepare()
+
+    precomputed_recs = None
+    if os.path.exists(Config.PRECOMPUTED_RECS_PATH) and model_path is not None:
+        try:
+            # Lists computed with an older hybrid model would be stale
+            if os.path.getmtime(Config.PRECOMPUTED_RECS_PATH) >= os.path.getmtime(model_path):
+                precomputed_recs = PrecomputedRecommendations.load(Config.PRECOMPUTED_RECS_PATH)
+                print(f"Precomputed recommendations loaded ({len(precomputed_recs)} users).")
+            else:
+                print("Precomputed recommendations are older than the hybrid model, ignored.")
+        except Exception as e:
+            print(f"Erreur chargement precomputed recommendations: {e}")
+
+    if from_arrays:
+        # The model set already holds the content model
+        content_model = hybrid_system.cb_model
+    else:
+        try:
+            content_model = ImprovedContentBased.load_model(Config.CONTENT_MODEL_PATH)
+            hybrid_system.cb_model = content_model
+            print("Content-Based model loaded.")
+        except Exception as e:
+            print(f"Erreur chargement content_model: {e}")
+            content_model = hybrid_system.cb_model
+    return hybrid_system, content_model, precomputed_recs
+
+
+# One reload at a time: each one records the ratings applied while it loads
+_reload_lock = threading.Lock()
+
+
+def reload_models(app):
+    """
+    Swap in the latest published models (e.g. after scripts/train_models.py)
+    and drop every cached recommendation computed with the previous ones
+    """
+    # Ratings applied to the previous models while loading are replayed into the new ones,
+    # those still queued are applied to the new ones by the same updater
+    with _reload_lock:
+        online_updater = app.online_updater
+        online_updater.begin_swap()
+        try:
+            hybrid_system, content_model, precomputed_recs = load_models(app.all_movies_df, app.ratings_df)
+        except Exception:
+            online_updater.cancel_swap()
+            raise
+        online_updater.swap_models(hybrid_system)
+        app.hybrid_system = hybrid_system
+        app.content_model = content_model
+        app.precomputed_recs = precomputed_recs
+        app.recommendation_cache.clear()
+
+
 def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
@@ -43,21 +167,7 @@ def create_app(config_class=Config):
         print(f"Erreur chargement ratings: {e}")
         ratings_df = pd.DataFrame()
 
-    try:
-        with open(Config.HYBRID_MODEL_PATH, 'rb') as f:
-            hybrid_system = pickle.load(f)
-        print("Hybrid Recommender loaded.")
-    except Exception as e:
-        print(f"Erreur chargement hybrid_system: {e}. Initialisation...")
-        hybrid_system = HybridRecommender(all_movies_df, ratings_df)
-
-    try:
-        content_model = ImprovedContentBased.load_model(Config.CONTENT_MODEL_PATH)
-        hybrid_system.cb_model = content_model
-        print("Content-Based model loaded.")
-    except Exception as e:
-        print(f"Erreur chargement content_model: {e}")
-        content_model = hybrid_system.cb_model
+    hybrid_system, content_model, precomputed_recs = load_models(all_movies_df, ratings_df)
     # --- END OF DATA/MODEL LOADING ---
 
     # --- Attach models and data to the app instance ---
@@ -65,6 +175,16 @@ def create_app(config_class=Config):
     app.ratings_df = ratings_df
     app.hybrid_system = hybrid_system
     app.content_model = content_model
+    app.precomputed_recs = precomputed_recs
+    app.recommendation_cache = RecommendationCache(
+        max_entries=Config.RECOMMENDATION_CACHE_MAX_ENTRIES,
+        max_bytes=Config.RECOMMENDATION_CACHE_MAX_BYTES,
+        ttl=Config.RECOMMENDATION_CACHE_TTL
+    )
+    # Results computed while a rating was queued are dropped once the models have it
+    app.online_updater = OnlineUpdater(
+        hybrid_system, on_applied=app.recommendation_cache.invalidate_users
+    )
 
     # Enregistrer les blueprints (routes)
     from .api.auth import bp as auth_bp
@@ -1,70 +1,126 @@
-from flask import Blueprint, jsonify, request, current_app
-import pandas as pd
+import hmac
+import json
+
+from flask import Blueprint, jsonify, request, current_app, stream_with_context
+import numpy as np
 
 from config import Config 
 from ..models.hybrid import HybridRecommender 
 from ..utils.data_helpers import enrich_recs_with_posters
-from ..utils.db_manager import get_user_ratings, save_rating
+from ..utils.db_manager import get_user_ratings, get_users_ratings, save_rating
 
 bp = Blueprint('recommendations', __name__)
 
+def _user_ratings_arrays(hybrid_system, user_id, user_ratings_list):
+    """(movie_ids, ratings) arrays of the MongoDB ratings merged with the training ones"""
+    # Tableaux NumPy directement: pas de DataFrame ni de parcours de ratings_df par requête
+    movie_ids = np.fromiter(
+        (rating['movie_id'] for rating in user_ratings_list), dtype=np.int64, count=len(user_ratings_list)
+    )
+    ratings = np.fromiter(
+        (float(rating['rating']) for rating in user_ratings_list), dtype=np.float64, count=len(user_ratings_list)
+    )
+    # Les notes MongoDB remplacent celles de l'entraînement pour un même film
+    return hybrid_system.user_index.merged(user_id, movie_ids, ratings)
+
+def _cf_mode_error(cf_mode):
+    """Error message for a cf_mode the loaded model set cannot serve, else None"""
+    if cf_mode is None:
+        return None
+    if cf_mode not in HybridRecommender.CF_MODES:
+        return f"cf_mode must be one of {list(HybridRecommender.CF_MODES)}"
+    # Les backends sont entraînés hors ligne (scripts/train_models.py), jamais pendant une requête
+    loaded = current_app.hybrid_system.cf_models
+    if cf_mode not in loaded:
+        return f"cf_mode '{cf_mode}' is not loaded on this server. Loaded: {list(loaded)}"
+    return None
+
+def _stored_recommendations(hybrid_system, user_id, user_ratings_list, cf_mode, n):
+    """Offline snapshot of a user while they have not rated anything since, else None"""
+    precomputed = current_app.precomputed_recs
+    if (precomputed is not None and precomputed.n >= n
+            and (cf_mode or hybrid_system.cf_mode) == precomputed.cf_mode
+            and precomputed.is_current(user_ratings_list)):
+        stored = precomputed.get(user_id, hybrid_system.id_to_title)
+        if stored is not None:
+            recs, explanation = stored
+            return recs[:n], explanation
+    return None
+
+def _live_recommendations(hybrid_system, user_id, user_ratings_list, cf_mode, segment=None):
+    """Run the hybrid pipeline on the MongoDB ratings merged with the training ones"""
+    movie_ids, ratings = _user_ratings_arrays(hybrid_system, user_id, user_ratings_list)
+
+    recs, explanation = hybrid_system.recommend_for_ratings(
+        user_id,
+        movie_ids,
+        ratings,
+        n=20,
+        explain=True,
+        cf_mode=cf_mode,
+        segment=segment,
+        timeout=Config.RECOMMEND_LATENCY_BUDGET or None
+    )
+    return recs, explanation
+
 @bp.route('/recommend', methods=['POST'])
 def get_recommendations():
     data = request.get_json()
     if not data or 'user_id' not in data:
         return jsonify({"error": "user_id is required"}), 400
+    cf_mode = data.get('cf_mode')
+    cf_mode_error = _cf_mode_error(cf_mode)
+    if cf_mode_error is not None:
+        return jsonify({"error": cf_mode_error}), 400
+    # Indice démographique optionnel pour les nouveaux utilisateurs:
+    # "occupation:engineer" ou {"age": 25, "gender": "F", "occupation": "engineer"}
+    segment = data.get('segment')
+    if segment is not None and not isinstance(segment, (str, dict)):
+        return jsonify({"error": "segment must be a segment name or an object with age, gender, occupation"}), 400
     try:
         user_id = int(data['user_id'])
         
         hybrid_system = current_app.hybrid_system
         all_movies_df = current_app.all_movies_df
 
+        # Repeat page loads are served from the cache, before any MongoDB read
+        cache = current_app.recommendation_cache
+        cache_params = {
+            'cf_mode': cf_mode or hybrid_system.cf_mode,
+            'segment': json.dumps(segment, sort_keys=True) if segment is not None else None
+        }
+        cached = cache.get(user_id, cache_params)
+        if cached is not None:
+            return current_app.response_class(cached, mimetype='application/json')
+        generation = cache.generation(user_id)
+
         # Get user ratings from MongoDB
         user_ratings_list = get_user_ratings(user_id)
         
         print(f"User {user_id} ratings from MongoDB: {len(user_ratings_list)} ratings")
-        
-        # Convert to DataFrame format
-        ratings_data_list = []
-        for rating in user_ratings_list:
-            ratings_data_list.append({
-                'user_id': rating['user_id'],
-                'movie_id': rating['movie_id'],
-                'rating': float(rating['rating'])
-            })
-        
-        user_ratings_df = pd.DataFrame(ratings_data_list) if ratings_data_list else pd.DataFrame()
-        
-        original_ratings_df = pd.DataFrame()
-        if not current_app.ratings_df.empty:
-            original_ratings_df = current_app.ratings_df[current_app.ratings_df['user_id'] == user_id].copy()
-        
-        if not user_ratings_df.empty and not original_ratings_df.empty:
-            newly_rated_ids = set(user_ratings_df['movie_id'])
-            original_filtered = original_ratings_df[~original_ratings_df['movie_id'].isin(newly_rated_ids)]
-            combined_ratings_df = pd.concat([user_ratings_df, original_filtered], ignore_index=True)
-        elif not user_ratings_df.empty:
-            combined_ratings_df = user_ratings_df
+
+        # Serve the offline snapshot while the user has not rated anything since
+        stored = _stored_recommendations(hybrid_system, user_id, user_ratings_list, cf_mode, 20)
+
+        if stored is not None:
+            recs, explanation = stored
         else:
-            combined_ratings_df = original_ratings_df
-        
-        category, rating_count = hybrid_system.get_user_category(user_id, combined_ratings_df)
-        
-        recs, explanation = hybrid_system.recommend(
-            user_id, 
-            n=20, 
-            explain=True, 
-            user_ratings_df=combined_ratings_df
-        )
-                
+            recs, explanation = _live_recommendations(
+                hybrid_system, user_id, user_ratings_list, cf_mode, segment
+            )
+
         formatted_recs = enrich_recs_with_posters(
             recs, all_movies_df, 0, 1, {"score": 2, "model_used": 3}
         )
         
-        return jsonify({ 
+        payload = current_app.json.dumps({
             "recommendations": formatted_recs, 
             "explanation": explanation 
-        })
+        }).encode('utf-8')
+        # A response degraded by the latency budget or a model error is not kept for the whole TTL
+        if not explanation.get('timed_out') and not explanation.get('failed'):
+            cache.put(user_id, cache_params, payload, generation)
+        return current_app.response_class(payload, mimetype='application/json')
         
     except Exception as e:
         print(f"Error in /api/recommend: {e}")
@@ -72,6 +128,73 @@ def get_recommendations():
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
 
+@bp.route('/recommend/batch', methods=['POST'])
+def get_batch_recommendations():
+    """
+    Recommendations of many users in one call (email / notification jobs)
+
+    Body: {"user_ids": [...], "n": 20, "cf_mode": "user"}
+    Streamed as NDJSON, one {"user_id", "recommendations", "explanation"}
+    line per user in request order. The users are processed in chunks:
+    one MongoDB $in query and one batched scoring pass per chunk.
+    """
+    data = request.get_json(silent=True)
+    if not data or not isinstance(data.get('user_ids'), list) or not data['user_ids']:
+        return jsonify({"error": "user_ids must be a non-empty list"}), 400
+    if len(data['user_ids']) > Config.RECOMMEND_BATCH_MAX_USERS:
+        return jsonify({"error": f"At most {Config.RECOMMEND_BATCH_MAX_USERS} user_ids per call"}), 400
+    cf_mode = data.get('cf_mode')
+    cf_mode_error = _cf_mode_error(cf_mode)
+    if cf_mode_error is not None:
+        return jsonify({"error": cf_mode_error}), 400
+    try:
+        user_ids = list(dict.fromkeys(int(user_id) for user_id in data['user_ids']))
+        n = int(data.get('n', 20))
+    except (TypeError, ValueError):
+        return jsonify({"error": "user_ids and n must be integers"}), 400
+    if not 1 <= n <= 100:
+        return jsonify({"error": "n must be between 1 and 100"}), 400
+
+    # Same models for the whole stream, even if they are reloaded meanwhile
+    hybrid_system = current_app.hybrid_system
+    chunk_size = Config.RECOMMEND_BATCH_CHUNK_SIZE
+
+    def generate():
+        for start in range(0, len(user_ids), chunk_size):
+            chunk = user_ids[start:start + chunk_size]
+            try:
+                ratings_by_user = get_users_ratings(chunk)
+                results = {}
+                live_users = {}
+                for user_id in chunk:
+                    user_ratings_list = ratings_by_user.get(user_id, [])
+                    stored = _stored_recommendations(hybrid_system, user_id, user_ratings_list, cf_mode, n)
+                    if stored is not None:
+                        results[user_id] = stored
+                    else:
+                        live_users[user_id] = _user_ratings_arrays(hybrid_system, user_id, user_ratings_list)
+                results.update(hybrid_system.recommend_batch(live_users, n, explain=True, cf_mode=cf_mode))
+            except Exception as e:
+                print(f"Error in /api/recommend/batch: {e}")
+                import traceback
+                traceback.print_exc()
+                for user_id in chunk:
+                    yield current_app.json.dumps({"user_id": user_id, "error": str(e)}) + "\n"
+                continue
+
+            for user_id in chunk:
+                recs, explanation = results[user_id]
+                yield current_app.json.dumps({
+                    "user_id": user_id,
+                    "recommendations": [
+                        {"movie_id": int(movie_id), "title": title, "score": score, "model_used": model}
+                        for movie_id, title, score, model in recs
+                    ],
+                    "explanation": explanation
+                }) + "\n"
+
+    return current_app.response_class(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 @bp.route('/similar/<path:movie_title>', methods=['GET'])
 def get_similar_movies(movie_title):
     try:
@@ -95,15 +218,8 @@ def get_genre_recommendations(genre_name):
     try:
         hybrid_system = current_app.hybrid_system
         all_movies_df = current_app.all_movies_df
-        
-        popular_movies_df = hybrid_system.popularity_model.popular_movies
-        popular_with_details = pd.merge(popular_movies_df, all_movies_df, on='movie_id', how='left')
-        genre_filtered_df = popular_with_details[popular_with_details[genre_name] == 1]
-        top_n_genre = genre_filtered_df.head(10)
-        recs_list = [
-            (row['movie_id'], row['movie_title_x'], row['weighted_score'])
-            for _, row in top_n_genre.iterrows()
-        ]
+
+        recs_list = hybrid_system.popularity_model.recommend_genre(genre_name, 10)
         formatted_recs = enrich_recs_with_posters(recs_list, all_movies_df, 0, 1, {"score": 2})
         return jsonify(formatted_recs)
     except Exception as e:
@@ -143,6 +259,15 @@ def rate_movie():
 
         # Save rating to MongoDB
         saved_rating = save_rating(user_id, movie_id, rating)
+        # The MongoDB rating is read by the next request right away; the
+        # updater invalidates the user again once the models have it
+        current_app.recommendation_cache.invalidate_user(user_id)
+
+        # Apply the rating to the in-memory models in the background
+        try:
+            current_app.online_updater.submit(user_id, movie_id, rating)
+        except Exception as e:
+            print(f"Warning: could not queue online model update: {e}")
         
         return jsonify({
             "success": True, 
@@ -189,7 +314,31 @@ def debug_content_model():
             'title_to_idx_size': len(content_model.title_to_idx),
             'idx_to_title_size': len(content_model.idx_to_title),
             'sample_titles': list(content_model.title_to_idx.keys())[:10],
-            'similarity_matrix_shape': content_model.similarity_matrix.shape
+            'neighbor_matrix_shape': content_model.neighbor_matrix.shape,
+            'neighbors_per_movie': content_model.n_neighbors,
+            'neighbor_matrix_nnz': int(content_model.neighbor_matrix.nnz),
+            'embedding_dim': content_model.embeddings.shape[1] if content_model.embeddings is not None else None
         })
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
\ No newline at end of file
+        return jsonify({"error": str(e)}), 500
+
+
+@bp.route('/debug/cache', methods=['GET'])
+def debug_recommendation_cache():
+    """Compteurs du cache des recommandations"""
+    return jsonify(current_app.recommendation_cache.stats())
+
+
+@bp.route('/debug/reload_models', methods=['POST'])
+def reload_recommendation_models():
+    """Recharge les modèles publiés et vide le cache des recommandations"""
+    # Désactivé sans ADMIN_TOKEN; sinon le jeton est exigé dans l'en-tête X-Admin-Token
+    token = request.headers.get('X-Admin-Token', '')
+    if not Config.ADMIN_TOKEN or not hmac.compare_digest(token, Config.ADMIN_TOKEN):
+        return jsonify({"error": "Forbidden"}), 403
+    try:
+        from .. import reload_models
+        reload_models(current_app._get_current_object())
+        return jsonify({"success": True, "cache": current_app.recommendation_cache.stats()})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
@@ -133,6 +133,11 @@ class Rating:
         """Find all ratings for a user"""
         return list(db.ratings.find({'user_id': user_id}))
     
+    @staticmethod
+    def find_by_users(db, user_ids: List[int]) -> List[Dict]:
+        """Find all ratings of several users in one query"""
+        return list(db.ratings.find({'user_id': {'$in': list(user_ids)}}))
+    
     @staticmethod
     def find_by_movie(db, movie_id: int) -> List[Dict]:
         """Find all ratings for a movie"""
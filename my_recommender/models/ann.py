@@ -0,0 +1,173 @@
+"""
+Approximate Nearest Neighbor index for user and item vectors
+Random-projection LSH (cosine) implemented with NumPy only
+"""
+import time
+
+import numpy as np
+from sklearn.preprocessing import normalize
+
+
+class RandomProjectionLSH:
+    """
+    Locality-sensitive hashing index for cosine similarity:
+    - Every table hashes a vector to the signs of `n_bits` random projections
+    - Vectors are sorted by code, so a bucket lookup is a binary search
+    - Multi-probe: with probe_radius=1 the buckets at Hamming distance 1
+      are visited too, trading latency for recall
+
+    Recall/latency knobs: more tables and a larger probe radius raise
+    recall; more bits make buckets smaller (fewer candidates, lower recall).
+    """
+
+    def __init__(self, n_tables=8, n_bits=12, probe_radius=1, random_state=42):
+        """
+        Args:
+            n_tables: Number of hash tables
+            n_bits: Number of random hyperplanes per table (max 62)
+            probe_radius: 0 to visit only the query bucket, 1 to also
+                visit the buckets at Hamming distance 1
+            random_state: Seed of the random hyperplanes
+        """
+        if not 0 < n_bits <= 62:
+            raise ValueError("n_bits must be between 1 and 62")
+        self.n_tables = n_tables
+        self.n_bits = n_bits
+        self.probe_radius = probe_radius
+        self.random_state = random_state
+        self.planes = None
+        self.sorted_codes = None
+        self.order = None
+        self.ids = None
+
+    def fit(self, vectors, ids=None):
+        """
+        Build the hash tables
+
+        Args:
+            vectors: Dense array or sparse matrix (n x dimensions)
+            ids: Optional ids aligned with the rows, stored to check that
+                a persisted index still matches its model
+
+        Returns:
+            self
+        """
+        rng = np.random.default_rng(self.random_state)
+        self.planes = rng.standard_normal(
+            (vectors.shape[1], self.n_tables * self.n_bits)
+        ).astype(np.float32)
+
+        codes = self._hash(vectors)
+        self.order = np.argsort(codes, axis=0, kind='stable').T.astype(np.int32)
+        self.sorted_codes = np.take_along_axis(codes.T, self.order, axis=1)
+        self.ids = np.asarray(ids) if ids is not None else np.arange(vectors.shape[0])
+        return self
+
+    def __len__(self):
+        return 0 if self.order is None else self.order.shape[1]
+
+    def _hash(self, vectors):
+        projected = normalize(vectors) @ self.planes
+        bits = (np.asarray(projected) > 0).reshape(-1, self.n_tables, self.n_bits)
+        weights = np.left_shift(1, np.arange(self.n_bits, dtype=np.int64))
+        return bits.astype(np.int64) @ weights
+
+    def query(self, vector, probe_radius=None):
+        """
+        Candidate rows for a query vector
+
+        Args:
+            vector: Dense array or sparse matrix (1 x dimensions)
+            probe_radius: Overrides the index probe radius
+
+        Returns:
+            Sorted array of candidate row indices
+        """
+        probe_radius = self.probe_radius if probe_radius is None else probe_radius
+        codes = self._hash(vector.reshape(1, -1) if isinstance(vector, np.ndarray) else vector)[0]
+
+        probes = codes[:, None]
+        if probe_radius >= 1:
+            flips = np.left_shift(1, np.arange(self.n_bits, dtype=np.int64))
+            probes = np.hstack([probes, codes[:, None] ^ flips[None, :]])
+
+        candidates = []
+        for table in range(self.n_tables):
+            table_codes = self.sorted_codes[table]
+            starts = np.searchsorted(table_codes, probes[table], side='left')
+            stops = np.searchsorted(table_codes, probes[table], side='right')
+            for start, stop in zip(starts, stops):
+                if stop > start:
+                    candidates.append(self.order[table, start:stop])
+
+        if not candidates:
+            return np.zeros(0, dtype=np.int64)
+        return np.unique(np.concatenate(candidates)).astype(np.int64)
+
+    def save(self, filepath):
+        np.savez(
+            filepath,
+            params=np.array([self.n_tables, self.n_bits, self.probe_radius, self.random_state]),
+            planes=self.planes,
+            sorted_codes=self.sorted_codes,
+            order=self.order,
+            ids=self.ids
+        )
+
+    @classmethod
+    def load(cls, filepath):
+        with np.load(filepath) as data:
+            n_tables, n_bits, probe_radius, random_state = data['params'].tolist()
+            instance = cls(n_tables, n_bits, probe_radius, random_state)
+            instance.planes = data['planes']
+            instance.sorted_codes = data['sorted_codes']
+            instance.order = data['order']
+            instance.ids = data['ids']
+        return instance
+
+
+def evaluate_recall(cf_model, k=20, sample_size=200, probe_radius=None, random_state=0):
+    """
+    Compare the ANN neighbors of a CF model against the exact search
+
+    Args:
+        cf_model: ImprovedCollaborativeFiltering with an `ann_index`
+        k: Number of neighbors compared
+        sample_size: Number of users sampled as queries
+        probe_radius: Overrides the index probe radius
+        random_state: Seed of the user sample
+
+    Returns:
+        Dict with recall@k, mean candidates per query and mean latencies (ms)
+    """
+    rng = np.random.default_rng(random_state)
+    n_users = len(cf_model.ann_index)
+    sample = rng.choice(n_users, size=min(sample_size, n_users), replace=False)
+
+    snapshot = cf_model._snapshot
+    recalls, candidates, exact_ms, approx_ms = [], [], [], []
+    for user_idx in sample:
+        start = time.perf_counter()
+        exact, _ = cf_model._exact_neighbor_indices(snapshot, user_idx, k)
+        exact_ms.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        approx, _, n_candidates = cf_model._approximate_neighbor_indices(
+            snapshot, user_idx, k, probe_radius=probe_radius
+        )
+        approx_ms.append((time.perf_counter() - start) * 1000)
+
+        candidates.append(n_candidates)
+        if len(exact) > 0:
+            recalls.append(len(np.intersect1d(exact, approx)) / len(exact))
+
+    return {
+        'n_tables': cf_model.ann_index.n_tables,
+        'n_bits': cf_model.ann_index.n_bits,
+        'probe_radius': cf_model.ann_index.probe_radius if probe_radius is None else probe_radius,
+        'recall_at_k': float(np.mean(recalls)) if recalls else 0.0,
+        'mean_candidates': float(np.mean(candidates)),
+        'candidate_fraction': float(np.mean(candidates)) / n_users,
+        'exact_ms': float(np.mean(exact_ms)),
+        'approx_ms': float(np.mean(approx_ms)),
+    }
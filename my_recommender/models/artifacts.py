@@ -0,0 +1,292 @@
+"""
+Memory-mapped on-disk format of the recommendation models
+
+A model set is a directory holding one .npy file per array and a small
+manifest.json with the parameters, the id maps' locations and the object
+graph. Arrays, and the arrays behind sparse matrices and id indexes, are
+opened with mmap_mode='r': every worker process shares the same
+page-cache pages and loading does not copy them. DataFrames are rebuilt
+on load instead: their numeric columns are copied out of the mapped files
+and their text columns parsed from the manifest, so models keep only
+small tables (the movie catalog) as DataFrames and their large state as
+arrays.
+
+The object graph is built from each model's pickle state (__getstate__ /
+__setstate__), so a model only has to keep its state made of arrays,
+sparse matrices, DataFrames, id indexes, plain parameters and other models.
+"""
+import os
+import json
+import importlib
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfVectorizer
+
+from .indexing import IdIndex
+
+FORMAT_NAME = 'my_recommender-arrays'
+FORMAT_VERSION = 1
+MANIFEST_NAME = 'manifest.json'
+
+# Only these classes can be instantiated from a manifest
+MODEL_CLASSES = (
+    'my_recommender.models.hybrid.HybridRecommender',
+    'my_recommender.models.popularity.PopularityModel',
+    'my_recommender.models.trending.TrendingModel',
+    'my_recommender.models.segments.SegmentPopularity',
+    'my_recommender.models.indexing.UserRatingsIndex',
+    'my_recommender.models.content.ImprovedContentBased',
+    'my_recommender.models.collaborative.ImprovedCollaborativeFiltering',
+    'my_recommender.models.collaborative.ItemBasedCollaborativeFiltering',
+    'my_recommender.models.matrix_factorization.MatrixFactorizationCF',
+)
+
+
+def _class_path(cls):
+    return f"{cls.__module__}.{cls.__qualname__}"
+
+
+def _load_class(path):
+    if path not in MODEL_CLASSES:
+        raise ValueError(f"Class '{path}' is not a known model class")
+    module_name, class_name = path.rsplit('.', 1)
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def _is_json_value(value):
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return True
+    if isinstance(value, (list, tuple)):
+        return all(_is_json_value(item) for item in value)
+    if isinstance(value, dict):
+        return all(isinstance(key, str) and _is_json_value(item) for key, item in value.items())
+    return False
+
+
+class _Writer:
+    def __init__(self, directory):
+        self.directory = directory
+        self._written = {}
+
+    def _save_array(self, name, array):
+        np.save(os.path.join(self.directory, name + '.npy'), np.ascontiguousarray(array))
+        return name + '.npy'
+
+    def encode(self, value, name):
+        """Write a value under the file prefix `name`, returns its manifest entry"""
+        if id(value) in self._written:
+            # Objects shared by several models (e.g. the ratings DataFrame) are written once
+            return {'kind': 'ref', 'name': self._written[id(value)]}
+        entry = self._encode(value, name)
+        if entry['kind'] not in ('json', 'none'):
+            self._written[id(value)] = name
+            entry['name'] = name
+        return entry
+
+    def _encode(self, value, name):
+        if value is None:
+            return {'kind': 'none'}
+        if isinstance(value, np.generic):
+            return {'kind': 'json', 'value': value.item()}
+        if _is_json_value(value):
+            return {'kind': 'json', 'value': value}
+        if isinstance(value, np.ndarray):
+            return {'kind': 'array', 'file': self._save_array(name, value)}
+        if isinstance(value, csr_matrix):
+            return {
+                'kind': 'csr',
+                'shape': list(value.shape),
+                'data': self._save_array(name + '.data', value.data),
+                'indices': self._save_array(name + '.indices', value.indices),
+                'indptr': self._save_array(name + '.indptr', value.indptr),
+            }
+        if isinstance(value, IdIndex):
+            return {'kind': 'id_index', 'file': self._save_array(name, value.values)}
+        if isinstance(value, pd.DataFrame):
+            return self._encode_dataframe(value, name)
+        if isinstance(value, TfidfVectorizer):
+            params = value.get_params()
+            params.pop('dtype')
+            params.pop('vocabulary')
+            return {
+                'kind': 'tfidf_vectorizer',
+                'params': params,
+                'vocabulary': {term: int(column) for term, column in value.vocabulary_.items()},
+                'idf': self._save_array(name + '.idf', value.idf_),
+            }
+        if isinstance(value, HashingVectorizer):
+            # Stateless: the parameters are enough
+            params = value.get_params()
+            params.pop('dtype')
+            return {'kind': 'hashing_vectorizer', 'params': params}
+        if isinstance(value, dict):
+            return {
+                'kind': 'dict',
+                'items': {str(key): self.encode(item, f"{name}.{key}") for key, item in value.items()},
+            }
+        if _class_path(type(value)) in MODEL_CLASSES:
+            state = value.__getstate__() if hasattr(value, '__getstate__') else value.__dict__
+            return {
+                'kind': 'model',
+                'class': _class_path(type(value)),
+                'state': {key: self.encode(item, f"{name}.{key}") for key, item in state.items()},
+            }
+        raise TypeError(f"Cannot store '{name}' of type {type(value).__name__} as arrays")
+
+    def _encode_dataframe(self, df, name):
+        columns = []
+        if not isinstance(df.index, pd.RangeIndex):
+            df = df.reset_index()
+            index_name = df.columns[0]
+        else:
+            index_name = None
+
+        for position, column in enumerate(df.columns):
+            values = df[column]
+            column_entry = {'name': column}
+            if pd.api.types.is_numeric_dtype(values) or pd.api.types.is_bool_dtype(values):
+                column_entry['file'] = self._save_array(f"{name}.col{position}", values.to_numpy())
+            else:
+                # Text and list columns are small: plain JSON, not memory-mapped
+                column_entry['values'] = [
+                    None if not isinstance(item, (list, str)) and pd.isna(item) else item
+                    for item in values.tolist()
+                ]
+            columns.append(column_entry)
+        return {'kind': 'dataframe', 'columns': columns, 'index': index_name}
+
+
+class _Reader:
+    def __init__(self, directory, mmap):
+        self.directory = directory
+        self.mmap_mode = 'r' if mmap else None
+        self._loaded = {}
+
+    def _load_array(self, filename):
+        return np.load(os.path.join(self.directory, filename), mmap_mode=self.mmap_mode)
+
+    def decode(self, entry):
+        kind = entry['kind']
+        if kind == 'ref':
+            return self._loaded[entry['name']]
+        value = self._decode(entry)
+        if 'name' in entry:
+            self._loaded[entry['name']] = value
+        return value
+
+    def _decode(self, entry):
+        kind = entry['kind']
+        if kind == 'none':
+            return None
+        if kind == 'json':
+            return entry['value']
+        if kind == 'array':
+            return self._load_array(entry['file'])
+        if kind == 'csr':
+            return csr_matrix(
+                (self._load_array(entry['data']), self._load_array(entry['indices']),
+                 self._load_array(entry['indptr'])),
+                shape=tuple(entry['shape']), copy=False
+            )
+        if kind == 'id_index':
+            return IdIndex(self._load_array(entry['file']))
+        if kind == 'dataframe':
+            df = pd.DataFrame({
+                column['name']: (self._load_array(column['file']) if 'file' in column else column['values'])
+                for column in entry['columns']
+            })
+            return df.set_index(entry['index']) if entry['index'] is not None else df
+        if kind == 'tfidf_vectorizer':
+            params = dict(entry['params'])
+            params['ngram_range'] = tuple(params['ngram_range'])
+            vectorizer = TfidfVectorizer(**params, vocabulary=entry['vocabulary'])
+            vectorizer.idf_ = np.asarray(self._load_array(entry['idf']))
+            return vectorizer
+        if kind == 'hashing_vectorizer':
+            params = dict(entry['params'])
+            params['ngram_range'] = tuple(params['ngram_range'])
+            return HashingVectorizer(**params)
+        if kind == 'dict':
+            items = {key: self.decode(item) for key, item in entry['items'].items()}
+            # JSON keys are strings: restore integer keys
+            return {int(key) if key.lstrip('-').isdigit() else key: item for key, item in items.items()}
+        if kind == 'model':
+            cls = _load_class(entry['class'])
+            instance = cls.__new__(cls)
+            state = {key: self.decode(item) for key, item in entry['state'].items()}
+            if hasattr(instance, '__setstate__'):
+                instance.__setstate__(state)
+            else:
+                instance.__dict__.update(state)
+            return instance
+        raise ValueError(f"Unknown artifact entry kind '{kind}'")
+
+
+def save_artifacts(model, directory, version=None):
+    """
+    Write a model (usually a HybridRecommender) as memory-mappable arrays
+
+    Args:
+        model: Model object
+        directory: Target directory, created if needed (must not hold another model set)
+        version: Version recorded in the manifest
+
+    Returns:
+        The manifest dict
+    """
+    os.makedirs(directory, exist_ok=True)
+    if os.path.exists(os.path.join(directory, MANIFEST_NAME)):
+        raise FileExistsError(f"{directory} already holds a model set")
+
+    root = _Writer(directory).encode(model, 'root')
+    manifest = {
+        'format': FORMAT_NAME,
+        'format_version': FORMAT_VERSION,
+        'version': version,
+        'created_at': datetime.utcnow().isoformat(),
+        'root': root,
+    }
+    # Written last: a directory without manifest is an incomplete model set
+    tmp_path = os.path.join(directory, MANIFEST_NAME + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, os.path.join(directory, MANIFEST_NAME))
+    return manifest
+
+
+def load_artifacts(directory, mmap=True):
+    """
+    Load a model set written by `save_artifacts`
+
+    Args:
+        directory: Model set directory
+        mmap: Open the arrays read-only with mmap_mode='r' (no copy);
+            the online updates copy an array before writing it (the
+            trending counters on their first write), so the mapped files
+            are never written
+
+    Returns:
+        The root model object
+    """
+    with open(os.path.join(directory, MANIFEST_NAME)) as f:
+        manifest = json.load(f)
+    if manifest.get('format') != FORMAT_NAME or manifest.get('format_version', 0) > FORMAT_VERSION:
+        raise ValueError(f"Unsupported model format in {directory}")
+    return _Reader(directory, mmap).decode(manifest['root'])
+
+
+def current_artifacts_dir(models_dir, pointer_name='CURRENT'):
+    """
+    Directory of the published model set, read from the pointer file
+    written by scripts/train_models.py, or None
+    """
+    pointer = os.path.join(models_dir, pointer_name)
+    if not os.path.exists(pointer):
+        return None
+    with open(pointer) as f:
+        version = f.read().strip()
+    directory = os.path.join(models_dir, version, 'arrays')
+    return directory if os.path.exists(os.path.join(directory, MANIFEST_NAME)) else None
@@ -2,10 +2,225 @@
 Improved User-Based Collaborative Filtering
 With better handling of sparse data and edge cases
 """
+import threading
+from collections import OrderedDict
+
 import numpy as np
 import pandas as pd
 from sklearn.metrics.pairwise import cosine_similarity
-from scipy.sparse import csr_matrix
+from scipy.sparse import csr_matrix, coo_matrix
+
+from .indexing import IdIndex, IdValueMap
+
+
+def build_rating_matrix(ratings_df, user_col='user_id', item_col='movie_id'):
+    """
+    Build a sparse utility matrix from a ratings DataFrame
+
+    Duplicate (user, item) pairs are averaged, like `pivot_table` does.
+
+    Args:
+        ratings_df: DataFrame with user, item and rating columns
+        user_col: Column holding the row ids
+        item_col: Column holding the column ids
+
+    Returns:
+        Tuple of (CSR matrix, row IdIndex, column IdIndex)
+    """
+    row_ids, rows = np.unique(ratings_df[user_col].to_numpy(), return_inverse=True)
+    col_ids, cols = np.unique(ratings_df[item_col].to_numpy(), return_inverse=True)
+    values = ratings_df['rating'].to_numpy(dtype=np.float64)
+    shape = (len(row_ids), len(col_ids))
+
+    totals = coo_matrix((values, (rows, cols)), shape=shape).tocsr()
+    counts = coo_matrix((np.ones_like(values), (rows, cols)), shape=shape).tocsr()
+    totals.sum_duplicates()
+    counts.sum_duplicates()
+    if counts.data.max(initial=1) > 1:
+        totals.data /= counts.data
+    totals.eliminate_zeros()
+    totals.sort_indices()
+    return totals, IdIndex(row_ids), IdIndex(col_ids)
+
+
+def row_means(matrix, default=3.0):
+    """
+    Mean of the stored (rated) entries of every row of a CSR matrix
+
+    Args:
+        matrix: CSR matrix
+        default: Value used for rows without any entry
+
+    Returns:
+        Array of row means
+    """
+    counts = np.diff(matrix.indptr)
+    sums = np.asarray(matrix.sum(axis=1)).ravel()
+    means = np.full(matrix.shape[0], default, dtype=np.float64)
+    np.divide(sums, counts, out=means, where=counts > 0)
+    return means
+
+
+def replace_row(matrix, row, columns, values, n_rows=None):
+    """
+    Copy-on-write replacement of one row of a CSR matrix
+
+    The input matrix is never modified. When the row keeps the same
+    columns only the values are copied (the new matrix shares `indices`
+    and `indptr`); otherwise new arrays are assembled around the row (a
+    memcpy of the stored entries, no re-sorting). Rows past the end are
+    appended.
+
+    Args:
+        matrix: CSR matrix with sorted indices
+        row: Row index to replace (may be == number of rows to append)
+        columns: Sorted column indices of the new row
+        values: Values aligned with columns
+        n_rows: Number of rows of the result (defaults to the current one)
+
+    Returns:
+        New CSR matrix with the row replaced
+    """
+    n_rows = n_rows or matrix.shape[0]
+    if row < matrix.shape[0] and n_rows == matrix.shape[0]:
+        start, end = matrix.indptr[row:row + 2]
+        if np.array_equal(matrix.indices[start:end], columns):
+            data = matrix.data.copy()
+            data[start:end] = values
+            return csr_matrix((data, matrix.indices, matrix.indptr), shape=matrix.shape, copy=False)
+    else:
+        start = end = matrix.indptr[-1]
+
+    indptr = np.zeros(n_rows + 1, dtype=matrix.indptr.dtype)
+    indptr[:matrix.shape[0] + 1] = matrix.indptr
+    indptr[matrix.shape[0] + 1:] = matrix.indptr[-1]
+    indptr[row + 1:] += len(columns) - (end - start)
+    indices = np.concatenate([matrix.indices[:start], columns, matrix.indices[end:]])
+    data = np.concatenate([matrix.data[:start], values, matrix.data[end:]])
+    return csr_matrix(
+        (data.astype(matrix.dtype, copy=False), indices.astype(matrix.indices.dtype, copy=False), indptr),
+        shape=(n_rows, matrix.shape[1])
+    )
+
+
+def _similarity_operands(ratings):
+    """Ratings, rated indicator and squared ratings used by `pearson_similarity`"""
+    ratings = csr_matrix(ratings, dtype=np.float64)
+    rated = ratings.copy()
+    rated.data = np.ones_like(rated.data)
+    squared = ratings.multiply(ratings).tocsr()
+    return ratings, rated, squared
+
+
+def _pearson_block(block, block_rated, block_squared, ratings, rated, squared,
+                   min_common_items, similarity_threshold):
+    """Pearson similarities of a block of rows with every row of `ratings`"""
+    counts = (block_rated @ rated.T).toarray()
+    sum_u = (block @ rated.T).toarray()
+    sum_v = (block_rated @ ratings.T).toarray()
+    scratch = np.multiply(sum_u, sum_v)
+
+    # n*Suv - Su*Sv
+    numerator = (block @ ratings.T).toarray()
+    numerator *= counts
+    numerator -= scratch
+    # (n*Suu - Su^2) * (n*Svv - Sv^2)
+    denominator = (block_squared @ rated.T).toarray()
+    denominator *= counts
+    denominator -= np.square(sum_u, out=scratch)
+    variance_v = (block_rated @ squared.T).toarray()
+    variance_v *= counts
+    variance_v -= np.square(sum_v, out=scratch)
+    denominator *= variance_v
+    del sum_u, sum_v, variance_v
+
+    # sign(num) * sqrt(num^2 / den): with star ratings num^2 and den are exact
+    # integers, so mathematically equal correlations get bit-identical scores
+    valid = (counts >= min_common_items) & (denominator > 0)
+    similarity = np.square(numerator, out=scratch)
+    np.divide(similarity, denominator, out=similarity, where=valid)
+    similarity[~valid] = 0.0
+    np.sqrt(similarity, out=similarity)
+    np.copysign(similarity, numerator, out=similarity)
+    similarity[np.abs(similarity) < similarity_threshold] = 0.0
+    return similarity
+
+
+def pearson_similarity(ratings, rows=None, min_common_items=2, similarity_threshold=0.0,
+                       operands=None, query=None, block_size=256):
+    """
+    Compute Pearson correlations over co-rated items with sparse products
+
+    For every pair (u, v) the correlation only uses the items both users
+    rated, exactly like `ImprovedCollaborativeFiltering.calculate_similarity`.
+    The co-rated sums are obtained with sparse matrix products and the
+    correlation is expressed as
+        (n*Suv - Su*Sv) / sqrt((n*Suu - Su^2) * (n*Svv - Sv^2))
+    which keeps the zero-variance cases exact for star ratings. Rows are
+    processed in blocks, so the dense temporaries stay block_size x users.
+
+    Args:
+        ratings: CSR matrix (users x items), 0 meaning "not rated"
+        rows: Optional row indices to compute (defaults to every row)
+        min_common_items: Minimum number of common items for similarity
+        similarity_threshold: Minimum absolute similarity to keep
+        operands: Optional cached result of `_similarity_operands(ratings)`
+        query: Optional CSR matrix (n x items) of rating vectors that are not
+            rows of `ratings` (e.g. users folded in at request time)
+        block_size: Number of rows computed at once
+
+    Returns:
+        Dense array (len(rows) or n x users) of similarities
+    """
+    ratings, rated, squared = operands or _similarity_operands(ratings)
+
+    if query is not None:
+        block, block_rated, block_squared = _similarity_operands(query)
+    elif rows is None:
+        block, block_rated, block_squared = ratings, rated, squared
+    else:
+        block, block_rated, block_squared = ratings[rows], rated[rows], squared[rows]
+
+    n_rows = block.shape[0]
+    if n_rows <= block_size:
+        return _pearson_block(block, block_rated, block_squared, ratings, rated, squared,
+                              min_common_items, similarity_threshold)
+    similarity = np.empty((n_rows, ratings.shape[0]))
+    for start in range(0, n_rows, block_size):
+        stop = min(start + block_size, n_rows)
+        similarity[start:stop] = _pearson_block(
+            block[start:stop], block_rated[start:stop], block_squared[start:stop],
+            ratings, rated, squared, min_common_items, similarity_threshold
+        )
+    return similarity
+
+
+class _RatingsSnapshot:
+    """
+    Ratings-derived state of a CF model, published as a whole
+
+    `update_user_ratings` builds a new snapshot and swaps it in with one
+    assignment. A request reads `_snapshot` once, so the user ids, rating
+    rows, means and similarities it works with always belong together.
+    """
+
+    def __init__(self, user_ids, rating_matrix, mean_values, **fields):
+        self.user_ids = user_ids
+        self.rating_matrix = rating_matrix
+        self.mean_values = mean_values
+        # Derived data, built lazily for the snapshot they belong to
+        self.operands = None
+        self.similarity_matrix = None
+        self.similarity_buffer = None
+        self.similarity_rows = OrderedDict()
+        self.__dict__.update(fields)
+
+    def replace(self, **changes):
+        """Shallow copy with some fields replaced"""
+        snapshot = _RatingsSnapshot.__new__(_RatingsSnapshot)
+        snapshot.__dict__.update(self.__dict__)
+        snapshot.__dict__.update(changes)
+        return snapshot
 
 
 class ImprovedCollaborativeFiltering:
@@ -16,8 +231,12 @@ class ImprovedCollaborativeFiltering:
     - Configurable neighborhood size
     - Confidence weighting based on common ratings
     """
+
+    # Snapshot fields kept in the pickle state, as plain attributes
+    _snapshot_fields = ('user_ids', 'rating_matrix', 'mean_values')
     
-    def __init__(self, ratings_df, min_common_items=2, similarity_threshold=0.0):
+    def __init__(self, ratings_df, min_common_items=2, similarity_threshold=0.0,
+                 dense_similarity_limit=5000, similarity_cache_size=1024):
         """
         Initialize the collaborative filtering model
         
@@ -25,28 +244,446 @@ class ImprovedCollaborativeFiltering:
             ratings_df: DataFrame with user_id, movie_id, rating columns
             min_common_items: Minimum number of common items for similarity
             similarity_threshold: Minimum similarity score to consider
+            dense_similarity_limit: Above this many users, similarity rows are
+                computed on demand instead of materializing users x users
+            similarity_cache_size: Number of on-demand similarity rows kept
         """
-        self.ratings_df = ratings_df
         self.min_common_items = min_common_items
         self.similarity_threshold = similarity_threshold
+        self.dense_similarity_limit = dense_similarity_limit
+        self.similarity_cache_size = similarity_cache_size
         
-        # Create utility matrix
-        self.utility_matrix = ratings_df.pivot_table(
-            index='user_id', 
-            columns='movie_id', 
-            values='rating'
-        ).fillna(0)
-        
-        self.user_ids = self.utility_matrix.index.tolist()
-        self.movie_ids = self.utility_matrix.columns.tolist()
-        self.matrix_values = self.utility_matrix.values
-        
+        # Sparse utility matrix (users x movies), 0 meaning "not rated"
+        rating_matrix, user_ids, self.movie_ids = build_rating_matrix(ratings_df)
+
+        # Optional approximate neighbor index (see build_ann_index)
+        self.ann_index = None
+
+        self._reset_similarity_cache()
         # Pre-compute user means for normalization
-        self.user_means = {}
-        for user_id in self.user_ids:
-            user_ratings = self.matrix_values[self.user_ids.index(user_id)]
-            rated_items = user_ratings[user_ratings > 0]
-            self.user_means[user_id] = np.mean(rated_items) if len(rated_items) > 0 else 3.0
+        self._snapshot = _RatingsSnapshot(user_ids, rating_matrix, row_means(rating_matrix))
+
+    @property
+    def user_ids(self):
+        """IdIndex of the users (rows of `rating_matrix`)"""
+        return self._snapshot.user_ids
+
+    @property
+    def rating_matrix(self):
+        """Sparse utility matrix (users x movies), 0 meaning "not rated" """
+        return self._snapshot.rating_matrix
+
+    @property
+    def mean_values(self):
+        """Mean rating of every user, aligned with `user_ids`"""
+        return self._snapshot.mean_values
+
+    @property
+    def similarity_matrix(self):
+        """Dense user-user similarities, None until computed"""
+        return self._snapshot.similarity_matrix
+
+    @property
+    def user_means(self):
+        """Mapping user_id -> mean rating"""
+        snapshot = self._snapshot
+        return IdValueMap(snapshot.user_ids, snapshot.mean_values)
+
+    def _reset_similarity_cache(self):
+        # The dense similarities are too large to copy on every rating: the
+        # online updater writes them, and readers copy rows, under this lock
+        self._similarity_lock = threading.Lock()
+        # Held for a whole dense build, so that concurrent requests share one
+        self._build_lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for key in ('_similarity_lock', '_build_lock'):
+            state.pop(key, None)
+        # Similarities are derived data: keep the pickle proportional to the ratings
+        snapshot = state.pop('_snapshot')
+        for field in self._snapshot_fields:
+            state[field] = getattr(snapshot, field)
+        # The ANN index is persisted on its own, next to the model pickle
+        state['ann_index'] = None
+        return state
+
+    def __setstate__(self, state):
+        if 'utility_matrix' in state:
+            # Pickles from the dense pivot_table version: rebuild from the ratings
+            self.__init__(
+                state['ratings_df'],
+                state.get('min_common_items', 2),
+                state.get('similarity_threshold', 0.0)
+            )
+            return
+        state = dict(state)
+        fields = {field: state.pop(field) for field in self._snapshot_fields}
+        self.__dict__.update(state)
+        self.__dict__.setdefault('ann_index', None)
+        self._reset_similarity_cache()
+        self._snapshot = _RatingsSnapshot(**fields)
+
+    def build_ann_index(self, n_tables=8, n_bits=12, probe_radius=1, random_state=42):
+        """
+        Build an LSH index over the mean-centered user vectors
+
+        Once built, neighbor searches of models too large for the dense
+        similarity matrix only compute exact Pearson scores for the
+        candidates returned by the index.
+
+        Args:
+            n_tables: Number of hash tables
+            n_bits: Number of random hyperplanes per table
+            probe_radius: 0 or 1, Hamming radius of the probed buckets
+            random_state: Seed of the random hyperplanes
+
+        Returns:
+            The RandomProjectionLSH index
+        """
+        from .ann import RandomProjectionLSH
+
+        snapshot = self._snapshot
+        self.ann_index = RandomProjectionLSH(
+            n_tables, n_bits, probe_radius, random_state
+        ).fit(self._centered_ratings(snapshot), ids=snapshot.user_ids.values)
+        return self.ann_index
+
+    def attach_ann_index(self, index):
+        """
+        Use a persisted ANN index if it was built for this model's users
+
+        Returns:
+            True if the index was attached
+        """
+        n_indexed = len(index)
+        user_ids = self.user_ids
+        if n_indexed > len(user_ids) or not np.array_equal(
+            index.ids, user_ids.values[:n_indexed]
+        ):
+            print("Warning: ANN index does not match the CF model users, ignoring it.")
+            return False
+        self.ann_index = index
+        return True
+
+    def _use_ann(self, snapshot):
+        return (
+            self.ann_index is not None
+            and snapshot.similarity_matrix is None
+            and len(snapshot.user_ids) > self.dense_similarity_limit
+        )
+
+    @staticmethod
+    def _centered_ratings(snapshot):
+        """Ratings centered by user mean, on the rated entries only"""
+        centered = snapshot.rating_matrix.copy()
+        centered.data = centered.data - np.repeat(
+            snapshot.mean_values, np.diff(centered.indptr)
+        )
+        return centered
+
+    def _candidate_similarities(self, snapshot, query, candidates):
+        """Exact Pearson similarities of a query row against candidate users only"""
+        similarities = np.zeros(len(snapshot.user_ids))
+        if len(candidates) > 0:
+            operands = tuple(operand[candidates] for operand in self._get_operands(snapshot))
+            similarities[candidates] = pearson_similarity(
+                operands[0],
+                min_common_items=self.min_common_items,
+                similarity_threshold=self.similarity_threshold,
+                operands=operands,
+                query=query
+            )[0]
+        return similarities
+
+    def prepare(self):
+        """
+        Build what the request path would otherwise build on first use:
+        the dense similarity matrix, for models small enough to hold it
+        """
+        if len(self.user_ids) <= self.dense_similarity_limit:
+            self.compute_similarity_matrix()
+
+    def compute_similarity_matrix(self):
+        """
+        Compute the user-user Pearson matrix in one pass
+
+        The matrix is built once: concurrent callers wait for the build in
+        progress. A build overtaken by an online update (a new snapshot was
+        published meanwhile) is discarded and restarted on the new one.
+
+        Returns:
+            Dense array (users x users) of thresholded similarities
+        """
+        with self._build_lock:
+            while True:
+                snapshot = self._snapshot
+                if snapshot.similarity_matrix is not None:
+                    return snapshot.similarity_matrix
+                operands = self._get_operands(snapshot)
+                matrix = pearson_similarity(
+                    operands[0],
+                    min_common_items=self.min_common_items,
+                    similarity_threshold=self.similarity_threshold,
+                    operands=operands
+                )
+                with self._similarity_lock:
+                    if self._snapshot is snapshot:
+                        snapshot.similarity_buffer = matrix
+                        snapshot.similarity_matrix = matrix
+
+    @staticmethod
+    def _get_operands(snapshot):
+        # Racing callers compute equal operands from the same snapshot
+        if snapshot.operands is None:
+            snapshot.operands = _similarity_operands(snapshot.rating_matrix)
+        return snapshot.operands
+
+    def _similarity_row(self, snapshot, user_idx):
+        """
+        Similarities of one user with every user (a copy the caller owns)
+
+        Small models materialize the full matrix once; large ones compute
+        the requested row with sparse products and keep it in an LRU cache.
+        """
+        if snapshot.similarity_matrix is None and len(snapshot.user_ids) <= self.dense_similarity_limit:
+            self.compute_similarity_matrix()
+        with self._similarity_lock:
+            if snapshot.similarity_matrix is not None:
+                return snapshot.similarity_matrix[user_idx].copy()
+            row = snapshot.similarity_rows.get(user_idx)
+            if row is not None:
+                snapshot.similarity_rows.move_to_end(user_idx)
+                return row.copy()
+
+        row = self._user_similarity(snapshot, user_idx)
+        with self._similarity_lock:
+            # Cached in its own snapshot: an update copies the cache of the current one
+            snapshot.similarity_rows[user_idx] = row
+            if len(snapshot.similarity_rows) > self.similarity_cache_size:
+                snapshot.similarity_rows.popitem(last=False)
+        return row.copy()
+
+    def _user_similarity(self, snapshot, user_idx):
+        """Similarities of one user with every user, computed from the ratings"""
+        operands = self._get_operands(snapshot)
+        return pearson_similarity(
+            operands[0], rows=[user_idx],
+            min_common_items=self.min_common_items,
+            similarity_threshold=self.similarity_threshold,
+            operands=operands
+        )[0]
+
+    def get_rating(self, user_id, movie_id):
+        """Current rating of a user for a movie (0.0 if not rated or unknown)"""
+        snapshot = self._snapshot
+        user_idx = snapshot.user_ids.get(user_id)
+        movie_idx = self.movie_ids.get(movie_id)
+        if user_idx is None or movie_idx is None:
+            return 0.0
+        return float(snapshot.rating_matrix[user_idx, movie_idx])
+
+    def update_user_ratings(self, user_id, movie_ids, ratings):
+        """
+        Apply new or changed ratings of one user without retraining
+
+        The user ids, rating matrix, means and similarity cache are copied,
+        updated and published together as a new snapshot, so concurrent
+        readers keep the snapshot they started with. The dense similarities,
+        too large to copy, are updated in place under the similarity lock
+        (one sparse row computation). New users are appended as a new row.
+        Updates are serialized by the caller (the online updater).
+
+        Args:
+            user_id: User ID
+            movie_ids: Movie IDs rated by the user
+            ratings: Ratings aligned with movie_ids
+
+        Returns:
+            True if the model changed (movies unknown to the model are ignored)
+        """
+        columns, values = self._fold_in_vector(movie_ids, ratings)
+        if len(columns) == 0:
+            return False
+
+        current = self._snapshot
+        user_ids = current.user_ids
+        user_idx = user_ids.get(user_id)
+        is_new_user = user_idx is None
+        if is_new_user:
+            user_idx = len(user_ids)
+            user_ids = user_ids.appended(user_id)
+            row_columns, row_values = columns, values
+        else:
+            start, end = current.rating_matrix.indptr[user_idx:user_idx + 2]
+            row = dict(zip(
+                current.rating_matrix.indices[start:end].tolist(),
+                current.rating_matrix.data[start:end].tolist()
+            ))
+            row.update(zip(columns.tolist(), values.tolist()))
+            row_columns = np.array(sorted(row), dtype=np.int64)
+            row_values = np.array([row[col] for col in row_columns.tolist()])
+
+        n_users = len(user_ids)
+        rating_matrix = replace_row(current.rating_matrix, user_idx, row_columns, row_values, n_users)
+        if is_new_user:
+            mean_values = np.append(current.mean_values, 3.0)
+        else:
+            mean_values = current.mean_values.copy()
+        mean_values[user_idx] = np.mean(row_values)
+
+        operands = current.operands
+        if operands is not None:
+            _, rated_op, squared_op = operands
+            operands = (
+                rating_matrix,
+                replace_row(rated_op, user_idx, row_columns, np.ones_like(row_values), n_users),
+                replace_row(squared_op, user_idx, row_columns, row_values ** 2, n_users),
+            )
+        snapshot = current.replace(
+            user_ids=user_ids, rating_matrix=rating_matrix, mean_values=mean_values,
+            operands=operands, similarity_matrix=None, similarity_buffer=None,
+            similarity_rows=OrderedDict()
+        )
+        self._on_user_row_updated(snapshot, user_idx, row_columns, row_values, is_new_user)
+
+        row = None
+        if current.similarity_matrix is not None or current.similarity_rows:
+            row = self._user_similarity(snapshot, user_idx)
+        with self._similarity_lock:
+            if current.similarity_matrix is not None or current.similarity_rows:
+                if row is None:
+                    # The similarities were built meanwhile
+                    row = self._user_similarity(snapshot, user_idx)
+                self._store_user_similarity(current, snapshot, user_idx, row, is_new_user)
+            self._snapshot = snapshot
+        return True
+
+    def _on_user_row_updated(self, snapshot, user_idx, columns, values, is_new_user):
+        """Hook for subclasses keeping per-user state in the (unpublished) snapshot"""
+
+    def _store_user_similarity(self, current, snapshot, user_idx, row, is_new_user):
+        """
+        Carry the similarities of `current` over to `snapshot` with one user's
+        row replaced; the caller holds the similarity lock
+        """
+        n_users = len(snapshot.user_ids)
+        if current.similarity_matrix is not None:
+            buffer = current.similarity_buffer
+            if buffer.shape[0] < n_users:
+                # Grow geometrically so appending users stays amortized O(users)
+                capacity = max(n_users, int(buffer.shape[0] * 1.25) + 1)
+                grown = np.zeros((capacity, capacity))
+                old_size = current.similarity_matrix.shape[0]
+                grown[:old_size, :old_size] = buffer[:old_size, :old_size]
+                buffer = grown
+            # Written in place: readers of older snapshots copy rows under the lock
+            buffer[user_idx, :n_users] = row
+            buffer[:n_users, user_idx] = row
+            snapshot.similarity_buffer = buffer
+            snapshot.similarity_matrix = buffer[:n_users, :n_users]
+
+        if not is_new_user:
+            # Cached rows do not have a column for a new user: those start empty
+            rows = OrderedDict(current.similarity_rows)
+            rows.pop(user_idx, None)
+            for other_idx, other_row in rows.items():
+                other_row = other_row.copy()
+                other_row[user_idx] = row[other_idx]
+                rows[other_idx] = other_row
+            snapshot.similarity_rows = rows
+
+    def _user_row(self, user_idx):
+        """Dense rating vector of a user, aligned with `movie_ids`"""
+        return self.rating_matrix[user_idx].toarray().ravel()
+
+    def _fold_in_vector(self, movie_ids, ratings):
+        """
+        Map a user's (movie_id, rating) pairs onto the model columns
+
+        Movies unknown to the model are dropped; for duplicated movies the
+        last rating wins.
+
+        Returns:
+            Tuple of (sorted column indices, ratings) arrays
+        """
+        columns = self.movie_ids.positions(movie_ids)
+        ratings = np.asarray(ratings, dtype=np.float64)
+        known = (columns >= 0) & (ratings > 0)
+        columns, ratings = columns[known][::-1], ratings[known][::-1]
+        columns, first = np.unique(columns, return_index=True)
+        return columns, ratings[first]
+
+    def _top_n(self, predictions, rated_columns, n, exclude_rated):
+        """Sort predictions into a list of (movie_id, predicted_rating) tuples"""
+        candidates = np.arange(len(self.movie_ids))
+        if exclude_rated:
+            # Skip movies the user already rated
+            candidates = np.setdiff1d(candidates, rated_columns, assume_unique=True)
+
+        # Sort by predicted rating (stable, so ties keep the movie order)
+        order = np.argsort(-predictions[candidates], kind='stable')[:n]
+        return [
+            (self.movie_ids[idx], predictions[idx])
+            for idx in candidates[order]
+        ]
+
+    def recommend_for_ratings(self, movie_ids, ratings, n=10, k=10, exclude_rated=True):
+        """
+        Generate top N recommendations for a user that is not in the model
+
+        The user's ratings are folded in as a transient vector at request
+        time, without retraining.
+
+        Args:
+            movie_ids: Movie IDs rated by the user
+            ratings: Ratings aligned with movie_ids
+            n: Number of recommendations
+            k: Number of neighbors to use
+            exclude_rated: Whether to exclude already rated movies
+
+        Returns:
+            List of (movie_id, predicted_rating) tuples
+        """
+        columns, values = self._fold_in_vector(movie_ids, ratings)
+        if len(columns) == 0:
+            return []
+        predictions = self.predict_for_ratings(columns, values, k)
+        return self._top_n(predictions, columns, n, exclude_rated)
+
+    def predict_for_ratings(self, columns, values, k=10):
+        """
+        Predict every movie for a transient rating vector
+
+        Args:
+            columns: Sorted model column indices rated by the user
+            values: Ratings aligned with columns
+            k: Number of neighbors to use
+
+        Returns:
+            Array of predicted ratings aligned with `movie_ids`
+        """
+        snapshot = self._snapshot
+        query = csr_matrix(
+            (values, columns, [0, len(columns)]), shape=(1, len(self.movie_ids))
+        )
+        if self._use_ann(snapshot):
+            centered = query.copy()
+            centered.data = centered.data - np.mean(values)
+            similarities = self._candidate_similarities(
+                snapshot, query, self.ann_index.query(centered)
+            )
+        else:
+            similarities = pearson_similarity(
+                snapshot.rating_matrix,
+                min_common_items=self.min_common_items,
+                similarity_threshold=self.similarity_threshold,
+                operands=self._get_operands(snapshot),
+                query=query
+            )[0]
+        neighbor_indices, similarities = self._top_neighbors(similarities, k)
+        return self._predict_from_neighbors(snapshot, np.mean(values), columns, values,
+                                            neighbor_indices, similarities)
     
     def calculate_similarity(self, user_vec1, user_vec2):
         """
@@ -97,26 +734,72 @@ class ImprovedCollaborativeFiltering:
         Returns:
             List of (neighbor_id, similarity) tuples
         """
-        if user_id not in self.user_ids:
+        snapshot = self._snapshot
+        user_idx = snapshot.user_ids.get(user_id)
+        if user_idx is None:
             return []
-        
-        user_idx = self.user_ids.index(user_id)
-        user_vec = self.matrix_values[user_idx]
-        
-        similarities = []
-        for idx, neighbor_id in enumerate(self.user_ids):
-            if neighbor_id == user_id:
-                continue
-            
-            neighbor_vec = self.matrix_values[idx]
-            sim = self.calculate_similarity(user_vec, neighbor_vec)
-            
-            if sim > 0:
-                similarities.append((neighbor_id, sim))
-        
-        # Sort by similarity and return top k
-        similarities.sort(key=lambda x: x[1], reverse=True)
-        return similarities[:k]
+
+        neighbor_indices, similarities = self._neighbor_indices(snapshot, user_idx, k)
+        return [
+            (snapshot.user_ids[idx], sim)
+            for idx, sim in zip(neighbor_indices, similarities)
+        ]
+
+    def _neighbor_indices(self, snapshot, user_idx, k):
+        """
+        Find the K most similar users of a matrix row
+
+        Args:
+            snapshot: Ratings snapshot the row belongs to
+            user_idx: Row of the target user
+            k: Number of neighbors
+
+        Returns:
+            Tuple of (neighbor row indices, similarities) arrays
+        """
+        if self._use_ann(snapshot):
+            neighbor_indices, similarities, _ = self._approximate_neighbor_indices(
+                snapshot, user_idx, k
+            )
+            return neighbor_indices, similarities
+        return self._exact_neighbor_indices(snapshot, user_idx, k)
+
+    def _approximate_neighbor_indices(self, snapshot, user_idx, k, probe_radius=None):
+        """
+        K most similar users among the ANN candidates of a matrix row
+
+        Returns:
+            Tuple of (neighbor row indices, similarities, number of candidates)
+        """
+        centered = self._centered_ratings_row(snapshot, user_idx)
+        candidates = self.ann_index.query(centered, probe_radius)
+        candidates = candidates[(candidates != user_idx) & (candidates < len(snapshot.user_ids))]
+        similarities = self._candidate_similarities(
+            snapshot, snapshot.rating_matrix[user_idx], candidates
+        )
+        neighbor_indices, similarities = self._top_neighbors(similarities, k)
+        return neighbor_indices, similarities, len(candidates)
+
+    @staticmethod
+    def _centered_ratings_row(snapshot, user_idx):
+        row = snapshot.rating_matrix[user_idx]
+        row.data = row.data - snapshot.mean_values[user_idx]
+        return row
+
+    def _exact_neighbor_indices(self, snapshot, user_idx, k):
+        """Exact K most similar users of a matrix row"""
+        similarities = self._similarity_row(snapshot, user_idx)
+        similarities[user_idx] = 0.0
+        return self._top_neighbors(similarities, k)
+
+    @staticmethod
+    def _top_neighbors(similarities, k):
+        """Rows of the K highest positive similarities, with their scores"""
+        # Stable sort keeps the user order for ties, like list.sort
+        candidates = np.flatnonzero(similarities > 0)
+        order = np.argsort(-similarities[candidates], kind='stable')[:k]
+        neighbor_indices = candidates[order]
+        return neighbor_indices, similarities[neighbor_indices]
     
     def predict_rating(self, user_id, movie_id, k=10):
         """
@@ -130,23 +813,30 @@ class ImprovedCollaborativeFiltering:
         Returns:
             Predicted rating (1-5 scale)
         """
-        if user_id not in self.user_ids or movie_id not in self.movie_ids:
-            return self.user_means.get(user_id, 3.0)
+        snapshot = self._snapshot
+        user_means = IdValueMap(snapshot.user_ids, snapshot.mean_values)
+        if user_id not in snapshot.user_ids or movie_id not in self.movie_ids:
+            return user_means.get(user_id, 3.0)
         
-        user_idx = self.user_ids.index(user_id)
+        user_idx = snapshot.user_ids.index(user_id)
         movie_idx = self.movie_ids.index(movie_id)
         
         # If user already rated this movie, return the rating
-        if self.matrix_values[user_idx, movie_idx] > 0:
-            return self.matrix_values[user_idx, movie_idx]
+        current_rating = snapshot.rating_matrix[user_idx, movie_idx]
+        if current_rating > 0:
+            return current_rating
         
         # Find neighbors
-        neighbors = self.find_k_neighbors(user_id, k)
+        neighbor_indices, similarities = self._neighbor_indices(snapshot, user_idx, k)
+        neighbors = [
+            (snapshot.user_ids[idx], sim)
+            for idx, sim in zip(neighbor_indices, similarities)
+        ]
         
         if not neighbors:
             # --- CORRECTION 1 ---
             # Utiliser .get() au lieu de [] pour éviter KeyError
-            return self.user_means.get(user_id, 3.0)
+            return user_means.get(user_id, 3.0)
         
         # Calculate weighted average
         weighted_sum = 0.0
@@ -154,16 +844,16 @@ class ImprovedCollaborativeFiltering:
         
         # --- CORRECTION 2 ---
         # Utiliser .get() au lieu de [] pour éviter KeyError
-        user_mean = self.user_means.get(user_id, 3.0)
+        user_mean = user_means.get(user_id, 3.0)
         
         for neighbor_id, similarity in neighbors:
-            neighbor_idx = self.user_ids.index(neighbor_id)
-            neighbor_rating = self.matrix_values[neighbor_idx, movie_idx]
+            neighbor_idx = snapshot.user_ids.index(neighbor_id)
+            neighbor_rating = snapshot.rating_matrix[neighbor_idx, movie_idx]
             
             if neighbor_rating > 0:
                 # --- CORRECTION 3 ---
                 # Utiliser .get() au lieu de [] pour éviter KeyError
-                neighbor_mean = self.user_means.get(neighbor_id, 3.0)
+                neighbor_mean = user_means.get(neighbor_id, 3.0)
                 weighted_sum += similarity * (neighbor_rating - neighbor_mean)
                 similarity_sum += abs(similarity)
         
@@ -175,6 +865,61 @@ class ImprovedCollaborativeFiltering:
         # Clip to valid range
         return np.clip(prediction, 1, 5)
     
+    def predict_all(self, user_id, k=10):
+        """
+        Predict ratings of a user for every movie in one pass
+
+        The K neighbors are searched once and all movies are scored with a
+        single weighted matrix-vector product, using the same mean-centered
+        formula as `predict_rating`.
+
+        Args:
+            user_id: User ID (must be in the model)
+            k: Number of neighbors to use
+
+        Returns:
+            Array of predicted ratings aligned with `movie_ids`
+        """
+        snapshot = self._snapshot
+        return self._predict_row(snapshot, snapshot.user_ids.index(user_id), k)
+
+    def _predict_row(self, snapshot, user_idx, k):
+        """Predicted ratings of one model row for every movie"""
+        start, end = snapshot.rating_matrix.indptr[user_idx:user_idx + 2]
+        neighbor_indices, similarities = self._neighbor_indices(snapshot, user_idx, k)
+        return self._predict_from_neighbors(
+            snapshot,
+            snapshot.mean_values[user_idx],
+            snapshot.rating_matrix.indices[start:end],
+            snapshot.rating_matrix.data[start:end],
+            neighbor_indices, similarities
+        )
+
+    def _predict_from_neighbors(self, snapshot, user_mean, rated_columns, ratings,
+                                neighbor_indices, similarities):
+        """Mean-centered weighted average of the neighbors' ratings, for every movie"""
+        predictions = np.full(len(self.movie_ids), user_mean, dtype=np.float64)
+
+        if len(neighbor_indices) > 0:
+            # Mean-centered neighbor ratings, only on their rated entries
+            deviations = snapshot.rating_matrix[neighbor_indices]
+            rated = deviations.copy()
+            rated.data = np.ones_like(rated.data)
+            deviations.data -= np.repeat(
+                snapshot.mean_values[neighbor_indices], np.diff(deviations.indptr)
+            )
+
+            weighted_sum = deviations.T @ similarities
+            similarity_sum = rated.T @ np.abs(similarities)
+            has_support = similarity_sum > 0
+            predictions[has_support] += weighted_sum[has_support] / similarity_sum[has_support]
+
+        predictions = np.clip(predictions, 1, 5)
+
+        # Already rated movies keep their actual rating
+        predictions[rated_columns] = ratings
+        return predictions
+
     def recommend(self, user_id, n=10, k=10, exclude_rated=True):
         """
         Generate top N recommendations for a user
@@ -188,25 +933,112 @@ class ImprovedCollaborativeFiltering:
         Returns:
             List of (movie_id, predicted_rating) tuples
         """
-        if user_id not in self.user_ids:
+        snapshot = self._snapshot
+        user_idx = snapshot.user_ids.get(user_id)
+        if user_idx is None:
             return []
         
-        user_idx = self.user_ids.index(user_id)
-        user_ratings = self.matrix_values[user_idx]
-        
-        predictions = []
-        for movie_idx, movie_id in enumerate(self.movie_ids):
-            # Skip if already rated and exclude_rated is True
-            if exclude_rated and user_ratings[movie_idx] > 0:
-                continue
-            
-            pred_rating = self.predict_rating(user_id, movie_id, k)
-            predictions.append((movie_id, pred_rating))
-        
-        # Sort by predicted rating
-        predictions.sort(key=lambda x: x[1], reverse=True)
-        return predictions[:n]
-    
+        start, end = snapshot.rating_matrix.indptr[user_idx:user_idx + 2]
+        predictions = self._predict_row(snapshot, user_idx, k)
+        return self._top_n(
+            predictions, snapshot.rating_matrix.indices[start:end], n, exclude_rated
+        )
+
+    def predict_many(self, user_rows, k=10):
+        """
+        Predict every movie for a block of users at once
+
+        The neighbor weights of the block form a sparse (block x users)
+        matrix, so the whole block is scored with two sparse products.
+
+        Args:
+            user_rows: Model rows of the users
+            k: Number of neighbors to use
+
+        Returns:
+            Array (len(user_rows) x movies) of predicted ratings
+        """
+        return self._predict_many(self._snapshot, np.asarray(user_rows, dtype=np.int64), k)
+
+    def _predict_many(self, snapshot, user_rows, k):
+        indptr = [0]
+        indices = []
+        weights = []
+        for user_idx in user_rows:
+            neighbor_indices, similarities = self._neighbor_indices(snapshot, user_idx, k)
+            indices.append(neighbor_indices)
+            weights.append(similarities)
+            indptr.append(indptr[-1] + len(neighbor_indices))
+
+        neighbor_weights = csr_matrix(
+            (
+                np.concatenate(weights) if weights else np.zeros(0),
+                np.concatenate(indices) if indices else np.zeros(0, dtype=np.int64),
+                np.array(indptr),
+            ),
+            shape=(len(user_rows), len(snapshot.user_ids))
+        )
+        rated = snapshot.rating_matrix.copy()
+        rated.data = np.ones_like(rated.data)
+
+        weighted_sum = (neighbor_weights @ self._centered_ratings(snapshot)).toarray()
+        similarity_sum = (abs(neighbor_weights) @ rated).toarray()
+
+        predictions = np.repeat(snapshot.mean_values[user_rows][:, None], len(self.movie_ids), axis=1)
+        has_support = similarity_sum > 0
+        predictions[has_support] += weighted_sum[has_support] / similarity_sum[has_support]
+        return self._keep_known_ratings(snapshot, np.clip(predictions, 1, 5), user_rows)
+
+    @staticmethod
+    def _keep_known_ratings(snapshot, predictions, user_rows):
+        """Already rated movies keep their actual rating, for a block of users"""
+        block = snapshot.rating_matrix[user_rows]
+        rows = np.repeat(np.arange(len(user_rows)), np.diff(block.indptr))
+        predictions[rows, block.indices] = block.data
+        return predictions
+
+    def recommend_many(self, user_ids, n=10, k=10, exclude_rated=True, batch_size=256):
+        """
+        Generate top N recommendations for many users of the model
+
+        Users are scored block by block with `predict_many` and ranked with
+        one sort per block, which is much cheaper than calling `recommend`
+        user by user.
+
+        Args:
+            user_ids: User IDs (users unknown to the model are skipped)
+            n: Number of recommendations per user
+            k: Number of neighbors to use
+            exclude_rated: Whether to exclude already rated movies
+            batch_size: Number of users scored per block
+
+        Returns:
+            Dict user_id -> list of (movie_id, predicted_rating) tuples
+        """
+        snapshot = self._snapshot
+        known = [user_id for user_id in user_ids if user_id in snapshot.user_ids]
+        user_rows = snapshot.user_ids.positions(known)
+        movie_ids = self.movie_ids.values
+        recommendations = {}
+
+        for start in range(0, len(user_rows), batch_size):
+            rows = user_rows[start:start + batch_size]
+            predictions = self._predict_many(snapshot, rows, k)
+            ranked = predictions.copy()
+            if exclude_rated:
+                # Skip movies the user already rated
+                block = snapshot.rating_matrix[rows]
+                ranked[np.repeat(np.arange(len(rows)), np.diff(block.indptr)), block.indices] = -np.inf
+
+            # Stable sort, so ties keep the movie order like `_top_n`
+            order = np.argsort(-ranked, axis=1, kind='stable')[:, :n]
+            for offset, user_id in enumerate(known[start:start + batch_size]):
+                top = order[offset][np.isfinite(ranked[offset, order[offset]])]
+                recommendations[user_id] = [
+                    (movie_ids[idx].item(), predictions[offset, idx]) for idx in top
+                ]
+        return recommendations
+
     def get_user_profile_strength(self, user_id):
         """
         Calculate how well-defined a user's profile is
@@ -217,12 +1049,13 @@ class ImprovedCollaborativeFiltering:
         Returns:
             Tuple of (num_ratings, avg_rating, profile_strength_score)
         """
-        if user_id not in self.user_ids:
+        snapshot = self._snapshot
+        user_idx = snapshot.user_ids.get(user_id)
+        if user_idx is None:
             return (0, 0.0, 0.0)
         
-        user_idx = self.user_ids.index(user_id)
-        user_ratings = self.matrix_values[user_idx]
-        rated_items = user_ratings[user_ratings > 0]
+        start, end = snapshot.rating_matrix.indptr[user_idx:user_idx + 2]
+        rated_items = snapshot.rating_matrix.data[start:end]
         
         num_ratings = len(rated_items)
         avg_rating = np.mean(rated_items) if num_ratings > 0 else 0.0
@@ -237,4 +1070,240 @@ class ImprovedCollaborativeFiltering:
             diversity_score = min(variance / 2.0, 1.0)  # Normalize variance
             strength = (quantity_score * 0.7) + (diversity_score * 0.3)
         
-        return (num_ratings, avg_rating, strength)
\ No newline at end of file
+        return (num_ratings, avg_rating, strength)
+
+class ItemBasedCollaborativeFiltering(ImprovedCollaborativeFiltering):
+    """
+    Item-based collaborative filtering with precomputed neighborhoods:
+    - Adjusted cosine similarity between movies (ratings centered by user mean)
+    - Only the top-K most similar movies of each movie are kept, at training
+    - Scoring a user only gathers the neighbor lists of the movies they rated,
+      so the cost does not depend on the number of users
+    """
+
+    def __init__(self, ratings_df, n_neighbors=50, min_common_items=2,
+                 similarity_threshold=0.0, block_size=512):
+        """
+        Initialize the item-based model and precompute the item neighbors
+        
+        Args:
+            ratings_df: DataFrame with user_id, movie_id, rating columns
+            n_neighbors: Number of neighbors kept for each movie
+            min_common_items: Minimum number of common raters for similarity
+            similarity_threshold: Minimum similarity score to keep a neighbor
+            block_size: Number of movies processed per similarity block
+        """
+        super().__init__(ratings_df, min_common_items, similarity_threshold)
+        self.n_neighbors = n_neighbors
+        self.block_size = block_size
+        self.neighbor_matrix = self._compute_item_neighbors()
+        self._index_neighbors_by_source()
+
+    def prepare(self):
+        # The item neighbors are computed at training, no user similarities are used
+        pass
+
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        self._index_neighbors_by_source()
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        state.pop('_neighbors_by_source', None)
+        return state
+
+    def _index_neighbors_by_source(self):
+        # Row i lists the movies that have movie i among their neighbors
+        self._neighbors_by_source = self.neighbor_matrix.T.tocsr()
+
+    def _compute_item_neighbors(self):
+        """
+        Compute the truncated top-K neighbor lists of every movie
+
+        Similarities are computed block by block so the full
+        movies x movies matrix never exists in memory.
+
+        Returns:
+            CSR matrix (movies x movies), row j holding the neighbors of j
+        """
+        n_items = len(self.movie_ids)
+        counts = np.diff(self.rating_matrix.indptr)
+
+        centered = self.rating_matrix.copy()
+        centered.data = centered.data - np.repeat(self.mean_values, counts)
+        by_item = centered.T.tocsr()
+
+        rated_by_item = self.rating_matrix.T.tocsr()
+        rated_by_item.data = np.ones_like(rated_by_item.data)
+
+        norms = np.sqrt(np.asarray(by_item.multiply(by_item).sum(axis=1)).ravel())
+
+        indptr = [0]
+        indices = []
+        data = []
+        k = min(self.n_neighbors, max(n_items - 1, 0))
+
+        for start in range(0, n_items, self.block_size):
+            stop = min(start + self.block_size, n_items)
+            rows = np.arange(stop - start)
+
+            sims = (by_item[start:stop] @ by_item.T).toarray()
+            norm_products = np.outer(norms[start:stop], norms)
+            np.divide(sims, norm_products, out=sims, where=norm_products > 0)
+            sims[norm_products == 0] = 0.0
+
+            if self.min_common_items > 1:
+                common = (rated_by_item[start:stop] @ rated_by_item.T).toarray()
+                sims[common < self.min_common_items] = 0.0
+
+            sims[rows, start + rows] = 0.0
+            sims[sims < max(self.similarity_threshold, 0.0)] = 0.0
+
+            if k == 0:
+                indptr.extend([0] * len(rows))
+                continue
+
+            top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+            top_sims = np.take_along_axis(sims, top, axis=1)
+            order = np.argsort(-top_sims, axis=1, kind='stable')
+            top = np.take_along_axis(top, order, axis=1)
+            top_sims = np.take_along_axis(top_sims, order, axis=1)
+
+            for row_items, row_sims in zip(top, top_sims):
+                keep = row_sims > 0
+                indices.append(row_items[keep])
+                data.append(row_sims[keep])
+                indptr.append(indptr[-1] + int(keep.sum()))
+
+        return csr_matrix(
+            (
+                np.concatenate(data).astype(np.float32) if data else np.zeros(0, dtype=np.float32),
+                np.concatenate(indices) if indices else np.zeros(0, dtype=np.int64),
+                np.array(indptr),
+            ),
+            shape=(n_items, n_items)
+        )
+
+    def find_similar_items(self, movie_id, k=10):
+        """
+        Most similar movies from the precomputed neighbor lists
+        
+        Args:
+            movie_id: Movie ID
+            k: Number of neighbors
+            
+        Returns:
+            List of (movie_id, similarity) tuples
+        """
+        movie_idx = self.movie_ids.get(movie_id)
+        if movie_idx is None:
+            return []
+        start, end = self.neighbor_matrix.indptr[movie_idx:movie_idx + 2]
+        return [
+            (self.movie_ids[idx], float(sim))
+            for idx, sim in zip(
+                self.neighbor_matrix.indices[start:end][:k],
+                self.neighbor_matrix.data[start:end][:k]
+            )
+        ]
+
+    def predict_rating(self, user_id, movie_id, k=None):
+        """
+        Predict rating for a user-movie pair
+        
+        Args:
+            user_id: User ID
+            movie_id: Movie ID
+            k: Unused, the neighborhood size is fixed at training
+            
+        Returns:
+            Predicted rating (1-5 scale)
+        """
+        snapshot = self._snapshot
+        user_idx = snapshot.user_ids.get(user_id)
+        movie_idx = self.movie_ids.get(movie_id)
+        if user_idx is None or movie_idx is None:
+            return IdValueMap(snapshot.user_ids, snapshot.mean_values).get(user_id, 3.0)
+        return self._predict_row(snapshot, user_idx, k)[movie_idx]
+
+    def predict_all(self, user_id, k=None):
+        """
+        Predict ratings of a user for every movie in one pass
+
+        prediction(j) = user_mean + sum_i s_ji * (r_i - user_mean) / sum_i |s_ji|
+        over the movies i rated by the user that are neighbors of j.
+        
+        Args:
+            user_id: User ID (must be in the model)
+            k: Unused, the neighborhood size is fixed at training
+            
+        Returns:
+            Array of predicted ratings aligned with `movie_ids`
+        """
+        snapshot = self._snapshot
+        return self._predict_row(snapshot, snapshot.user_ids.index(user_id), k)
+
+    def _predict_row(self, snapshot, user_idx, k):
+        start, end = snapshot.rating_matrix.indptr[user_idx:user_idx + 2]
+        return self._predict_from_items(
+            snapshot.mean_values[user_idx],
+            snapshot.rating_matrix.indices[start:end],
+            snapshot.rating_matrix.data[start:end]
+        )
+
+    def predict_for_ratings(self, columns, values, k=None):
+        """
+        Predict every movie for a transient rating vector
+
+        Args:
+            columns: Sorted model column indices rated by the user
+            values: Ratings aligned with columns
+            k: Unused, the neighborhood size is fixed at training
+
+        Returns:
+            Array of predicted ratings aligned with `movie_ids`
+        """
+        return self._predict_from_items(np.mean(values), columns, values)
+
+    def predict_many(self, user_rows, k=None):
+        """
+        Predict every movie for a block of users at once
+
+        Args:
+            user_rows: Model rows of the users
+            k: Unused, the neighborhood size is fixed at training
+
+        Returns:
+            Array (len(user_rows) x movies) of predicted ratings
+        """
+        return self._predict_many(self._snapshot, np.asarray(user_rows, dtype=np.int64), k)
+
+    def _predict_many(self, snapshot, user_rows, k):
+        block = snapshot.rating_matrix[user_rows]
+        means = snapshot.mean_values[user_rows]
+        rated = block.copy()
+        rated.data = np.ones_like(rated.data)
+        block.data = block.data - np.repeat(means, np.diff(block.indptr))
+
+        weighted_sum = (block @ self._neighbors_by_source).toarray()
+        similarity_sum = (rated @ self._neighbors_by_source).toarray()
+
+        predictions = np.repeat(means[:, None], len(self.movie_ids), axis=1)
+        has_support = similarity_sum > 0
+        predictions[has_support] += weighted_sum[has_support] / similarity_sum[has_support]
+        return self._keep_known_ratings(snapshot, np.clip(predictions, 1, 5), user_rows)
+
+    def _predict_from_items(self, user_mean, rated_items, ratings):
+        predictions = np.full(len(self.movie_ids), user_mean, dtype=np.float64)
+        if len(rated_items) > 0:
+            gathered = self._neighbors_by_source[rated_items]
+            weighted_sum = gathered.T @ (ratings - user_mean)
+            similarity_sum = gathered.T @ np.ones(len(rated_items))
+            has_support = similarity_sum > 0
+            predictions[has_support] += weighted_sum[has_support] / similarity_sum[has_support]
+
+        predictions = np.clip(predictions, 1, 5)
+
+        # Already rated movies keep their actual rating
+        predictions[rated_items] = ratings
+        return predictions
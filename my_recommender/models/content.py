@@ -3,28 +3,258 @@ import numpy as np
 import pickle
 
 from nltk.stem import PorterStemmer
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from scipy.sparse import csr_matrix, vstack
+from sklearn.decomposition import TruncatedSVD
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfVectorizer
+from sklearn.preprocessing import normalize
+
+# Placeholder written by fetch_movie_data.py when TMDB has no overview
+MISSING_OVERVIEW = "Description not available."
+
+
+def _top_k_rows(sims, start, k):
+    """
+    Top-K positive scores of each row of a dense similarity block
+
+    Args:
+        sims: Dense block (rows x movies), modified in place
+        start: Movie index of the first row (its self-similarity is dropped)
+        k: Number of neighbors kept per row
+
+    Returns:
+        List of (indices, scores) pairs sorted by decreasing score
+    """
+    rows = np.arange(sims.shape[0])
+    sims[rows, start + rows] = 0.0
+    k = min(k, sims.shape[1])
+    if k == 0:
+        return [(np.zeros(0, dtype=np.int64), np.zeros(0))] * len(rows)
+
+    top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+    top_sims = np.take_along_axis(sims, top, axis=1)
+    order = np.argsort(-top_sims, axis=1, kind='stable')
+    top = np.take_along_axis(top, order, axis=1)
+    top_sims = np.take_along_axis(top_sims, order, axis=1)
+    keep = top_sims > 0
+    return [(row_top[row_keep], row_sims[row_keep])
+            for row_top, row_sims, row_keep in zip(top, top_sims, keep)]
+
+
+def top_k_neighbors(features=None, k=100, block_size=256, similarity_matrix=None):
+    """
+    Truncated cosine neighbor lists of every movie
+
+    Similarities are computed block by block (block_size x movies), so the
+    full movies x movies matrix never exists in memory.
+
+    Args:
+        features: Feature matrix (movies x features), dense or sparse
+        k: Number of neighbors kept per movie
+        block_size: Number of movies processed per block
+        similarity_matrix: Precomputed dense similarities, used instead of
+            `features` (models saved before the neighbor store)
+
+    Returns:
+        CSR matrix (movies x movies) of float32 scores, row i holding the
+        neighbors of movie i sorted by decreasing similarity
+    """
+    if similarity_matrix is not None:
+        n_movies = similarity_matrix.shape[0]
+    else:
+        features = normalize(features)
+        n_movies = features.shape[0]
+
+    indptr = [0]
+    indices = []
+    data = []
+    for start in range(0, n_movies, block_size):
+        stop = min(start + block_size, n_movies)
+        if similarity_matrix is not None:
+            sims = np.array(similarity_matrix[start:stop], dtype=np.float64)
+        else:
+            sims = features[start:stop] @ features.T
+            sims = sims.toarray() if hasattr(sims, 'toarray') else np.asarray(sims)
+        for row_indices, row_sims in _top_k_rows(sims, start, k):
+            indices.append(row_indices)
+            data.append(row_sims)
+            indptr.append(indptr[-1] + len(row_indices))
+
+    return csr_matrix(
+        (
+            np.concatenate(data).astype(np.float32) if data else np.zeros(0, dtype=np.float32),
+            np.concatenate(indices).astype(np.int32) if indices else np.zeros(0, dtype=np.int32),
+            np.array(indptr, dtype=np.int64),
+        ),
+        shape=(n_movies, n_movies)
+    )
+
 
 class ImprovedContentBased:
-    def __init__(self, movies_df, credits_df=None, use_stemming=False):
+    # 'tfidf': vocabulary and IDF fitted on the initial catalog, frozen afterwards
+    # 'hashing': stateless hashed term frequencies, for catalogs that keep growing
+    VECTORIZER_TYPES = ('tfidf', 'hashing')
+
+    def __init__(self, movies_df, credits_df=None, use_stemming=False, n_neighbors=100,
+                 block_size=256, vectorizer_type='tfidf', n_components=None, random_state=42):
+        """
+        Args:
+            movies_df: Movies with movie_id, movie_title, genre columns and
+                optionally overview
+            credits_df: Optional credits
+            use_stemming: Stem the tags
+            n_neighbors: Neighbors stored per movie
+            block_size: Movies processed per similarity block
+            vectorizer_type: One of VECTORIZER_TYPES
+            n_components: When set, genres + overview TF-IDF features are
+                compressed into dense float32 embeddings of this size
+                (randomized truncated SVD); otherwise genres only, sparse
+            random_state: Seed of the randomized SVD
+        """
+        if vectorizer_type not in self.VECTORIZER_TYPES:
+            raise ValueError(
+                f"Unknown vectorizer_type '{vectorizer_type}'. Expected one of {list(self.VECTORIZER_TYPES)}"
+            )
         self.use_stemming = use_stemming
         self.ps = PorterStemmer() if use_stemming else None
+        self.n_components = n_components
         if credits_df is not None:
             self.movies_df = self._merge_and_process(movies_df, credits_df)
         else:
             self.movies_df = self._process_movies(movies_df)
-        self.vectorizer = TfidfVectorizer(
-            max_features=5000, stop_words='english', ngram_range=(1, 2), min_df=2
-        )
-        self.tfidf_matrix = self.vectorizer.fit_transform(self.movies_df['tags'])
-        self.similarity_matrix = cosine_similarity(self.tfidf_matrix, self.tfidf_matrix)
+        self.vectorizer_type = vectorizer_type
+        if vectorizer_type == 'hashing':
+            self.vectorizer = HashingVectorizer(
+                stop_words='english', ngram_range=(1, 2), alternate_sign=False, norm='l2'
+            )
+            self.tfidf_matrix = self.vectorizer.transform(self.movies_df['tags'])
+        else:
+            self.vectorizer = TfidfVectorizer(
+                max_features=5000, stop_words='english', ngram_range=(1, 2), min_df=2
+            )
+            self.tfidf_matrix = self.vectorizer.fit_transform(self.movies_df['tags'])
+
+        self.projection = None
+        self.embeddings = None
+        if n_components:
+            # Latent semantic space: rows of embeddings are unit-norm, so a
+            # dot product is the cosine similarity
+            n_components = min(n_components, self.tfidf_matrix.shape[1] - 1)
+            svd = TruncatedSVD(n_components, algorithm='randomized', random_state=random_state)
+            svd.fit(self.tfidf_matrix)
+            self.projection = svd.components_.T.astype(np.float32)
+            self.embeddings = self._embed(self.tfidf_matrix)
+            self.tfidf_matrix = None
+
+        # Only the top-K neighbors of each movie are kept (CSR, float32)
+        self.n_neighbors = n_neighbors
+        self.block_size = block_size
+        self.neighbor_matrix = top_k_neighbors(self._features(), n_neighbors, block_size)
+        self._index_titles()
+
+    def _embed(self, tfidf):
+        """Unit-norm float32 embeddings of TF-IDF rows"""
+        return normalize(np.asarray(tfidf @ self.projection, dtype=np.float32))
+
+    def _features(self):
+        """Feature matrix of the catalog: dense embeddings or sparse TF-IDF"""
+        return self.embeddings if self.embeddings is not None else self.tfidf_matrix
+
+    def _transform(self, tags):
+        """Features of new tags in the model's space"""
+        features = self.vectorizer.transform(tags)
+        return self._embed(features) if self.projection is not None else features
+
+    def _index_titles(self):
         self.title_to_idx = {
             title: idx for idx, title in enumerate(self.movies_df['title'])
         }
         self.idx_to_title = {
             idx: title for title, idx in self.title_to_idx.items()
         }
+        # Row -> movie_id / title arrays used to gather results
+        self.row_movie_ids = self.movies_df['movie_id'].to_numpy()
+        self.row_titles = self.movies_df['title'].to_numpy(dtype=object)
+        # movie_id -> row array (-1 for unknown ids), MovieLens ids being small integers
+        self.row_of_id = np.full(int(self.row_movie_ids.max(initial=-1)) + 1, -1, dtype=np.int64)
+        self.row_of_id[self.row_movie_ids] = np.arange(len(self.row_movie_ids))
+
+    def __getstate__(self):
+        # The title lookups and the stemmer are rebuilt on load
+        state = self.__dict__.copy()
+        for key in ('ps', 'title_to_idx', 'idx_to_title', 'row_movie_ids', 'row_titles', 'row_of_id'):
+            state.pop(key, None)
+        return state
+
+    def __setstate__(self, state):
+        if 'neighbor_matrix' not in state:
+            # Pickles created with the dense similarity matrix
+            state['n_neighbors'] = 100
+            state['neighbor_matrix'] = self._legacy_neighbors(state, state['n_neighbors'])
+        state.pop('similarity_matrix', None)
+        self.__dict__.update(state)
+        self.__dict__.setdefault('use_stemming', False)
+        self.__dict__.setdefault('vectorizer_type', 'tfidf')
+        self.__dict__.setdefault('block_size', 256)
+        self.__dict__.setdefault('n_components', None)
+        self.__dict__.setdefault('projection', None)
+        self.__dict__.setdefault('embeddings', None)
+        if 'ps' not in state:
+            self.ps = PorterStemmer() if self.use_stemming else None
+        if 'row_of_id' not in state:
+            self._index_titles()
+
+    @staticmethod
+    def _legacy_neighbors(model_data, k):
+        """Neighbor store of a model saved with the dense similarity matrix"""
+        if model_data.get('tfidf_matrix') is not None:
+            return top_k_neighbors(model_data['tfidf_matrix'], k)
+        return top_k_neighbors(k=k, similarity_matrix=model_data['similarity_matrix'])
+
+    def _neighbor_row(self, idx):
+        start, end = self.neighbor_matrix.indptr[idx:idx + 2]
+        return self.neighbor_matrix.indices[start:end], self.neighbor_matrix.data[start:end]
+
+    def _profile_scores(self, rows, weights):
+        """Weighted sum of the cosine similarities of the given rows with every movie"""
+        if self.embeddings is not None:
+            # Dense latent profile: one small GEMV over the catalog
+            profile = weights.astype(np.float32) @ self.embeddings[rows]
+            return (self.embeddings @ profile).astype(np.float64)
+        profile = csr_matrix(
+            (weights, rows, [0, len(rows)]), shape=(1, len(self.row_movie_ids))
+        )
+        if self.tfidf_matrix is None:
+            # Models saved without their TF-IDF features: truncated neighbor lists
+            return (profile @ self.neighbor_matrix).toarray().ravel()
+        # (w T) T^T: a sparse weighted profile scored against the catalog,
+        # instead of summing one catalog-wide similarity row per rated movie
+        features = profile @ self.tfidf_matrix
+        return (self.tfidf_matrix @ features.T).toarray().ravel()
+
+    @staticmethod
+    def _top_rows(scores, n):
+        """
+        Rows of the n highest non-negative scores, sorted by decreasing score
+        then by row, so that a shorter list is always a prefix of a longer one
+        """
+        candidates = np.flatnonzero(scores >= 0)
+        if n <= 0:
+            return candidates[:0]
+        if n < len(candidates):
+            candidate_scores = scores[candidates]
+            kth = np.partition(candidate_scores, len(candidates) - n)[len(candidates) - n]
+            above = candidates[candidate_scores > kth]
+            tied = candidates[candidate_scores == kth][:n - len(above)]
+            candidates = np.concatenate([above, tied])
+        return candidates[np.lexsort((candidates, -scores[candidates]))]
+
+    def _gather(self, rows, scores):
+        """List of (movie_id, title, score) tuples for the given rows"""
+        return list(zip(
+            self.row_movie_ids[rows].tolist(),
+            self.row_titles[rows].tolist(),
+            np.asarray(scores, dtype=np.float64).tolist()
+        ))
 
     def _process_movies(self, movies_df):
         processed = movies_df.copy()
@@ -43,6 +273,10 @@ class ImprovedContentBased:
         
         processed['genres'] = movies_df.apply(get_genres, axis=1)
         processed['tags'] = processed['genres'].apply(lambda x: ' '.join(x))
+        if self.n_components and 'overview' in movies_df.columns:
+            # The overview is only affordable in the compressed space
+            overviews = movies_df['overview'].fillna('').astype(str).replace(MISSING_OVERVIEW, '')
+            processed['tags'] = (processed['tags'] + ' ' + overviews.str.lower()).apply(self._stem_text)
         processed['title'] = processed['movie_title']
         return processed[['movie_id', 'title', 'tags']]
 
@@ -53,82 +287,226 @@ class ImprovedContentBased:
         stemmed = [self.ps.stem(word) for word in words]
         return " ".join(stemmed)
 
-    def recommend(self, movie_title, n=10):
-        if movie_title not in self.title_to_idx:
+    def _title_row(self, movie_title):
+        """Row of a title: exact match, else the first title containing it"""
+        idx = self.title_to_idx.get(movie_title)
+        if idx is None:
             matches = [t for t in self.title_to_idx if movie_title.lower() in t.lower()]
-            if not matches:
-                print(f"Warning: Title '{movie_title}' not found.")
-                return []
-            movie_title = matches[0] 
-            
-        idx = self.title_to_idx[movie_title]
-        similarity_scores = self.similarity_matrix[idx]
-        similar_indices = similarity_scores.argsort()[::-1][1:n + 1]
-        recommendations = []
-        for sim_idx in similar_indices:
-            movie_id = self.movies_df.iloc[sim_idx]['movie_id']
-            title = self.idx_to_title[sim_idx]
-            score = similarity_scores[sim_idx]
-            recommendations.append((movie_id, title, score))
-        return recommendations
+            if matches:
+                idx = self.title_to_idx[matches[0]]
+        return idx
+
+    def rows_for_ids(self, movie_ids):
+        """Vectorized movie_id -> row lookup, -1 for movies not in the model"""
+        movie_ids = np.asarray(movie_ids, dtype=np.int64)
+        rows = np.full(len(movie_ids), -1, dtype=np.int64)
+        in_range = (movie_ids >= 0) & (movie_ids < len(self.row_of_id))
+        rows[in_range] = self.row_of_id[movie_ids[in_range]]
+        return rows
+
+    def recommend(self, movie_title, n=10):
+        """Title wrapper of `recommend_similar`"""
+        idx = self._title_row(movie_title)
+        if idx is None:
+            print(f"Warning: Title '{movie_title}' not found.")
+            return []
+        return self._recommend_similar_row(idx, n)
+
+    def recommend_similar(self, movie_id, n=10):
+        """
+        Most similar movies of a movie
+
+        Args:
+            movie_id: Movie ID
+            n: Number of recommendations
+
+        Returns:
+            List of (movie_id, title, score) tuples
+        """
+        idx = self.rows_for_ids([movie_id])[0]
+        if idx < 0:
+            print(f"Warning: Movie {movie_id} not found.")
+            return []
+        return self._recommend_similar_row(idx, n)
+
+    def _recommend_similar_row(self, idx, n):
+        # Neighbor lists exclude the movie itself and are already sorted
+        neighbor_indices, scores = self._neighbor_row(idx)
+        return self._gather(neighbor_indices[:n], scores[:n])
 
     def recommend_for_user(self, user_rated_movies, n=10):
-        weighted_similarity = np.zeros(len(self.movies_df))
-        total_weight = 0
-        valid_movies_rated = 0
-        
+        """Title wrapper of `recommend_for_ratings`, for (title, rating) pairs"""
+        rows = []
+        ratings = []
         for movie_title, rating in user_rated_movies:
-            idx = self.title_to_idx.get(movie_title)
+            idx = self._title_row(movie_title)
             if idx is None:
-                matches = [t for t in self.title_to_idx if movie_title.lower() in t.lower()]
-                if matches:
-                    idx = self.title_to_idx[matches[0]]
-                else:
-                    print(f"Warning: Title '{movie_title}' not found in content model.")
-                    continue
-
-            valid_movies_rated += 1
-            weight = rating - 3.0  # Mean-center the rating
-            weighted_similarity += self.similarity_matrix[idx] * weight
-            total_weight += abs(weight)
-
-        if total_weight < 1e-6 or valid_movies_rated == 0:
+                print(f"Warning: Title '{movie_title}' not found in content model.")
+                continue
+            rows.append(idx)
+            ratings.append(rating)
+        return self._recommend_from_rows(np.array(rows, dtype=np.int64), ratings, n)
+
+    def recommend_for_ratings(self, movie_ids, ratings, n=10):
+        """
+        Recommendations for a user's ratings
+
+        Args:
+            movie_ids: Movie IDs rated by the user (unknown movies are ignored)
+            ratings: Ratings aligned with movie_ids
+            n: Number of recommendations
+
+        Returns:
+            List of (movie_id, title, score) tuples, rated movies excluded
+        """
+        rows = self.rows_for_ids(movie_ids)
+        known = rows >= 0
+        return self._recommend_from_rows(rows[known], np.asarray(ratings, dtype=np.float64)[known], n)
+
+    def _recommend_from_rows(self, rows, ratings, n):
+        weights = np.asarray(ratings, dtype=np.float64) - 3.0  # Mean-center the ratings
+        total_weight = np.abs(weights).sum()
+        if len(rows) == 0 or total_weight < 1e-6:
             print("Warning: No valid movies provided for feature recommendation.")
             return []
 
+        weighted_similarity = self._profile_scores(rows, weights)
         weighted_similarity /= total_weight
-        rated_titles = [title for title, _ in user_rated_movies]
-        rated_indices = [self.title_to_idx[t] for t in rated_titles if t in self.title_to_idx]
-        
-        weighted_similarity[rated_indices] = -1
-        top_indices = weighted_similarity.argsort()[::-1][:n]
-        
-        recommendations = []
-        for idx in top_indices:
-            if weighted_similarity[idx] < 0:
-                continue
-            try:
-                movie_id = self.movies_df.iloc[idx]['movie_id']
-                title = self.idx_to_title[idx]  # C'est ici que l'erreur se produit
-                score = weighted_similarity[idx]
-                recommendations.append((movie_id, title, score))
-            except KeyError as e:
-                print(f"Warning: Index {idx} not found in idx_to_title mapping. Skipping.")
-                continue
-            except IndexError as e:
-                print(f"Warning: Index {idx} out of bounds for movies_df. Skipping.")
-                continue
-        
-        return recommendations
+        weighted_similarity[rows] = -1
+
+        top_rows = self._top_rows(weighted_similarity, n)
+        return self._gather(top_rows, weighted_similarity[top_rows])
+
+    def add_movies(self, movies_df, credits_df=None):
+        """
+        Add movies to the catalog without refitting the vectorizer
+
+        New movies are vectorized with the frozen vocabulary and IDF (or
+        hashed), their top-K neighbors are computed against the whole
+        catalog, and the neighbor lists of existing movies are patched
+        where a new movie beats their current K-th neighbor. The cost is
+        proportional to the number of new movies times the catalog size.
+        With 'tfidf', terms missing from the initial vocabulary are ignored:
+        retrain the model from time to time.
+
+        Args:
+            movies_df: New movies, same columns as the constructor's
+            credits_df: Optional credits of the new movies
+
+        Returns:
+            Number of movies added (movies already in the model are skipped)
+        """
+        if self._features() is None or self.vectorizer is None:
+            raise ValueError("Model saved without its features: retrain it to add movies")
+        if credits_df is not None:
+            new_movies = self._merge_and_process(movies_df, credits_df)
+        else:
+            new_movies = self._process_movies(movies_df)
+        new_movies = new_movies.drop_duplicates('movie_id')
+        known = self.rows_for_ids(new_movies['movie_id'].to_numpy()) >= 0
+        if known.any():
+            print(f"Warning: {int(known.sum())} movies already in content model, skipped.")
+            new_movies = new_movies[~known]
+        if new_movies.empty:
+            return 0
+
+        n_old = len(self.row_movie_ids)
+        new_features = self._transform(new_movies['tags'])
+        if self.embeddings is not None:
+            features = np.vstack([self.embeddings, new_features])
+        else:
+            features = vstack([self.tfidf_matrix, new_features]).tocsr()
+        normalized = normalize(features)
+        n_total = features.shape[0]
+        k = self.n_neighbors
+
+        # An existing row takes a new neighbor when it beats its current K-th one
+        counts = np.diff(self.neighbor_matrix.indptr)
+        last = self.neighbor_matrix.indptr[1:] - 1
+        thresholds = np.zeros(n_old)
+        full = counts >= k
+        thresholds[full] = self.neighbor_matrix.data[last[full]]
+
+        new_rows = []
+        patch_rows, patch_cols, patch_scores = [], [], []
+        for start in range(n_old, n_total, self.block_size):
+            stop = min(start + self.block_size, n_total)
+            sims = normalized[start:stop] @ normalized.T
+            sims = sims.toarray() if hasattr(sims, 'toarray') else np.asarray(sims)
+            old_part = sims[:, :n_old]
+            block_rows, old_rows = np.nonzero(old_part > thresholds)
+            patch_rows.append(old_rows)
+            patch_cols.append(start + block_rows)
+            patch_scores.append(old_part[block_rows, old_rows])
+            new_rows.extend(_top_k_rows(sims, start, k))
+
+        self.neighbor_matrix = self._patched_neighbors(
+            n_total, new_rows, np.concatenate(patch_rows),
+            np.concatenate(patch_cols), np.concatenate(patch_scores)
+        )
+        if self.embeddings is not None:
+            self.embeddings = features
+        else:
+            self.tfidf_matrix = features
+        self.movies_df = pd.concat([self.movies_df, new_movies], ignore_index=True)
+        self._index_titles()
+        return len(new_movies)
+
+    def _patched_neighbors(self, n_total, new_rows, patch_rows, patch_cols, patch_scores):
+        """Neighbor store with patched existing rows and the new rows appended"""
+        old = self.neighbor_matrix
+        n_old = old.shape[0]
+        counts = np.diff(old.indptr)
+
+        # Merge the candidates of each affected row with its current list
+        order = np.argsort(patch_rows, kind='stable')
+        patch_rows, patch_cols, patch_scores = patch_rows[order], patch_cols[order], patch_scores[order]
+        affected, starts = np.unique(patch_rows, return_index=True)
+        ends = np.append(starts[1:], len(patch_rows))
+        merged = []
+        for row, start, end in zip(affected, starts, ends):
+            row_indices, row_scores = self._neighbor_row(row)
+            indices = np.concatenate([row_indices, patch_cols[start:end]])
+            scores = np.concatenate([row_scores, patch_scores[start:end]])
+            top = np.argsort(-scores, kind='stable')[:self.n_neighbors]
+            merged.append((indices[top], scores[top]))
+            counts[row] = len(top)
+
+        counts = np.concatenate([counts, [len(indices) for indices, _ in new_rows]])
+        indptr = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        indices = np.empty(indptr[-1], dtype=np.int32)
+        data = np.empty(indptr[-1], dtype=np.float32)
+
+        # Untouched rows are copied as one vectorized block
+        entry_rows = np.repeat(np.arange(n_old), np.diff(old.indptr))
+        untouched = np.ones(n_old, dtype=bool)
+        untouched[affected] = False
+        keep = untouched[entry_rows]
+        positions = indptr[entry_rows[keep]] + (np.flatnonzero(keep) - old.indptr[entry_rows[keep]])
+        indices[positions] = old.indices[keep]
+        data[positions] = old.data[keep]
+
+        for row, (row_indices, row_scores) in zip(
+            np.concatenate([affected, np.arange(n_old, n_total)]), merged + new_rows
+        ):
+            indices[indptr[row]:indptr[row + 1]] = row_indices
+            data[indptr[row]:indptr[row + 1]] = row_scores
+
+        return csr_matrix((data, indices, indptr), shape=(n_total, n_total))
 
     def save_model(self, filepath='content_model.pkl'):
         model_data = {
             'movies_df': self.movies_df,
-            'similarity_matrix': self.similarity_matrix,
+            'neighbor_matrix': self.neighbor_matrix,
+            'n_neighbors': self.n_neighbors,
             'title_to_idx': self.title_to_idx,
             'idx_to_title': self.idx_to_title,
             'vectorizer': self.vectorizer, 
-            'tfidf_matrix': self.tfidf_matrix
+            'vectorizer_type': self.vectorizer_type,
+            'tfidf_matrix': self.tfidf_matrix,
+            'n_components': self.n_components,
+            'projection': self.projection,
+            'embeddings': self.embeddings
         }
         with open(filepath, 'wb') as f:
             pickle.dump(model_data, f)
@@ -140,10 +518,20 @@ class ImprovedContentBased:
         
         instance = cls.__new__(cls)
         instance.movies_df = model_data['movies_df']
-        instance.similarity_matrix = model_data['similarity_matrix']
-        instance.title_to_idx = model_data['title_to_idx']
-        instance.idx_to_title = model_data['idx_to_title']
+        if 'neighbor_matrix' in model_data:
+            instance.neighbor_matrix = model_data['neighbor_matrix']
+            instance.n_neighbors = model_data['n_neighbors']
+        else:
+            # Files saved with the dense similarity matrix
+            instance.n_neighbors = 100
+            instance.neighbor_matrix = cls._legacy_neighbors(model_data, instance.n_neighbors)
+        instance._index_titles()
         instance.vectorizer = model_data.get('vectorizer')
+        instance.vectorizer_type = model_data.get('vectorizer_type', 'tfidf')
+        instance.block_size = 256
+        instance.n_components = model_data.get('n_components')
+        instance.projection = model_data.get('projection')
+        instance.embeddings = model_data.get('embeddings')
         instance.tfidf_matrix = model_data.get('tfidf_matrix')
         instance.use_stemming = False 
         instance.ps = None
@@ -0,0 +1,104 @@
+"""
+Fusion of the candidate pools of the component models
+Each model proposes a bounded pool of scored candidates, merged here into one top-N
+"""
+import heapq
+
+import numpy as np
+
+
+class MovieBitset:
+    """
+    Set of movie ids packed in a bit array (one bit per id)
+
+    Membership of a whole array of ids is tested with two vectorized
+    operations, instead of one set lookup per candidate.
+    """
+
+    def __init__(self, movie_ids=()):
+        movie_ids = np.asarray(movie_ids, dtype=np.int64).ravel()
+        movie_ids = movie_ids[movie_ids >= 0]
+        size = int(movie_ids.max()) + 1 if len(movie_ids) else 0
+        self.bits = np.zeros((size + 7) // 8, dtype=np.uint8)
+        np.bitwise_or.at(self.bits, movie_ids >> 3, (1 << (movie_ids & 7)).astype(np.uint8))
+
+    def __len__(self):
+        return int(np.unpackbits(self.bits).sum())
+
+    def contains(self, movie_ids):
+        """
+        Membership of each id
+
+        Args:
+            movie_ids: Array of movie IDs
+
+        Returns:
+            Boolean array, same shape as movie_ids
+        """
+        movie_ids = np.asarray(movie_ids, dtype=np.int64)
+        inside = (movie_ids >= 0) & (movie_ids < len(self.bits) * 8)
+        found = np.zeros(movie_ids.shape, dtype=bool)
+        ids = movie_ids[inside]
+        found[inside] = (self.bits[ids >> 3] >> (ids & 7)) & 1
+        return found
+
+
+def _normalize(scores):
+    # Min-max par modèle: les échelles (notes, similarités, popularité) ne sont pas comparables
+    low, high = scores.min(), scores.max()
+    if high > low:
+        return (scores - low) / (high - low)
+    return np.ones_like(scores)
+
+
+def fuse_candidates(pools, n, exclude=None):
+    """
+    Merge the candidate pools of several models into one top-N
+
+    Each pool's scores are min-max normalized and weighted by the model's
+    share; a movie proposed by several models sums its contributions and is
+    attributed to the model that contributed the most, whose own score it
+    keeps for display.
+
+    Args:
+        pools: List of (model name, weight, movie ids, scores)
+        n: Number of recommendations
+        exclude: MovieBitset of the movies to drop (e.g. already rated)
+
+    Returns:
+        List of (movie_id, fused score, model name, score given by that
+        model) tuples, best fused score first (ties broken by movie_id)
+    """
+    pools = [
+        (name, weight, np.asarray(movie_ids, dtype=np.int64), np.asarray(scores, dtype=np.float64))
+        for name, weight, movie_ids, scores in pools
+        if weight > 0 and len(movie_ids)
+    ]
+    if n <= 0 or not pools:
+        return []
+
+    total_weight = sum(weight for _, weight, _, _ in pools)
+    movie_ids = np.concatenate([ids for _, _, ids, _ in pools])
+    contributions = np.concatenate([weight / total_weight * _normalize(scores) for _, weight, _, scores in pools])
+    sources = np.concatenate([np.full(len(ids), i) for i, (_, _, ids, _) in enumerate(pools)])
+    model_scores = np.concatenate([scores for _, _, _, scores in pools])
+
+    if exclude is not None:
+        keep = ~exclude.contains(movie_ids)
+        movie_ids, contributions, sources = movie_ids[keep], contributions[keep], sources[keep]
+        model_scores = model_scores[keep]
+        if not len(movie_ids):
+            return []
+
+    candidates, inverse = np.unique(movie_ids, return_inverse=True)
+    fused = np.bincount(inverse, contributions, minlength=len(candidates))
+    # Modèle dominant de chaque candidat: plus forte contribution
+    order = np.lexsort((-contributions, inverse))
+    first = np.r_[True, inverse[order][1:] != inverse[order][:-1]]
+    dominant = sources[order[first]]
+    dominant_scores = model_scores[order[first]]
+
+    ids, scores = candidates.tolist(), fused.tolist()
+    dominant, dominant_scores = dominant.tolist(), dominant_scores.tolist()
+    top = heapq.nlargest(n, range(len(ids)), key=lambda i: (scores[i], -ids[i]))
+    return [(ids[i], scores[i], pools[dominant[i]][0], dominant_scores[i]) for i in top]
@@ -1,17 +1,76 @@
+import os
+import time
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+
 import pandas as pd
 import numpy as np
 
 from .content import ImprovedContentBased
-from .collaborative import ImprovedCollaborativeFiltering
+from .fusion import MovieBitset, fuse_candidates
+from .indexing import UserRatingsIndex
+from .collaborative import ImprovedCollaborativeFiltering, ItemBasedCollaborativeFiltering
+from .matrix_factorization import MatrixFactorizationCF
 from .popularity import PopularityModel
+from .segments import SegmentPopularity
+from .trending import TrendingModel
+
+# Pool partagé par toutes les requêtes: NumPy/scipy relâchent le GIL
+COMPONENT_WORKERS = max(4, os.cpu_count() or 1)
+_component_pool = None
+_component_pool_lock = threading.Lock()
+
+# Calculs CF en cours (y compris ceux abandonnés par une requête hors délai): clé -> Future
+_cf_inflight = {}
+_cf_inflight_lock = threading.Lock()
+
+
+def component_pool():
+    """Thread pool shared by the component models of every request"""
+    global _component_pool
+    with _component_pool_lock:
+        if _component_pool is None:
+            _component_pool = ThreadPoolExecutor(
+                max_workers=COMPONENT_WORKERS, thread_name_prefix='hybrid-component'
+            )
+    return _component_pool
+
+
+def _release_cf_future(key, future):
+    with _cf_inflight_lock:
+        if _cf_inflight.get(key) is future:
+            del _cf_inflight[key]
+
 
 class HybridRecommender:
-    def __init__(self, movies_df, ratings_df, credits_df=None):
+    # Collaborative filtering backends usable by the 'moderate' and 'active' branches
+    CF_MODES = {
+        'user': ImprovedCollaborativeFiltering,
+        'item': ItemBasedCollaborativeFiltering,
+        'als': MatrixFactorizationCF,
+    }
+    # Taille des pools de candidats: max(minimum, facteur * n) par modèle
+    CANDIDATE_POOL_MIN = 50
+    CANDIDATE_POOL_FACTOR = 3
+
+    def __init__(self, movies_df, ratings_df, credits_df=None, cf_mode='user', content_components=None,
+                 users_df=None):
         self.movies_df = movies_df
-        self.ratings_df = ratings_df
+        # Notes de chaque utilisateur sans parcourir ratings_df à chaque requête
+        # (ratings_df n'est pas conservé: le modèle servi n'en a pas besoin)
+        self.user_index = UserRatingsIndex(ratings_df)
+        self.cf_mode = cf_mode
         
         print("Initializing Popularity Model...")
         self.popularity_model = PopularityModel(movies_df, ratings_df)
+        # Tendances récentes, seulement si les notes sont horodatées
+        self.trending_model = (
+            TrendingModel(movies_df, ratings_df) if 'unix_timestamp' in ratings_df.columns else None
+        )
+        # Popularité par segment démographique (u.user), pour les nouveaux utilisateurs
+        self.segment_model = (
+            SegmentPopularity(movies_df, ratings_df, users_df) if users_df is not None else None
+        )
         
         print("Initializing Collaborative Filtering Model...")
         # S'assurer que ratings_df n'est pas vide avant d'initialiser CF
@@ -20,36 +79,332 @@ class HybridRecommender:
         else:
             self.cf_model = None # Gérer le cas où il n'y a pas de notes initiales
             print("Warning: Ratings_df is empty, Collaborative model not initialized.")
+        self.cf_models = {'user': self.cf_model}
+        if cf_mode != 'user':
+            self.train_cf_model(cf_mode, ratings_df)
 
         
         print("Initializing Content-Based Model...")
-        cb_movies_df = movies_df.copy()
+        self.cb_model = ImprovedContentBased(
+            self.content_movies(movies_df), credits_df, n_components=content_components
+        )
+        
+        self._index_titles()
+        print("Hybrid Recommender initialized successfully!")
+
+    @staticmethod
+    def content_movies(movies_df):
+        """Columns of the movies DataFrame used by the content-based model"""
         genre_cols = [col for col in movies_df.columns if col in [
             'Action', 'Adventure', 'Animation', "Children's", 'Comedy', 'Crime', 
             'Documentary', 'Drama', 'Fantasy', 'Film-Noir', 'Horror', 'Musical', 
             'Mystery', 'Romance', 'Sci-Fi', 'Thriller', 'War', 'Western'
         ]]
-        cb_movies_df = cb_movies_df[['movie_id', 'movie_title'] + genre_cols]
-        self.cb_model = ImprovedContentBased(cb_movies_df, credits_df)
-        
+        # TMDB overview of movies_enriched.csv, used by the embedding mode
+        text_cols = ['overview'] if 'overview' in movies_df.columns else []
+        return movies_df[['movie_id', 'movie_title'] + genre_cols + text_cols].copy()
+
+    @classmethod
+    def from_components(cls, movies_df, ratings_df, popularity_model, cf_models, cb_model,
+                        cf_mode='user', trending_model=None, segment_model=None):
+        """
+        Assemble a recommender from models trained separately
+        (e.g. in parallel by scripts/train_models.py)
+
+        Args:
+            movies_df: Movies DataFrame
+            ratings_df: Ratings DataFrame the models were trained on (indexed
+                per user, not kept)
+            popularity_model: PopularityModel
+            cf_models: Dict cf_mode -> CF model, must contain 'user'
+            cb_model: ImprovedContentBased
+            cf_mode: Default CF backend
+            trending_model: Optional TrendingModel
+            segment_model: Optional SegmentPopularity
+        """
+        if cf_mode not in cls.CF_MODES:
+            raise ValueError(f"Unknown cf_mode '{cf_mode}'. Expected one of {list(cls.CF_MODES)}")
+        instance = cls.__new__(cls)
+        instance.movies_df = movies_df
+        instance.user_index = UserRatingsIndex(ratings_df)
+        instance.cf_mode = cf_mode
+        instance.popularity_model = popularity_model
+        instance.trending_model = trending_model
+        instance.segment_model = segment_model
+        instance.cf_models = dict(cf_models)
+        instance.cf_model = instance.cf_models.get('user')
+        instance.cb_model = cb_model
+        instance._index_titles()
+        return instance
+
+    def _index_titles(self):
         self.id_to_title = dict(zip(
-            movies_df['movie_id'],
-            movies_df['movie_title']
+            self.movies_df['movie_id'],
+            self.movies_df['movie_title']
         ))
         self.title_to_id = {v: k for k, v in self.id_to_title.items()}
-        print("Hybrid Recommender initialized successfully!")
+
+    def add_movies(self, movies_df):
+        """
+        Add new movies to the catalog without retraining
+
+        The content-based model is grown incrementally; the CF and
+        popularity models pick the movies up once they are retrained
+        with their ratings.
+
+        Args:
+            movies_df: New movies, same columns as the movies DataFrame
+
+        Returns:
+            Number of movies added to the content-based model
+        """
+        new_movies = movies_df[~movies_df['movie_id'].isin(self.movies_df['movie_id'])]
+        added = self.cb_model.add_movies(self.content_movies(new_movies))
+        self.movies_df = pd.concat([self.movies_df, new_movies], ignore_index=True)
+        self._index_titles()
+        return added
+
+    def __getstate__(self):
+        # The title lookups are rebuilt from movies_df on load
+        state = self.__dict__.copy()
+        state.pop('id_to_title', None)
+        state.pop('title_to_id', None)
+        return state
+
+    def __setstate__(self, state):
+        # Pickles created before the full ratings were dropped from the serving state
+        state = dict(state)
+        ratings_df = state.pop('ratings_df', None)
+        # Pickles created before the CF backends were selectable
+        state.setdefault('cf_mode', 'user')
+        state.setdefault('cf_models', {'user': state.get('cf_model')})
+        state.setdefault('trending_model', None)
+        state.setdefault('segment_model', None)
+        self.__dict__.update(state)
+        if 'id_to_title' not in state:
+            self._index_titles()
+        if 'user_index' not in state:
+            self.user_index = UserRatingsIndex(ratings_df)
+
+    def train_cf_model(self, cf_mode, ratings_df):
+        """
+        Train the CF model of a backend and add it to the loaded ones
+
+        Args:
+            cf_mode: One of CF_MODES
+            ratings_df: Ratings DataFrame to train on
+        """
+        if cf_mode not in self.CF_MODES:
+            raise ValueError(f"Unknown cf_mode '{cf_mode}'. Expected one of {list(self.CF_MODES)}")
+        if ratings_df.empty:
+            self.cf_models[cf_mode] = None
+        else:
+            print(f"Initializing {cf_mode}-based Collaborative Filtering Model...")
+            self.cf_models[cf_mode] = self.CF_MODES[cf_mode](ratings_df)
+        return self.cf_models[cf_mode]
+
+    def get_cf_model(self, cf_mode=None):
+        """
+        Return the CF model of a loaded backend
+
+        Backends are trained offline (scripts/train_models.py --cf-modes)
+        and loaded with the model set: one missing here raises ValueError
+        rather than being trained on the request path.
+        """
+        cf_mode = cf_mode or self.cf_mode
+        if cf_mode not in self.CF_MODES:
+            raise ValueError(f"Unknown cf_mode '{cf_mode}'. Expected one of {list(self.CF_MODES)}")
+        if cf_mode not in self.cf_models:
+            raise ValueError(f"CF backend '{cf_mode}' is not loaded. Loaded: {list(self.cf_models)}")
+        return self.cf_models[cf_mode]
+
+    def prepare(self):
+        """
+        Build the derived data of the CF models (e.g. the dense similarity
+        matrix) before serving, instead of on a request's first use
+        """
+        for cf_model in self.cf_models.values():
+            if cf_model is not None:
+                cf_model.prepare()
+
+    def _collaborative_recs(self, cf_mode, user_id, movie_ids, ratings, n_cf, k):
+        """
+        CF recommendations of a user, or None when the CF model cannot serve them
+
+        Users unknown to the model (e.g. created through /api/signup) are
+        folded in from their ratings at request time.
+
+        Returns:
+            Tuple of (recommendations or None, note to append to the strategy)
+        """
+        cf_model = self.get_cf_model(cf_mode)
+        if not cf_model:
+            return None, ''
+        if user_id in cf_model.user_ids:
+            return cf_model.recommend(user_id, n_cf, k=k), ''
+        if not len(movie_ids):
+            return None, ''
+
+        cf_recs = cf_model.recommend_for_ratings(movie_ids, ratings, n_cf, k=k)
+        if not cf_recs:
+            return None, ''
+        return cf_recs, " (CF fold-in: user not in model)"
+
+    def _collaborative_future(self, cf_mode, user_id, movie_ids, ratings, n_cf, k, deadline):
+        """
+        Future of `_collaborative_recs`, shared with the requests already
+        computing the same recommendations
+
+        A computation that missed a request's deadline keeps running (it
+        cannot be interrupted): a retry of the same request waits for it
+        instead of submitting the same work again. Under a deadline, no CF
+        work is submitted while half the pool is busy with it, so that the
+        content model always has workers.
+
+        Returns:
+            Future, or None when the pool is saturated by CF work
+        """
+        key = (
+            id(self.get_cf_model(cf_mode)), user_id, n_cf, k,
+            np.asarray(movie_ids).tobytes(), np.asarray(ratings).tobytes()
+        )
+        with _cf_inflight_lock:
+            future = _cf_inflight.get(key)
+            if future is not None:
+                return future
+            if deadline is not None and len(_cf_inflight) >= COMPONENT_WORKERS // 2:
+                return None
+            future = component_pool().submit(
+                self._collaborative_recs, cf_mode, user_id, movie_ids, ratings, n_cf, k
+            )
+            _cf_inflight[key] = future
+        # Outside the lock: the callback runs right away if the future is already done
+        future.add_done_callback(lambda done: _release_cf_future(key, done))
+        return future
+
+    def _content_recs(self, movie_ids, ratings, n_cb):
+        """Content-based recommendations from the user's (movie_id, rating) pairs"""
+        if not len(movie_ids) or n_cb <= 0:
+            return []
+        return self.cb_model.recommend_for_ratings(movie_ids, ratings, n_cb)
+
+    @staticmethod
+    def _run_components(tasks, deadline=None):
+        """
+        Run independent component models concurrently on the shared pool
+
+        Args:
+            tasks: Dict name -> (function, *args), or a Future already
+                submitted (shared with other requests: never cancelled)
+            deadline: time.monotonic() value by which all of them must be
+                done (None: no deadline)
+
+        Returns:
+            Tuple of (dict name -> result, None for the components that missed
+            the deadline or raised, dict name -> "timed out" or "failed" for
+            those components)
+        """
+        pool = component_pool()
+        futures = {
+            name: task if isinstance(task, Future) else pool.submit(*task)
+            for name, task in tasks.items()
+        }
+        remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+        done, _ = wait(futures.values(), timeout=remaining)
+        results = {}
+        missing = {}
+        for name, future in futures.items():
+            results[name] = None
+            if future not in done or future.cancelled():
+                # Un calcul déjà démarré ne peut pas être interrompu: son résultat est ignoré
+                if not isinstance(tasks[name], Future):
+                    future.cancel()
+                print(f"Warning: {name} model missed the latency budget")
+                missing[name] = "timed out"
+            elif future.exception() is not None:
+                # Same fallback as a timeout: one model's error does not fail the request
+                print(f"Warning: {name} model failed: {future.exception()!r}")
+                missing[name] = "failed"
+            else:
+                results[name] = future.result()
+        return results, missing
+
+    def _hybrid_components(self, cf_mode, user_id, movie_ids, ratings, n_cf, k, cf_recs, deadline, n_cb):
+        """
+        CF and content recommendations of a user, computed concurrently
+
+        `cf_recs` are CF recommendations already computed in batch by
+        `recommend_batch`: only the content model runs then.
+
+        Returns:
+            Tuple of (dict component -> recommendations or None,
+            the CF note to append to the strategy,
+            dict component -> reason for the components that did not answer)
+        """
+        # An unknown or unloaded backend raises here, not inside a worker
+        self.get_cf_model(cf_mode)
+        tasks = {'content_based': (self._content_recs, movie_ids, ratings, n_cb)}
+        if cf_recs is None:
+            cf_future = self._collaborative_future(cf_mode, user_id, movie_ids, ratings, n_cf, k, deadline)
+            if cf_future is not None:
+                tasks['collaborative'] = cf_future
+        results, missing = self._run_components(tasks, deadline)
+
+        cf_note = ''
+        if cf_recs is not None:
+            results['collaborative'] = cf_recs
+        elif 'collaborative' not in tasks:
+            results['collaborative'] = None
+            missing['collaborative'] = "busy"
+        elif results['collaborative'] is not None:
+            results['collaborative'], cf_note = results['collaborative']
+        return results, cf_note, missing
+
+    def _fallback_pools(self, weights, results, missing, pool, explanation):
+        """
+        Candidate pools of the components that answered in time
+
+        The weight of a content model that missed the deadline or failed
+        goes to popularity, which is served inline: a slice of a
+        precomputed ranking cannot miss the deadline.
+
+        Args:
+            weights: Dict component -> weight (CF fallback already applied)
+            results: Dict component -> recommendations or None
+            missing: Dict component -> "timed out", "busy" (not started,
+                see `_collaborative_future`) or "failed", for the components
+                that did not answer
+            pool: Candidate pool size
+            explanation: Explanation dict, updated in place
+
+        Returns:
+            Dict component -> (weight, recommendations), as used by `_fuse`
+        """
+        for name, reason in missing.items():
+            explanation['failed' if reason == "failed" else 'timed_out'].append(name)
+        if 'content_based' in missing:
+            explanation['strategy'] += f" (content fallback: {missing['content_based']})"
+            weights['popularity'] = weights.get('popularity', 0.0) + weights['content_based']
+            weights['content_based'] = 0.0
+        pools = {
+            name: (weight, results.get(name) or [])
+            for name, weight in weights.items() if name != 'popularity'
+        }
+        if weights.get('popularity'):
+            pools['popularity'] = (weights['popularity'], self.popularity_model.recommend(pool))
+        return pools
 
     def get_user_rating_count(self, user_id, user_ratings_df=None):
         if user_ratings_df is not None:
             return len(user_ratings_df)
-        
-        if self.ratings_df.empty:
-            return 0
-        user_ratings = self.ratings_df[self.ratings_df['user_id'] == user_id]
-        return len(user_ratings)
+        return self.user_index.count(user_id)
 
     def get_user_category(self, user_id, user_ratings_df=None):
-        rating_count = self.get_user_rating_count(user_id, user_ratings_df)
+        return self.category_of(self.get_user_rating_count(user_id, user_ratings_df))
+
+    @staticmethod
+    def category_of(rating_count):
+        """Category of a user ('new', 'sparse', 'moderate', 'active') and their rating count"""
         if rating_count == 0:
             return ('new', rating_count)
         elif rating_count <= 10:
@@ -59,125 +414,237 @@ class HybridRecommender:
         else:
             return ('active', rating_count)
 
-    def recommend(self, user_id, n=10, explain=False, user_ratings_df=None):
-        # Utilise user_ratings_df s'il est fourni, sinon tombe sur self.ratings_df
-        category, rating_count = self.get_user_category(user_id, user_ratings_df)
+    def _popularity_recs(self, n, segment, explanation):
+        """
+        Popular movies for a new user: those of their demographic segment
+        when a segment hint is given and known, the global list otherwise
+        """
+        if segment is not None and self.segment_model is not None:
+            segment_recs = self.segment_model.recommend(segment, n)
+            if segment_recs:
+                explanation['segment'] = self.segment_model.segment_key(segment)
+                explanation['strategy'] += f" (segment {explanation['segment']})"
+                return segment_recs
+        return self.popularity_model.recommend(n)
+
+    def _pool_size(self, n):
+        """Number of candidates each component model proposes for a top-n"""
+        return max(self.CANDIDATE_POOL_MIN, self.CANDIDATE_POOL_FACTOR * n)
+
+    def _fuse(self, pools, n, rated_movie_ids):
+        """
+        Top-n of the fused candidate pools, without the movies the user rated
+
+        Args:
+            pools: Dict model name -> (weight, recommendations), the
+                recommendations being tuples whose first item is the movie_id
+                and last item the score
+            n: Number of recommendations
+            rated_movie_ids: Array of the movies the user rated
+
+        Returns:
+            List of (movie_id, title, score, model) tuples, ranked by fused
+            score; `score` is the one given by `model` (a predicted rating,
+            a similarity, a popularity score), as shown to users
+        """
+        rated = MovieBitset(rated_movie_ids) if len(rated_movie_ids) else None
+        fused = fuse_candidates(
+            [
+                (name, weight, [rec[0] for rec in recs], [rec[-1] for rec in recs])
+                for name, (weight, recs) in pools.items()
+            ],
+            n, exclude=rated
+        )
+        return [
+            (movie_id, self.id_to_title.get(movie_id, f"Movie {movie_id}"), score, model)
+            for movie_id, _, model, score in fused
+        ]
+
+    def _ratings_arrays(self, user_id, user_ratings_df=None):
+        """(movie_ids, ratings) arrays of a DataFrame, or of the training ratings when None"""
+        if user_ratings_df is None:
+            return self.user_index.get(user_id)
+        if user_ratings_df.empty:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+        return (
+            user_ratings_df['movie_id'].to_numpy(dtype=np.int64),
+            user_ratings_df['rating'].to_numpy(dtype=np.float64)
+        )
+
+    def recommend(self, user_id, n=10, explain=False, user_ratings_df=None, cf_mode=None,
+                  cf_recs=None, segment=None, timeout=None):
+        """
+        Hybrid recommendations of a user, with the model mix of their category
+
+        Args:
+            user_id: User ID
+            n: Number of recommendations
+            explain: Whether to also return the explanation dict
+            user_ratings_df: Ratings of the user (defaults to the training ratings)
+            cf_mode: CF backend, defaults to the recommender's cf_mode
+            cf_recs, segment, timeout: See `recommend_for_ratings`
+
+        Returns:
+            List of (movie_id, title, score, model) tuples, and the
+            explanation if `explain`
+        """
+        movie_ids, ratings = self._ratings_arrays(user_id, user_ratings_df)
+        return self.recommend_for_ratings(
+            user_id, movie_ids, ratings, n, explain, cf_mode, cf_recs, segment, timeout
+        )
+
+    def recommend_for_ratings(self, user_id, movie_ids, ratings, n=10, explain=False, cf_mode=None,
+                              cf_recs=None, segment=None, timeout=None):
+        """
+        Hybrid recommendations of a user from their ratings as NumPy arrays
+        (no DataFrame is built on this path)
+
+        Args:
+            user_id: User ID
+            movie_ids: Array of the movies the user rated
+            ratings: Array of the ratings, aligned with movie_ids
+            n: Number of recommendations
+            explain: Whether to also return the explanation dict
+            cf_mode: CF backend, defaults to the recommender's cf_mode
+            cf_recs: CF recommendations already computed by `recommend_batch`
+            segment: Demographic segment hint for new users
+            timeout: Latency budget in seconds (None: no budget). The CF and
+                content models run under this deadline; the ones that miss it
+                are dropped and their weight goes to the cheaper models
+                (content, then popularity), listed in explanation['timed_out'].
+                A model that raises falls back the same way, listed in
+                explanation['failed']
+
+        Returns:
+            List of (movie_id, title, score, model) tuples, and the
+            explanation if `explain`
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        category, rating_count = self.category_of(len(movie_ids))
+        cf_mode = cf_mode or self.cf_mode
         
-        recommendations = []
         explanation = {
             'user_id': user_id, 'category': category, 'rating_count': rating_count,
-            'models_used': [], 'strategy': ''
+            'models_used': [], 'strategy': '', 'cf_mode': cf_mode, 'timed_out': [], 'failed': []
         }
-        
-        # Sélectionne le bon DataFrame de notes
-        user_ratings = user_ratings_df if user_ratings_df is not None else pd.DataFrame()
-        if user_ratings_df is None and not self.ratings_df.empty:
-             user_ratings = self.ratings_df[self.ratings_df['user_id'] == user_id]
 
-        if category == 'new':
+        # Étape 1: chaque modèle propose un pool de candidats borné,
+        # étape 2: les pools sont fusionnés selon le poids de chaque modèle
+        pool = self._pool_size(n)
+        pools = {}
+
+        if category == 'new' and self.trending_model is not None:
+            explanation['strategy'] = "New user - Trending (50%) + Popularity (50%)"
+            explanation['models_used'].extend([('trending', 0.5), ('popularity', 0.5)])
+            pools['trending'] = (0.5, self.trending_model.recommend(pool))
+            pools['popularity'] = (0.5, self._popularity_recs(pool, segment, explanation))
+
+        elif category == 'new':
             explanation['strategy'] = "New user - using popularity-based"
             explanation['models_used'].append(('popularity', 1.0))
-            pop_recs = self.popularity_model.recommend(n)
-            for movie_id, title, score in pop_recs:
-                recommendations.append((movie_id, title, score, 'popularity'))
+            pools['popularity'] = (1.0, self._popularity_recs(pool, segment, explanation))
 
         elif category == 'sparse':
             explanation['strategy'] = "Sparse user - Content (70%) + Popularity (30%)"
             explanation['models_used'].extend([('content_based', 0.7), ('popularity', 0.3)])
-            
-            rated_movies = []
-            for _, row in user_ratings.iterrows():
-                movie_id = row['movie_id']
-                title = self.id_to_title.get(movie_id)
-                if title:  # Only add if we have a valid title
-                    rated_movies.append((title, row['rating']))
-            
-            n_content = int(n * 0.7)
-            n_pop = n - n_content
-            if rated_movies:
-                print(f"Passing {len(rated_movies)} rated movies to content model: {rated_movies}")
-                cb_recs = self.cb_model.recommend_for_user(rated_movies, n_content)
-                print(f"Content model returned {len(cb_recs)} recommendations")
-                for movie_id, title, score in cb_recs:
-                    recommendations.append((movie_id, title, score, 'content_based'))
-            pop_recs = self.popularity_model.recommend(n_pop)
-            for movie_id, title, score in pop_recs:
-                recommendations.append((movie_id, title, score, 'popularity'))
+            results, missing = self._run_components(
+                {'content_based': (self._content_recs, movie_ids, ratings, pool)}, deadline
+            )
+            pools = self._fallback_pools(
+                {'content_based': 0.7, 'popularity': 0.3}, results, missing, pool, explanation
+            )
 
         elif category == 'moderate':
             explanation['strategy'] = "Moderate user - CF (60%) + Content (30%) + Pop (10%)"
             explanation['models_used'].extend([('collaborative', 0.6), ('content_based', 0.3), ('popularity', 0.1)])
-            n_cf = int(n * 0.6)
-            n_cb = int(n * 0.3)
-            n_pop = n - n_cf - n_cb
-            
+
+            # CF et contenu sont indépendants: exécutés en parallèle, sous le budget de latence
+            results, cf_note, missing = self._hybrid_components(
+                cf_mode, user_id, movie_ids, ratings, pool, 20, cf_recs, deadline, pool
+            )
+            explanation['strategy'] += cf_note
+            weights = {'collaborative': 0.6, 'content_based': 0.3, 'popularity': 0.1}
+
             # --- CORRECTION POUR NOUVEL UTILISATEUR ---
-            # Vérifie si l'utilisateur existe dans le modèle CF avant de l'appeler
-            cf_recs = []
-            if self.cf_model and user_id in self.cf_model.user_ids:
-                cf_recs = self.cf_model.recommend(user_id, n_cf, k=20)
-            else:
-                # L'utilisateur est nouveau, réallouer le budget CF au Contenu et Pop
-                explanation['strategy'] += " (CF fallback: user not in model)"
-                n_cb += int(n_cf * 0.7) # 70% du budget CF va au CB
-                n_pop += n_cf - int(n_cf * 0.7) # le reste à Pop
+            if results['collaborative'] is None:
+                # CF hors délai ou sans note exploitable, réallouer le poids CF au Contenu et Pop
+                reason = missing.get('collaborative', "user not in model")
+                explanation['strategy'] += f" (CF fallback: {reason})"
+                weights['content_based'] += 0.6 * 0.7 # 70% du poids CF va au CB
+                weights['popularity'] += 0.6 * 0.3 # le reste à Pop
+                weights['collaborative'] = 0.0
             # --- FIN CORRECTION ---
 
-            for movie_id, score in cf_recs:
-                title = self.id_to_title.get(movie_id, f"Movie {movie_id}")
-                recommendations.append((movie_id, title, score, 'collaborative'))
-                
-            rated_movies = [
-                (self.id_to_title.get(row['movie_id'], ''), row['rating'])
-                for _, row in user_ratings.iterrows() if row['movie_id'] in self.id_to_title
-            ]
-            if rated_movies:
-                cb_recs = self.cb_model.recommend_for_user(rated_movies, n_cb)
-                for movie_id, title, score in cb_recs:
-                    recommendations.append((movie_id, title, score, 'content_based'))
-                    
-            pop_recs = self.popularity_model.recommend(n_pop)
-            for movie_id, title, score in pop_recs:
-                recommendations.append((movie_id, title, score, 'popularity'))
+            pools = self._fallback_pools(weights, results, missing, pool, explanation)
 
         else:  # active
             explanation['strategy'] = "Active user - CF (80%) + Content (20%)"
             explanation['models_used'].extend([('collaborative', 0.8), ('content_based', 0.2)])
-            n_cf = int(n * 0.8)
-            n_cb = n - n_cf
-            
+
+            results, cf_note, missing = self._hybrid_components(
+                cf_mode, user_id, movie_ids, ratings, pool, 30, cf_recs, deadline, pool
+            )
+            explanation['strategy'] += cf_note
+            weights = {'collaborative': 0.8, 'content_based': 0.2}
+
             # --- CORRECTION POUR NOUVEL UTILISATEUR ---
-            cf_recs = []
-            if self.cf_model and user_id in self.cf_model.user_ids:
-                cf_recs = self.cf_model.recommend(user_id, n_cf, k=30)
-            else:
-                # L'utilisateur est nouveau, réallouer tout le budget CF au Contenu
-                explanation['strategy'] += " (CF fallback: user not in model)"
-                n_cb += n_cf
+            if results['collaborative'] is None:
+                # CF hors délai ou sans note exploitable, réallouer tout le poids CF au Contenu
+                reason = missing.get('collaborative', "user not in model")
+                explanation['strategy'] += f" (CF fallback: {reason})"
+                weights = {'collaborative': 0.0, 'content_based': 1.0}
             # --- FIN CORRECTION ---
-                
-            for movie_id, score in cf_recs:
-                title = self.id_to_title.get(movie_id, f"Movie {movie_id}")
-                recommendations.append((movie_id, title, score, 'collaborative'))
-                
-            rated_movies = [
-                (self.id_to_title.get(row['movie_id'], ''), row['rating'])
-                for _, row in user_ratings.iterrows() if row['movie_id'] in self.id_to_title
-            ]
-            if rated_movies:
-                cb_recs = self.cb_model.recommend_for_user(rated_movies, n_cb)
-                for movie_id, title, score in cb_recs:
-                    recommendations.append((movie_id, title, score, 'content_based'))
-
-        seen = set()
-        unique_recs = []
-        for rec in recommendations:
-            if rec[0] not in seen:
-                seen.add(rec[0])
-                unique_recs.append(rec)
-        
-        final_recs = unique_recs[:n]
+
+            pools = self._fallback_pools(weights, results, missing, pool, explanation)
+
+        final_recs = self._fuse(pools, n, movie_ids)
         
         if explain:
             return final_recs, explanation
-        return final_recs
\ No newline at end of file
+        return final_recs
+
+    def recommend_batch(self, users, n=10, explain=False, cf_mode=None):
+        """
+        Recommendations for many users at once
+
+        The CF part of the 'moderate' and 'active' users known to the CF
+        model is scored in blocks with `recommend_many`; the rest of the
+        pipeline is the same as `recommend`.
+
+        Args:
+            users: Dict user_id -> ratings DataFrame of the user, or
+                (movie_ids, ratings) arrays (None to use the training ratings)
+            n: Number of recommendations per user
+            explain: Whether to return (recommendations, explanation) pairs
+            cf_mode: CF backend, defaults to the recommender's cf_mode
+
+        Returns:
+            Dict user_id -> the result of `recommend` for that user
+        """
+        cf_mode = cf_mode or self.cf_mode
+        cf_model = self.get_cf_model(cf_mode)
+        user_ratings = {
+            user_id: ratings if isinstance(ratings, tuple) else self._ratings_arrays(user_id, ratings)
+            for user_id, ratings in users.items()
+        }
+        categories = {
+            user_id: self.category_of(len(movie_ids))[0]
+            for user_id, (movie_ids, _) in user_ratings.items()
+        }
+
+        # Same CF candidate pool and neighborhood size as the branches of `recommend`
+        batched_cf_recs = {}
+        if cf_model:
+            for category, k in (('moderate', 20), ('active', 30)):
+                user_ids = [user_id for user_id, user_category in categories.items()
+                            if user_category == category and user_id in cf_model.user_ids]
+                if user_ids:
+                    batched_cf_recs.update(cf_model.recommend_many(user_ids, self._pool_size(n), k=k))
+
+        return {
+            user_id: self.recommend_for_ratings(
+                user_id, movie_ids, ratings, n, explain, cf_mode,
+                cf_recs=batched_cf_recs.get(user_id)
+            )
+            for user_id, (movie_ids, ratings) in user_ratings.items()
+        }
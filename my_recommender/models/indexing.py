@@ -0,0 +1,172 @@
+"""
+Id <-> row index helpers shared by the recommendation models
+"""
+from collections.abc import Mapping, Sequence
+
+import numpy as np
+
+
+class IdIndex(Sequence):
+    """
+    Read-only sequence of ids with O(1) membership and position lookups
+
+    Behaves like the `list` of ids the models used to expose
+    (`in`, `.index()`, iteration, `len`), but backed by a NumPy array
+    and a dict so lookups do not scan the whole list.
+    """
+
+    def __init__(self, ids):
+        self.values = np.asarray(ids)
+        self._positions = {
+            value: position for position, value in enumerate(self.values.tolist())
+        }
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return self.values[position].tolist()
+        return self.values[position].item()
+
+    def __iter__(self):
+        return iter(self.values.tolist())
+
+    def __contains__(self, value):
+        try:
+            return value in self._positions
+        except TypeError:
+            return False
+
+    def index(self, value, *args):
+        try:
+            return self._positions[value]
+        except (KeyError, TypeError):
+            raise ValueError(f"{value!r} is not in index") from None
+
+    def get(self, value, default=None):
+        """Return the position of `value`, or `default` if it is unknown"""
+        try:
+            return self._positions.get(value, default)
+        except TypeError:
+            return default
+
+    def positions(self, values, default=-1):
+        """Vectorized `get` over an iterable of ids"""
+        return np.array(
+            [self.get(value, default) for value in values], dtype=np.int64
+        )
+
+    def tolist(self):
+        return self.values.tolist()
+
+    def appended(self, value):
+        """Return a new index with `value` added at the end (self is unchanged)"""
+        index = self.__class__.__new__(self.__class__)
+        index.values = np.append(self.values, value)
+        index._positions = self._positions.copy()
+        index._positions[index.values[-1].item()] = len(self.values)
+        return index
+
+    def __reduce__(self):
+        # Only the ids are pickled, the lookup dict is rebuilt on load
+        return (self.__class__, (self.values,))
+
+
+class IdValueMap(Mapping):
+    """
+    Read-only mapping id -> value over an `IdIndex` and an aligned array
+    """
+
+    def __init__(self, index, values):
+        self.index = index
+        self.values = values
+
+    def __getitem__(self, key):
+        position = self.index.get(key)
+        if position is None:
+            raise KeyError(key)
+        return self.values[position].item()
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, key):
+        return key in self.index
+
+
+class UserRatingsIndex:
+    """
+    Ratings grouped by user: `offsets` into movie_id / rating arrays sorted by user
+
+    Replaces the per-request `ratings_df[ratings_df['user_id'] == user_id]`
+    scan (O(ratings)) by a binary search over the user ids. Only arrays are
+    stored, so the index is memory-mapped with the model set.
+    """
+
+    def __init__(self, ratings_df):
+        """
+        Args:
+            ratings_df: DataFrame with user_id, movie_id, rating columns
+        """
+        if ratings_df.empty:
+            self.user_ids = np.zeros(0, dtype=np.int64)
+            self.offsets = np.zeros(1, dtype=np.int64)
+            self.movie_ids = np.zeros(0, dtype=np.int64)
+            self.ratings = np.zeros(0, dtype=np.float64)
+            return
+        user_ids = ratings_df['user_id'].to_numpy(dtype=np.int64)
+        order = np.argsort(user_ids, kind='stable')
+        self.user_ids, starts = np.unique(user_ids[order], return_index=True)
+        self.offsets = np.append(starts, len(order)).astype(np.int64)
+        self.movie_ids = ratings_df['movie_id'].to_numpy(dtype=np.int64)[order]
+        self.ratings = ratings_df['rating'].to_numpy(dtype=np.float64)[order]
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def __contains__(self, user_id):
+        position = np.searchsorted(self.user_ids, user_id)
+        return position < len(self.user_ids) and self.user_ids[position] == user_id
+
+    def get(self, user_id):
+        """
+        Ratings of a user (read-only views, empty for unknown users)
+
+        Returns:
+            Tuple of (movie_ids, ratings) arrays
+        """
+        position = np.searchsorted(self.user_ids, user_id)
+        if position < len(self.user_ids) and self.user_ids[position] == user_id:
+            start, stop = self.offsets[position], self.offsets[position + 1]
+            return self.movie_ids[start:stop], self.ratings[start:stop]
+        return self.movie_ids[:0], self.ratings[:0]
+
+    def count(self, user_id):
+        """Number of ratings of a user"""
+        return len(self.get(user_id)[0])
+
+    def merged(self, user_id, movie_ids, ratings):
+        """
+        Ratings of a user with newer ratings applied on top
+
+        Args:
+            user_id: User ID
+            movie_ids: Movie IDs of the newer ratings (e.g. from MongoDB)
+            ratings: Their ratings; they replace the indexed rating of the same movie
+
+        Returns:
+            Tuple of (movie_ids, ratings) arrays, the newer ratings first
+        """
+        movie_ids = np.asarray(movie_ids, dtype=np.int64)
+        ratings = np.asarray(ratings, dtype=np.float64)
+        base_ids, base_ratings = self.get(user_id)
+        if not len(base_ids):
+            return movie_ids, ratings
+        if not len(movie_ids):
+            return base_ids, base_ratings
+        keep = ~np.isin(base_ids, movie_ids)
+        return np.concatenate([movie_ids, base_ids[keep]]), np.concatenate([ratings, base_ratings[keep]])
@@ -0,0 +1,258 @@
+"""
+Matrix Factorization Collaborative Filtering
+Latent factors trained with Alternating Least Squares (ALS)
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .collaborative import ImprovedCollaborativeFiltering
+from .indexing import IdValueMap
+
+
+def solve_least_squares(ratings, fixed_factors, regularization, batch_size=1024, n_threads=1):
+    """
+    Solve the ALS sub-problem for every row of a sparse ratings matrix
+
+    For each row r with rated columns I:
+        (Y_I^T Y_I + regularization * |I| * Id) x_r = Y_I^T d_I
+    The Gram matrices of a whole batch are obtained with one sparse product
+    against the packed outer products of the fixed factors, then solved
+    with one batched `np.linalg.solve`. Batches run on a thread pool
+    (scipy and LAPACK release the GIL).
+
+    Args:
+        ratings: CSR matrix (rows x columns) of mean-centered ratings
+        fixed_factors: Array (columns x factors) held fixed
+        regularization: Weighted-lambda regularization strength
+        batch_size: Number of rows solved per batch
+        n_threads: Number of worker threads
+
+    Returns:
+        Array (rows x factors) of solved factors
+    """
+    n_rows = ratings.shape[0]
+    n_factors = fixed_factors.shape[1]
+    upper_rows, upper_cols = np.triu_indices(n_factors)
+    packed_outer = fixed_factors[:, upper_rows] * fixed_factors[:, upper_cols]
+
+    rated = ratings.copy()
+    rated.data = np.ones_like(rated.data)
+    counts = np.diff(ratings.indptr)
+    identity = np.eye(n_factors)
+    solved = np.zeros((n_rows, n_factors))
+
+    def solve_batch(start):
+        stop = min(start + batch_size, n_rows)
+        packed_gram = rated[start:stop] @ packed_outer
+        gram = np.empty((stop - start, n_factors, n_factors))
+        gram[:, upper_rows, upper_cols] = packed_gram
+        gram[:, upper_cols, upper_rows] = packed_gram
+        penalty = regularization * np.maximum(counts[start:stop], 1)
+        gram += penalty[:, None, None] * identity
+        rhs = ratings[start:stop] @ fixed_factors
+        solved[start:stop] = np.linalg.solve(gram, rhs[:, :, None])[:, :, 0]
+
+    starts = range(0, n_rows, batch_size)
+    if n_threads > 1:
+        with ThreadPoolExecutor(max_workers=n_threads) as executor:
+            list(executor.map(solve_batch, starts))
+    else:
+        for start in starts:
+            solve_batch(start)
+    return solved
+
+
+class MatrixFactorizationCF(ImprovedCollaborativeFiltering):
+    """
+    Latent factor collaborative filtering:
+    - Ratings are centered by user mean and factorized as U V^T with ALS
+    - Training uses batched sparse products and batched linear solves
+    - Scoring a user is a single user_vector @ item_factors.T
+    """
+
+    # The user factors are per-user state, published with the ratings
+    _snapshot_fields = ImprovedCollaborativeFiltering._snapshot_fields + ('user_factors',)
+
+    def __init__(self, ratings_df, n_factors=32, regularization=0.1, n_iterations=15,
+                 n_threads=None, batch_size=1024, random_state=42):
+        """
+        Initialize and train the matrix factorization model
+
+        Args:
+            ratings_df: DataFrame with user_id, movie_id, rating columns
+            n_factors: Number of latent factors
+            regularization: Weighted-lambda regularization strength
+            n_iterations: Number of ALS sweeps (users then movies)
+            n_threads: Worker threads for the solves (defaults to the CPU count)
+            batch_size: Number of rows solved per batch
+            random_state: Seed of the movie factors initialization
+        """
+        super().__init__(ratings_df)
+        self.n_factors = n_factors
+        self.regularization = regularization
+        self.n_iterations = n_iterations
+        self.n_threads = n_threads or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.random_state = random_state
+        self.fit()
+
+    @property
+    def user_factors(self):
+        """Array (users x factors), aligned with `user_ids`"""
+        return self._snapshot.user_factors
+
+    def prepare(self):
+        # Scoring only uses the trained factors, no user similarities
+        pass
+
+    def fit(self):
+        """
+        Train the user and movie factors with alternating least squares
+
+        Returns:
+            self
+        """
+        rng = np.random.default_rng(self.random_state)
+        by_user = self._centered_ratings(self._snapshot)
+        by_movie = by_user.T.tocsr()
+
+        self.item_factors = rng.normal(
+            0.0, 0.1, size=(len(self.movie_ids), self.n_factors)
+        )
+        for _ in range(self.n_iterations):
+            user_factors = solve_least_squares(
+                by_user, self.item_factors, self.regularization,
+                self.batch_size, self.n_threads
+            )
+            self.item_factors = solve_least_squares(
+                by_movie, user_factors, self.regularization,
+                self.batch_size, self.n_threads
+            )
+        self._snapshot.user_factors = user_factors
+        return self
+
+    def rmse(self):
+        """Root mean squared error of the factorization on the training ratings"""
+        snapshot = self._snapshot
+        rating_matrix = snapshot.rating_matrix
+        rows = np.repeat(np.arange(len(snapshot.user_ids)), np.diff(rating_matrix.indptr))
+        cols = rating_matrix.indices
+        predictions = snapshot.mean_values[rows] + np.einsum(
+            'ij,ij->i', snapshot.user_factors[rows], self.item_factors[cols]
+        )
+        return float(np.sqrt(np.mean((np.clip(predictions, 1, 5) - rating_matrix.data) ** 2)))
+
+    def predict_rating(self, user_id, movie_id, k=None):
+        """
+        Predict rating for a user-movie pair
+
+        Args:
+            user_id: User ID
+            movie_id: Movie ID
+            k: Unused, kept for interface compatibility
+
+        Returns:
+            Predicted rating (1-5 scale)
+        """
+        snapshot = self._snapshot
+        user_idx = snapshot.user_ids.get(user_id)
+        movie_idx = self.movie_ids.get(movie_id)
+        if user_idx is None or movie_idx is None:
+            return IdValueMap(snapshot.user_ids, snapshot.mean_values).get(user_id, 3.0)
+        return self._predict_row(snapshot, user_idx, k)[movie_idx]
+
+    def predict_all(self, user_id, k=None):
+        """
+        Predict ratings of a user for every movie in one pass
+
+        Args:
+            user_id: User ID (must be in the model)
+            k: Unused, kept for interface compatibility
+
+        Returns:
+            Array of predicted ratings aligned with `movie_ids`
+        """
+        snapshot = self._snapshot
+        return self._predict_row(snapshot, snapshot.user_ids.index(user_id), k)
+
+    def _predict_row(self, snapshot, user_idx, k):
+        start, end = snapshot.rating_matrix.indptr[user_idx:user_idx + 2]
+        return self._predict_from_factors(
+            snapshot.mean_values[user_idx], snapshot.user_factors[user_idx],
+            snapshot.rating_matrix.indices[start:end], snapshot.rating_matrix.data[start:end]
+        )
+
+    def _on_user_row_updated(self, snapshot, user_idx, columns, values, is_new_user):
+        # Re-project the user onto the (unchanged) movie factors
+        _, user_vector = self.fold_in(columns, values)
+        # Copied into the new snapshot: concurrent requests keep the factors they started with
+        if is_new_user:
+            snapshot.user_factors = np.vstack([snapshot.user_factors, user_vector])
+        else:
+            user_factors = snapshot.user_factors.copy()
+            user_factors[user_idx] = user_vector
+            snapshot.user_factors = user_factors
+
+    def fold_in(self, columns, values):
+        """
+        Project a transient rating vector onto the movie factors
+
+        Solves the same regularized least squares as one ALS user step,
+        with the movie factors held fixed.
+
+        Args:
+            columns: Model column indices rated by the user
+            values: Ratings aligned with columns
+
+        Returns:
+            Tuple of (user mean, user factor vector)
+        """
+        user_mean = float(np.mean(values))
+        factors = self.item_factors[columns]
+        gram = factors.T @ factors + self.regularization * len(columns) * np.eye(self.n_factors)
+        return user_mean, np.linalg.solve(gram, factors.T @ (values - user_mean))
+
+    def predict_for_ratings(self, columns, values, k=None):
+        """
+        Predict every movie for a transient rating vector
+
+        Args:
+            columns: Sorted model column indices rated by the user
+            values: Ratings aligned with columns
+            k: Unused, kept for interface compatibility
+
+        Returns:
+            Array of predicted ratings aligned with `movie_ids`
+        """
+        user_mean, user_vector = self.fold_in(columns, values)
+        return self._predict_from_factors(user_mean, user_vector, columns, values)
+
+    def predict_many(self, user_rows, k=None):
+        """
+        Predict every movie for a block of users with one matrix product
+
+        Args:
+            user_rows: Model rows of the users
+            k: Unused, kept for interface compatibility
+
+        Returns:
+            Array (len(user_rows) x movies) of predicted ratings
+        """
+        return self._predict_many(self._snapshot, np.asarray(user_rows, dtype=np.int64), k)
+
+    def _predict_many(self, snapshot, user_rows, k):
+        predictions = np.clip(
+            snapshot.mean_values[user_rows][:, None]
+            + snapshot.user_factors[user_rows] @ self.item_factors.T,
+            1, 5
+        )
+        return self._keep_known_ratings(snapshot, predictions, user_rows)
+
+    def _predict_from_factors(self, user_mean, user_vector, rated_columns, ratings):
+        predictions = np.clip(user_mean + user_vector @ self.item_factors.T, 1, 5)
+
+        # Already rated movies keep their actual rating
+        predictions[rated_columns] = ratings
+        return predictions
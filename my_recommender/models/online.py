@@ -0,0 +1,184 @@
+"""
+Online incremental updates of the in-memory recommendation models
+Applies ratings written through /api/rate without retraining
+"""
+import time
+import queue
+import threading
+import traceback
+
+import numpy as np
+
+
+class OnlineUpdater:
+    """
+    Applies new or changed ratings to the models held by a HybridRecommender:
+    - CF matrix rows, user means and cached similarity rows of every CF backend
+    - ALS user factors (re-projected onto the fixed movie factors)
+    - Popularity aggregates and ranking
+    - Time-decayed trending counters (O(1) per rating)
+
+    Writers are serialized by a lock. The CF matrices, user means, ALS
+    factors and popularity tables are copied, updated and swapped in, so
+    concurrent requests keep reading a consistent state; the dense CF
+    similarities are updated in place under the model's similarity lock,
+    and the trending counters are incremented in place.
+    Ratings submitted asynchronously are applied in batches by a
+    background thread, which bounds the per-rating cost.
+    """
+
+    def __init__(self, hybrid_system, max_batch_size=256, on_applied=None):
+        """
+        Args:
+            hybrid_system: HybridRecommender whose models are updated
+            max_batch_size: Maximum number of queued ratings applied at once
+            on_applied: Optional callable, given the user IDs of each batch
+                once the models reflect it (e.g. to invalidate cached results)
+        """
+        self.hybrid_system = hybrid_system
+        self.max_batch_size = max_batch_size
+        self.on_applied = on_applied
+        self.applied_count = 0
+        self._lock = threading.Lock()
+        # user_id -> {movie_id: rating} applied since the models were loaded
+        self._applied_ratings = {}
+        # Ratings applied while a new model set is being loaded (see begin_swap)
+        self._swap_log = None
+        self._queue = queue.Queue()
+        self._worker = None
+
+    def apply_ratings(self, ratings):
+        """
+        Apply ratings synchronously
+
+        Args:
+            ratings: Iterable of (user_id, movie_id, rating) tuples
+
+        Returns:
+            Number of ratings applied
+        """
+        ratings = [(user_id, movie_id, float(rating)) for user_id, movie_id, rating in ratings]
+        if not ratings:
+            return 0
+
+        with self._lock:
+            if self._swap_log is not None:
+                self._swap_log.extend(ratings)
+            applied = self._apply(self.hybrid_system, ratings)
+        self._notify(ratings)
+        return applied
+
+    def _notify(self, ratings):
+        if self.on_applied is not None:
+            self.on_applied({user_id for user_id, _, _ in ratings})
+
+    def _apply(self, hybrid, ratings):
+        """Apply ratings to the models of `hybrid`; the caller holds the lock"""
+        by_user = {}
+        for user_id, movie_id, rating in ratings:
+            by_user.setdefault(user_id, {})[movie_id] = rating
+        popularity_updates = []
+
+        for user_id, user_ratings in by_user.items():
+            applied = self._applied_ratings.setdefault(user_id, {})
+            for movie_id, rating in user_ratings.items():
+                old_rating = self._previous_rating(hybrid, user_id, movie_id)
+                popularity_updates.append((movie_id, rating, old_rating))
+                applied[movie_id] = rating
+
+            movie_ids = list(user_ratings)
+            values = list(user_ratings.values())
+            for cf_model in hybrid.cf_models.values():
+                if cf_model is not None:
+                    cf_model.update_user_ratings(user_id, movie_ids, values)
+
+        hybrid.popularity_model.update_ratings(popularity_updates)
+        trending_model = getattr(hybrid, 'trending_model', None)
+        if trending_model is not None:
+            now = time.time()
+            for movie_id, rating, _ in popularity_updates:
+                trending_model.add_rating(movie_id, rating, now)
+        self.applied_count += len(popularity_updates)
+        return len(popularity_updates)
+
+    def _previous_rating(self, hybrid, user_id, movie_id):
+        """
+        Rating the user gave the movie before (0.0 if none): applied online,
+        else from the training ratings, whichever CF backends are loaded
+        """
+        old_rating = self._applied_ratings.get(user_id, {}).get(movie_id)
+        if old_rating is not None:
+            return old_rating
+        movie_ids, ratings = hybrid.user_index.get(user_id)
+        matches = np.flatnonzero(movie_ids == movie_id)
+        return float(ratings[matches[-1]]) if len(matches) else 0.0
+
+    def begin_swap(self):
+        """
+        Start recording the applied ratings, before a new model set is loaded
+
+        The models being loaded do not have the ratings applied from now on:
+        `swap_models` replays them.
+        """
+        with self._lock:
+            self._swap_log = []
+
+    def swap_models(self, hybrid_system):
+        """
+        Switch to a new model set, replaying the ratings applied since `begin_swap`
+
+        Returns:
+            Number of ratings replayed
+        """
+        with self._lock:
+            ratings, self._swap_log = self._swap_log or [], None
+            self.hybrid_system = hybrid_system
+            # The new models were trained on the ratings applied before begin_swap
+            self._applied_ratings = {}
+            if not ratings:
+                return 0
+            replayed = self._apply(hybrid_system, ratings)
+        self._notify(ratings)
+        return replayed
+
+    def cancel_swap(self):
+        """Stop recording after a model set failed to load"""
+        with self._lock:
+            self._swap_log = None
+
+    def apply_rating(self, user_id, movie_id, rating):
+        """Apply a single rating synchronously"""
+        return self.apply_ratings([(user_id, movie_id, rating)])
+
+    def submit(self, user_id, movie_id, rating):
+        """Queue a rating to be applied by the background worker"""
+        self._ensure_worker()
+        self._queue.put((user_id, movie_id, rating))
+
+    def flush(self):
+        """Block until every queued rating has been applied"""
+        self._queue.join()
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(
+                target=self._run, name='online-model-updater', daemon=True
+            )
+            self._worker.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.apply_ratings(batch)
+            except Exception as e:
+                print(f"Error applying online model updates: {e}")
+                traceback.print_exc()
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
@@ -1,38 +1,149 @@
 import pandas as pd
 import numpy as np
 
+from config import Config
+
 class PopularityModel:
     def __init__(self, movies_df, ratings_df, min_votes=50):
         self.movies_df = movies_df
-        self.ratings_df = ratings_df
         self.min_votes = min_votes
-        self.popular_movies = None
-        self._calculate_popularity()
-
-    def _calculate_popularity(self):
-        movie_stats = self.ratings_df.groupby('movie_id').agg({
-            'rating': ['mean', 'count']
-        }).reset_index()
-        movie_stats.columns = ['movie_id', 'avg_rating', 'vote_count']
-        qualified = movie_stats[movie_stats['vote_count'] >= self.min_votes].copy()
-        C = movie_stats['avg_rating'].mean()
+        self._calculate_popularity(ratings_df)
+
+    def __getstate__(self):
+        # The ranking arrays are rebuilt from popular_movies on load
+        state = self.__dict__.copy()
+        state.pop('rankings', None)
+        return state
+
+    def __setstate__(self, state):
+        state = dict(state)
+        ratings_df = state.pop('ratings_df', None)
+        self.__dict__.update(state)
+        if ratings_df is not None:
+            # Pickles created before the aggregates were kept as arrays
+            self._calculate_popularity(ratings_df)
+        else:
+            self.rankings = self._build_rankings(
+                self.popular_movies, self._weighted_scores(self.movie_stats)
+            )
+
+    def _calculate_popularity(self, ratings_df):
+        size = int(max(self.movies_df['movie_id'].max(), ratings_df['movie_id'].max() if len(ratings_df) else 0)) + 1
+        # Row 0: sum of ratings, row 1: number of votes, indexed by movie_id
+        # (one array, swapped as a whole on updates)
+        self.movie_stats = np.zeros((2, size))
+        if len(ratings_df):
+            movie_ids = ratings_df['movie_id'].to_numpy(dtype=np.int64)
+            self.movie_stats[0] = np.bincount(
+                movie_ids, ratings_df['rating'].to_numpy(dtype=np.float64), minlength=size
+            )
+            self.movie_stats[1] = np.bincount(movie_ids, minlength=size)
+        scores = self._weighted_scores(self.movie_stats)
+        self.popular_movies = self._rank_movies(self.movie_stats, scores)
+        self.rankings = self._build_rankings(self.popular_movies, scores)
+
+    def _weighted_scores(self, movie_stats):
+        """Weighted rating of every movie id (0 for movies without votes)"""
+        rating_sum, vote_count = movie_stats
+        rated = vote_count > 0
+        scores = np.zeros(movie_stats.shape[1])
+        if not rated.any():
+            return scores
+        vote_count = vote_count[rated]
+        avg_rating = rating_sum[rated] / vote_count
+        C = avg_rating.mean()
         m = self.min_votes
 
-        def weighted_rating(x, m=m, C=C):
-            v = x['vote_count']
-            R = x['avg_rating']
-            return (v / (v + m) * R) + (m / (v + m) * C)
+        # Weighted rating: (v / (v + m) * R) + (m / (v + m) * C)
+        scores[rated] = (vote_count / (vote_count + m) * avg_rating) + (m / (vote_count + m) * C)
+        return scores
+
+    def _rank_movies(self, movie_stats, scores):
+        """Ids of the qualified movies of the catalog, by decreasing weighted score"""
+        vote_count = movie_stats[1]
+        qualified = np.flatnonzero((vote_count > 0) & (vote_count >= self.min_votes))
+        qualified = qualified[np.isin(qualified, self.movies_df['movie_id'].to_numpy())]
+        # Stable sort, so ties keep the movie order
+        return qualified[np.argsort(-scores[qualified], kind='stable')]
+
+    def _build_rankings(self, popular_movies, scores):
+        """
+        Ranked arrays of the qualified movies, overall and per genre
+
+        Returns:
+            Dict with 'movie_ids', 'titles', 'scores' sorted by decreasing
+            weighted score and 'genres': genre -> positions in those arrays
+        """
+        movie_ids = np.asarray(popular_movies)
+        movies = self.movies_df.drop_duplicates('movie_id').set_index('movie_id')
+        genre_cols = [col for col in Config.GENRE_COLS if col in self.movies_df.columns]
+        in_genre = movies[genre_cols].reindex(movie_ids).fillna(0).to_numpy() == 1
+        return {
+            'movie_ids': movie_ids,
+            'titles': movies['movie_title'].reindex(movie_ids).to_numpy(dtype=object),
+            'scores': scores[movie_ids],
+            'genres': {
+                genre: np.flatnonzero(in_genre[:, col])
+                for col, genre in enumerate(genre_cols)
+            },
+        }
 
-        qualified['weighted_score'] = qualified.apply(weighted_rating, axis=1)
-        self.popular_movies = qualified.merge(
-            self.movies_df[['movie_id', 'movie_title']],
-            on='movie_id'
-        ).sort_values('weighted_score', ascending=False)
+    def update_ratings(self, updates):
+        """
+        Apply new or changed ratings to the aggregates and re-rank
+
+        Args:
+            updates: Iterable of (movie_id, rating, old_rating) tuples,
+                old_rating being 0 for a new rating
+
+        The cost depends on the catalog size, not on the number of ratings.
+        The new ranking is swapped in at the end, so readers always see a
+        complete table.
+        """
+        updates = list(updates)
+        size = max([self.movie_stats.shape[1]] + [int(movie_id) + 1 for movie_id, _, _ in updates])
+        # Copied (and grown for new movie ids), never written in place
+        movie_stats = np.zeros((2, size))
+        movie_stats[:, :self.movie_stats.shape[1]] = self.movie_stats
+        for movie_id, rating, old_rating in updates:
+            if old_rating and old_rating > 0:
+                movie_stats[0, movie_id] += rating - old_rating
+            else:
+                movie_stats[0, movie_id] += rating
+                movie_stats[1, movie_id] += 1
+
+        scores = self._weighted_scores(movie_stats)
+        popular_movies = self._rank_movies(movie_stats, scores)
+        rankings = self._build_rankings(popular_movies, scores)
+        self.movie_stats = movie_stats
+        self.popular_movies = popular_movies
+        self.rankings = rankings
+
+    @staticmethod
+    def _gather(rankings, positions):
+        return list(zip(
+            rankings['movie_ids'][positions].tolist(),
+            rankings['titles'][positions].tolist(),
+            rankings['scores'][positions].tolist()
+        ))
 
     def recommend(self, n=10):
-        recommendations = self.popular_movies.copy()
-        top_n = recommendations.head(n)
-        return [
-            (row['movie_id'], row['movie_title'], row['weighted_score'])
-            for _, row in top_n.iterrows()
-        ]
+        rankings = self.rankings
+        return self._gather(rankings, slice(0, n))
+
+    def recommend_genre(self, genre, n=10):
+        """
+        Most popular movies of a genre
+
+        Args:
+            genre: One of Config.GENRE_COLS
+            n: Number of recommendations
+
+        Returns:
+            List of (movie_id, title, weighted_score) tuples
+        """
+        rankings = self.rankings
+        if genre not in Config.GENRE_COLS:
+            raise ValueError(f"Unknown genre '{genre}'")
+        positions = rankings['genres'].get(genre, np.zeros(0, dtype=np.int64))
+        return self._gather(rankings, positions[:n])
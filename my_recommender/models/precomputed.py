@@ -0,0 +1,191 @@
+"""
+Offline snapshot of the hybrid recommendations of every known user
+Compact NumPy arrays + user id index, written by scripts/precompute_recommendations.py
+"""
+import json
+from datetime import datetime
+
+import numpy as np
+
+from .indexing import IdIndex
+
+
+class PrecomputedRecommendations:
+    """
+    Top-N lists of the hybrid recommender, one row per user:
+    - movie_ids: int32 (users x N), -1 where a user has fewer than N
+    - scores: float32 (users x N)
+    - model_codes: uint8 (users x N), position in MODELS
+    - category / rating count / strategy and model weights of each user,
+      for the explanation
+
+    A list is only valid while the user has not rated anything after
+    `created_at` (see `is_current`).
+    """
+
+    MODELS = ('collaborative', 'content_based', 'popularity', 'trending')
+    CATEGORIES = ('new', 'sparse', 'moderate', 'active')
+    NO_MODEL = 255
+
+    def __init__(self, user_ids, movie_ids, scores, model_codes, categories,
+                 rating_counts, strategy_codes, strategies, created_at,
+                 cf_mode='user', includes_database=True):
+        """
+        Args:
+            user_ids: User IDs aligned with the rows
+            movie_ids, scores, model_codes: Arrays (users x N)
+            categories: uint8 position of each user's category in CATEGORIES
+            rating_counts: Number of ratings of each user at snapshot time
+            strategy_codes: Position of each user's strategy in `strategies`
+            strategies: Distinct JSON-encoded {'strategy', 'models_used'} explanations
+            created_at: Unix timestamp (UTC) of the rating snapshot
+            cf_mode: CF backend the lists were computed with
+            includes_database: Whether the MongoDB ratings were part of the snapshot
+        """
+        self.user_ids = IdIndex(user_ids)
+        self.movie_ids = movie_ids
+        self.scores = scores
+        self.model_codes = model_codes
+        self.categories = categories
+        self.rating_counts = rating_counts
+        self.strategy_codes = strategy_codes
+        self.strategies = [str(strategy) for strategy in strategies]
+        self.created_at = float(created_at)
+        self.cf_mode = str(cf_mode)
+        self.includes_database = bool(includes_database)
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    @property
+    def n(self):
+        """Length of the stored lists"""
+        return self.movie_ids.shape[1]
+
+    @property
+    def created_at_datetime(self):
+        """Snapshot time as a naive UTC datetime, like the MongoDB `updated_at` fields"""
+        return datetime.utcfromtimestamp(self.created_at)
+
+    @classmethod
+    def from_results(cls, results, n, created_at, cf_mode='user', includes_database=True):
+        """
+        Pack the output of `HybridRecommender.recommend_batch(..., explain=True)`
+
+        Args:
+            results: Dict user_id -> (recommendations, explanation)
+            n: Length of the stored lists
+            created_at: Unix timestamp (UTC) of the rating snapshot
+            cf_mode: CF backend the lists were computed with
+            includes_database: Whether the MongoDB ratings were part of the snapshot
+        """
+        user_ids = sorted(results)
+        n_users = len(user_ids)
+        movie_ids = np.full((n_users, n), -1, dtype=np.int32)
+        scores = np.zeros((n_users, n), dtype=np.float32)
+        model_codes = np.full((n_users, n), cls.NO_MODEL, dtype=np.uint8)
+        categories = np.zeros(n_users, dtype=np.uint8)
+        rating_counts = np.zeros(n_users, dtype=np.int32)
+        strategy_codes = np.zeros(n_users, dtype=np.uint16)
+        strategies = {}
+
+        for row, user_id in enumerate(user_ids):
+            recommendations, explanation = results[user_id]
+            for col, (movie_id, _, score, model) in enumerate(recommendations[:n]):
+                movie_ids[row, col] = movie_id
+                scores[row, col] = score
+                model_codes[row, col] = cls.MODELS.index(model)
+            categories[row] = cls.CATEGORIES.index(explanation['category'])
+            rating_counts[row] = explanation['rating_count']
+            strategy = json.dumps({
+                'strategy': explanation['strategy'],
+                'models_used': explanation['models_used']
+            })
+            strategy_codes[row] = strategies.setdefault(strategy, len(strategies))
+
+        return cls(user_ids, movie_ids, scores, model_codes, categories, rating_counts,
+                   strategy_codes, list(strategies), created_at, cf_mode, includes_database)
+
+    def is_current(self, user_ratings):
+        """
+        Whether the stored list of a user still reflects their ratings
+
+        Args:
+            user_ratings: The user's MongoDB rating documents
+
+        Returns:
+            False if a rating was written after the snapshot, or if the
+            snapshot was built without the MongoDB ratings and the user has some
+        """
+        if not user_ratings:
+            return True
+        if not self.includes_database:
+            return False
+        snapshot_time = self.created_at_datetime
+        return all(
+            rating.get('updated_at') is not None and rating['updated_at'] <= snapshot_time
+            for rating in user_ratings
+        )
+
+    def get(self, user_id, id_to_title):
+        """
+        Stored recommendations of a user
+
+        Args:
+            user_id: User ID
+            id_to_title: Dict movie_id -> title
+
+        Returns:
+            Tuple of (list of (movie_id, title, score, model) tuples, explanation),
+            or None if the user is not in the snapshot
+        """
+        row = self.user_ids.get(user_id)
+        if row is None:
+            return None
+
+        valid = self.movie_ids[row] >= 0
+        recommendations = [
+            (movie_id, id_to_title.get(movie_id, f"Movie {movie_id}"), score, self.MODELS[code])
+            for movie_id, score, code in zip(
+                self.movie_ids[row][valid].tolist(),
+                self.scores[row][valid].tolist(),
+                self.model_codes[row][valid].tolist()
+            )
+        ]
+        strategy = json.loads(self.strategies[self.strategy_codes[row]])
+        explanation = {
+            'user_id': user_id,
+            'category': self.CATEGORIES[self.categories[row]],
+            'rating_count': int(self.rating_counts[row]),
+            'models_used': [tuple(model) for model in strategy['models_used']],
+            'strategy': strategy['strategy'] + " (precomputed)",
+            'cf_mode': self.cf_mode,
+            'precomputed_at': self.created_at_datetime.isoformat()
+        }
+        return recommendations, explanation
+
+    def save(self, filepath):
+        np.savez(
+            filepath,
+            user_ids=self.user_ids.values,
+            movie_ids=self.movie_ids,
+            scores=self.scores,
+            model_codes=self.model_codes,
+            categories=self.categories,
+            rating_counts=self.rating_counts,
+            strategy_codes=self.strategy_codes,
+            strategies=np.array(self.strategies, dtype=str),
+            meta=np.array([self.created_at, float(self.includes_database)]),
+            cf_mode=np.array(self.cf_mode)
+        )
+
+    @classmethod
+    def load(cls, filepath):
+        with np.load(filepath) as data:
+            created_at, includes_database = data['meta'].tolist()
+            return cls(
+                data['user_ids'], data['movie_ids'], data['scores'], data['model_codes'],
+                data['categories'], data['rating_counts'], data['strategy_codes'],
+                data['strategies'].tolist(), created_at,
+                cf_mode=data['cf_mode'].item(), includes_database=includes_database
+            )
@@ -0,0 +1,162 @@
+"""
+Popularity rankings per demographic segment (MovieLens u.user)
+Cold-start users with a segment hint get the list of their segment
+"""
+import numpy as np
+import pandas as pd
+
+
+class SegmentPopularity:
+    """
+    Weighted-rating rankings (same formula as PopularityModel) of the users
+    of each segment, for the dimensions of DIMENSIONS:
+    - 'age': age bucket, e.g. 'age:25-34'
+    - 'gender': 'gender:M' / 'gender:F'
+    - 'occupation': e.g. 'occupation:engineer'
+    - 'age_gender': e.g. 'age_gender:25-34/F'
+
+    All segments are aggregated in one bincount pass over the ratings and
+    stored as one CSR-like ranking (offsets + movie ids + scores).
+    """
+
+    DIMENSIONS = ('age_gender', 'age', 'gender', 'occupation')
+    AGE_BINS = [0, 18, 25, 35, 45, 50, 56, 200]
+    AGE_LABELS = ['<18', '18-24', '25-34', '35-44', '45-49', '50-55', '56+']
+
+    def __init__(self, movies_df, ratings_df, users_df, min_votes=20, max_per_segment=100):
+        """
+        Build the rankings of every segment
+
+        Args:
+            movies_df: DataFrame with movie_id, movie_title columns
+            ratings_df: DataFrame with user_id, movie_id, rating columns
+            users_df: DataFrame with user_id, age, gender, occupation columns
+            min_votes: Ratings needed inside a segment for a movie to be ranked
+            max_per_segment: Length of the stored rankings
+        """
+        self.min_votes = min_votes
+        self.max_per_segment = max_per_segment
+        self.id_to_title = dict(zip(movies_df['movie_id'], movies_df['movie_title']))
+
+        users = users_df.drop_duplicates('user_id').set_index('user_id')
+        labels = self._user_labels(users)
+        movie_ids = np.unique(ratings_df['movie_id'].to_numpy())
+
+        # Segment id of every (rating, dimension) pair, -1 when the user is unknown
+        names = []
+        segment_codes = []
+        for dimension in self.DIMENSIONS:
+            codes, uniques = pd.factorize(labels[dimension].reindex(ratings_df['user_id']).to_numpy())
+            segment_codes.append(np.where(codes >= 0, codes + len(names), -1))
+            names.extend(f"{dimension}:{label}" for label in uniques)
+        segments = np.concatenate(segment_codes)
+        columns = np.tile(np.searchsorted(movie_ids, ratings_df['movie_id'].to_numpy()), len(self.DIMENSIONS))
+        values = np.tile(ratings_df['rating'].to_numpy(dtype=np.float64), len(self.DIMENSIONS))
+        known = segments >= 0
+
+        n_segments, n_movies = len(names), len(movie_ids)
+        keys = segments[known] * n_movies + columns[known]
+        rating_sums = np.bincount(keys, values[known], minlength=n_segments * n_movies).reshape(n_segments, n_movies)
+        vote_counts = np.bincount(keys, minlength=n_segments * n_movies).reshape(n_segments, n_movies)
+
+        # Weighted rating: (v / (v + m) * R) + (m / (v + m) * C), C per segment
+        rated = vote_counts > 0
+        avg_ratings = np.divide(rating_sums, vote_counts, out=np.zeros_like(rating_sums), where=rated)
+        C = avg_ratings.sum(axis=1, keepdims=True) / np.maximum(rated.sum(axis=1, keepdims=True), 1)
+        m = min_votes
+        weighted = vote_counts / (vote_counts + m) * avg_ratings + m / (vote_counts + m) * C
+        weighted[vote_counts < m] = -np.inf
+
+        order = np.argsort(-weighted, axis=1, kind='stable')[:, :max_per_segment]
+        ranked = np.take_along_axis(weighted, order, axis=1)
+        lengths = np.isfinite(ranked).sum(axis=1)
+        keep = np.arange(order.shape[1]) < lengths[:, None]
+
+        self.segment_names = [str(name) for name in names]
+        self.offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        self.movie_ids = movie_ids[order[keep]].astype(np.int32)
+        self.scores = ranked[keep].astype(np.float32)
+        self._index_segments()
+
+    def _index_segments(self):
+        self.segment_rows = {name: row for row, name in enumerate(self.segment_names)}
+
+    def __getstate__(self):
+        # The name -> row lookup is rebuilt on load
+        state = self.__dict__.copy()
+        state.pop('segment_rows', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._index_segments()
+
+    @classmethod
+    def _user_labels(cls, users):
+        age = pd.cut(users['age'], cls.AGE_BINS, right=False, labels=cls.AGE_LABELS).astype(str)
+        gender = users['gender'].astype(str).str.upper()
+        return {
+            'age': age,
+            'gender': gender,
+            'occupation': users['occupation'].astype(str).str.lower(),
+            'age_gender': age + '/' + gender,
+        }
+
+    def __len__(self):
+        return len(self.segment_names)
+
+    @classmethod
+    def segment_key(cls, hint):
+        """
+        Segment of a hint
+
+        Args:
+            hint: A segment name ('occupation:engineer') or a dict with any
+                of age, gender, occupation; the most specific segment wins
+
+        Returns:
+            Segment name, or None
+        """
+        if isinstance(hint, str):
+            return hint
+        if not isinstance(hint, dict):
+            return None
+        age = hint.get('age')
+        if age is not None:
+            try:
+                age = pd.cut([float(age)], cls.AGE_BINS, right=False, labels=cls.AGE_LABELS)[0]
+            except (TypeError, ValueError):
+                age = None
+            if pd.isna(age):
+                age = None
+        gender = str(hint['gender']).upper() if hint.get('gender') else None
+        if age is not None and gender:
+            return f"age_gender:{age}/{gender}"
+        if hint.get('occupation'):
+            return f"occupation:{str(hint['occupation']).lower()}"
+        if age is not None:
+            return f"age:{age}"
+        if gender:
+            return f"gender:{gender}"
+        return None
+
+    def recommend(self, segment, n=10):
+        """
+        Most popular movies of a segment
+
+        Args:
+            segment: Segment name or hint (see `segment_key`)
+            n: Number of recommendations
+
+        Returns:
+            List of (movie_id, title, score) tuples, empty for unknown segments
+        """
+        row = self.segment_rows.get(self.segment_key(segment))
+        if row is None:
+            return []
+        start = self.offsets[row]
+        stop = min(self.offsets[row + 1], start + max(n, 0))
+        return [
+            (movie_id, self.id_to_title.get(movie_id, f"Movie {movie_id}"), score)
+            for movie_id, score in zip(self.movie_ids[start:stop].tolist(), self.scores[start:stop].tolist())
+        ]
@@ -0,0 +1,140 @@
+"""
+Trending model: exponentially time-decayed rating counts and means
+Updated in O(1) per rating, without recomputing over the ratings history
+"""
+import time
+
+import numpy as np
+
+
+class TrendingModel:
+    """
+    Per-movie decayed statistics, a rating of age a counting exp(-a / tau):
+    - heat: decayed number of ratings (how much the movie is rated now)
+    - mean: decayed mean rating
+    Movies are ranked by heat * shrunk mean, the mean being pulled towards
+    the global decayed mean like the weighted rating of PopularityModel.
+
+    Decay uses a fixed reference time: a rating at time t is stored with
+    weight exp((t - reference_time) / tau), and every weight is multiplied
+    by exp(-(now - reference_time) / tau) at query time. An update is then
+    a single addition; the arrays are rebased when the weights grow large.
+    """
+
+    # Rebase the weights before exp() gets close to float64 overflow
+    MAX_EXPONENT = 300.0
+
+    def __init__(self, movies_df, ratings_df, half_life_days=30.0, min_heat=5.0):
+        """
+        Build the decayed statistics from a ratings history
+
+        Args:
+            movies_df: DataFrame with movie_id, movie_title columns
+            ratings_df: DataFrame with movie_id, rating, unix_timestamp columns
+            half_life_days: Age at which a rating counts for half
+            min_heat: Heat at which a movie's own mean counts for half
+                (shrinkage towards the global mean)
+        """
+        self.half_life_days = half_life_days
+        self.tau = half_life_days * 86400.0 / np.log(2)
+        self.min_heat = min_heat
+        self.id_to_title = dict(zip(movies_df['movie_id'], movies_df['movie_title']))
+
+        size = int(max(movies_df['movie_id'].max(), ratings_df['movie_id'].max() if len(ratings_df) else 0)) + 1
+        # Row 0: sum of weights, row 1: sum of weighted ratings, indexed by movie_id
+        # (one array, swapped as a whole when it grows)
+        self.stats = np.zeros((2, size))
+        self.last_timestamp = 0.0
+        self.reference_time = 0.0
+
+        if len(ratings_df):
+            timestamps = ratings_df['unix_timestamp'].to_numpy(dtype=np.float64)
+            self.reference_time = float(timestamps.max())
+            self.last_timestamp = self.reference_time
+            weights = np.exp((timestamps - self.reference_time) / self.tau)
+            movie_ids = ratings_df['movie_id'].to_numpy(dtype=np.int64)
+            self.stats[0] = np.bincount(movie_ids, weights, minlength=size)
+            self.stats[1] = np.bincount(
+                movie_ids, weights * ratings_df['rating'].to_numpy(dtype=np.float64), minlength=size
+            )
+
+    def __len__(self):
+        return int(np.count_nonzero(self.stats[0]))
+
+    def _rebase(self, timestamp):
+        # O(catalog), once every MAX_EXPONENT * tau seconds
+        self.stats = self.stats * np.exp((self.reference_time - timestamp) / self.tau)
+        self.reference_time = timestamp
+
+    def add_rating(self, movie_id, rating, timestamp=None):
+        """
+        Count one rating event (re-ratings count as new activity)
+
+        Args:
+            movie_id: Movie ID
+            rating: Rating value
+            timestamp: Unix time of the rating (defaults to now)
+        """
+        timestamp = time.time() if timestamp is None else float(timestamp)
+        if (timestamp - self.reference_time) / self.tau > self.MAX_EXPONENT:
+            self._rebase(timestamp)
+        stats = self.stats
+        if movie_id >= stats.shape[1]:
+            # Amortized O(1): the array grows geometrically
+            grown = np.zeros((2, max(movie_id + 1, 2 * stats.shape[1])))
+            grown[:, :stats.shape[1]] = stats
+            self.stats = stats = grown
+        elif not stats.flags.writeable:
+            # Memory-mapped model set: copy on first write
+            self.stats = stats = stats.copy()
+        weight = np.exp((timestamp - self.reference_time) / self.tau)
+        stats[0, movie_id] += weight
+        stats[1, movie_id] += weight * rating
+        self.last_timestamp = max(self.last_timestamp, timestamp)
+
+    def scores(self, now=None):
+        """
+        Trending score of every movie id at a given time
+
+        Args:
+            now: Unix time (defaults to the latest rating seen, so that
+                replayed or historical data is not decayed to zero)
+
+        Returns:
+            Tuple of (scores indexed by movie_id, heat indexed by movie_id)
+        """
+        now = self.last_timestamp if now is None else float(now)
+        weight_sums, rating_sums = self.stats
+        heat = weight_sums * np.exp((self.reference_time - now) / self.tau)
+
+        rated = weight_sums > 0
+        if not rated.any():
+            return np.zeros_like(heat), heat
+        means = np.zeros_like(heat)
+        means[rated] = rating_sums[rated] / weight_sums[rated]
+        global_mean = rating_sums.sum() / weight_sums.sum()
+        shrunk_means = (heat * means + self.min_heat * global_mean) / (heat + self.min_heat)
+        return np.where(rated, heat * shrunk_means, 0.0), heat
+
+    def recommend(self, n=10, now=None):
+        """
+        Movies trending now
+
+        Args:
+            n: Number of recommendations
+            now: Unix time of the query (see `scores`)
+
+        Returns:
+            List of (movie_id, title, score) tuples
+        """
+        scores, _ = self.scores(now)
+        candidates = np.flatnonzero(scores > 0)
+        if n <= 0 or len(candidates) == 0:
+            return []
+        if n < len(candidates):
+            candidates = candidates[np.argpartition(-scores[candidates], n - 1)[:n]]
+        top = candidates[np.argsort(-scores[candidates], kind='stable')]
+        return [
+            (movie_id, self.id_to_title.get(movie_id, f"Movie {movie_id}"), score)
+            for movie_id, score in zip(top.tolist(), scores[top].tolist())
+        ]
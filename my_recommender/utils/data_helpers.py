@@ -1,3 +1,5 @@
+import os
+
 import pandas as pd
 import numpy as np
 
@@ -34,4 +36,70 @@ def enrich_recs_with_posters(recs_list, all_movies_df, id_col_idx, title_col_idx
             
         enriched_recs.append(rec_dict)
     
-    return enriched_recs
\ No newline at end of file
+    return enriched_recs
+
+def load_movies():
+    """
+    Movies DataFrame used for training: the TMDB-enriched CSV when it exists,
+    otherwise the MovieLens u.item file
+    """
+    from config import Config
+
+    if os.path.exists(Config.ENRICHED_MOVIES_PATH):
+        return pd.read_csv(Config.ENRICHED_MOVIES_PATH)
+
+    i_cols = ['movie_id', 'movie_title', 'release date', 'video release date',
+              'IMDb URL', 'unknown'] + Config.GENRE_COLS
+    return pd.read_csv(Config.DATA_PATH, sep='|', names=i_cols, encoding='latin-1')
+
+
+def load_user_demographics():
+    """
+    MovieLens demographics (u.user): user_id, age, gender, occupation, zip_code,
+    or None when the file is missing
+    """
+    from config import Config
+
+    if not os.path.exists(Config.USERS_PATH):
+        return None
+    return pd.read_csv(Config.USERS_PATH, sep='|',
+                       names=['user_id', 'age', 'gender', 'occupation', 'zip_code'],
+                       encoding='latin-1')
+
+
+def load_ratings(include_database=True):
+    """
+    MovieLens ratings merged with the MongoDB ratings (which win on duplicates),
+    like /api/recommend does for a single user
+
+    Args:
+        include_database: Whether to read the MongoDB ratings
+
+    Returns:
+        Tuple of (ratings DataFrame with user_id, movie_id, rating,
+        unix_timestamp columns, whether the MongoDB ratings are included)
+    """
+    from config import Config
+
+    ratings_df = pd.read_csv(Config.RATINGS_PATH, sep='\t',
+                             names=['user_id', 'movie_id', 'rating', 'unix_timestamp'],
+                             encoding='latin-1')
+    if not include_database:
+        return ratings_df, False
+
+    try:
+        from ..database.connection import get_db
+        documents = list(get_db().ratings.find(
+            {}, {'_id': 0, 'user_id': 1, 'movie_id': 1, 'rating': 1, 'updated_at': 1}
+        ))
+    except Exception as e:
+        print(f"Warning: MongoDB ratings unavailable ({e}), using MovieLens ratings only.")
+        return ratings_df, False
+
+    db_ratings = pd.DataFrame(documents, columns=['user_id', 'movie_id', 'rating', 'updated_at'])
+    db_ratings['rating'] = db_ratings['rating'].astype(float)
+    # updated_at is a naive UTC datetime; documents without it count as rated at load time
+    updated_at = pd.to_datetime(db_ratings.pop('updated_at')).fillna(pd.Timestamp.now('UTC').tz_localize(None))
+    db_ratings['unix_timestamp'] = (updated_at - pd.Timestamp(0)) // pd.Timedelta(seconds=1)
+    combined = pd.concat([db_ratings, ratings_df], ignore_index=True)
+    return combined.drop_duplicates(['user_id', 'movie_id'], keep='first'), True
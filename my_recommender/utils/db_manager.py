@@ -127,6 +127,14 @@ def get_user_ratings(user_id: int) -> List[Dict]:
     db = get_database()
     return Rating.find_by_user(db, user_id)
 
+def get_users_ratings(user_ids: List[int]) -> Dict[int, List[Dict]]:
+    """Get the ratings of several users with one query, grouped by user_id"""
+    db = get_database()
+    result = {user_id: [] for user_id in user_ids}
+    for rating in Rating.find_by_users(db, user_ids):
+        result.setdefault(rating['user_id'], []).append(rating)
+    return result
+
 def save_rating(user_id: int, movie_id: int, rating: float) -> Dict:
     """Save or update a rating"""
     db = get_database()
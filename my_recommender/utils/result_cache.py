@@ -0,0 +1,172 @@
+"""
+In-process cache of finished /api/recommend payloads
+LRU + TTL, bounded in entries and bytes, invalidated per user
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class RecommendationCache:
+    """
+    Serialized response bodies keyed by (user_id, request parameters)
+
+    A rating write must call `invalidate_user`: the user's generation is
+    set to a global counter, so that a payload computed before an
+    invalidation is never stored after it. Generations are kept while the
+    user has entries, for the `max_entries` most recently invalidated users
+    otherwise; a pruned generation is folded into a floor that rejects the
+    payloads computed before it. Entries also expire after `ttl` seconds,
+    which bounds the staleness caused by other processes or by model
+    updates that only indirectly affect a user.
+    """
+
+    def __init__(self, max_entries=10000, max_bytes=64 * 1024 * 1024, ttl=300):
+        """
+        Args:
+            max_entries: Maximum number of cached payloads
+            max_bytes: Maximum total size of the cached payloads
+            ttl: Lifetime of an entry in seconds
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, payload)
+        self._user_keys = {}
+        self._generations = OrderedDict()  # user_id -> clock of the last invalidation
+        self._clock = 0
+        self._pruned_floor = 0  # Latest generation pruned from _generations
+        self._epoch = 0  # Bumped by clear()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _key(user_id, params):
+        return (user_id, tuple(sorted(params.items())))
+
+    def generation(self, user_id):
+        """Token to pass to `put`, taken before computing a payload"""
+        return (self._epoch, self._clock)
+
+    def get(self, user_id, params):
+        """
+        Cached payload of a request, or None
+
+        Args:
+            user_id: User ID
+            params: Dict of the request parameters that change the result
+                (hashable values)
+        """
+        key = self._key(user_id, params)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+
+    def put(self, user_id, params, payload, generation=None):
+        """
+        Store a payload (bytes)
+
+        Args:
+            user_id: User ID
+            params: Request parameters, as given to `get`
+            payload: Serialized response body
+            generation: Value of `generation(user_id)` when the computation
+                started; the payload is dropped if the user was invalidated since
+        """
+        if len(payload) > self.max_bytes:
+            return
+        key = self._key(user_id, params)
+        with self._lock:
+            if generation is not None and not self._is_current(user_id, generation):
+                return
+            if key in self._entries:
+                self._remove(key, prune=False)
+            self._entries[key] = (time.monotonic() + self.ttl, payload)
+            self._user_keys.setdefault(user_id, set()).add(key)
+            self._size += len(payload)
+            while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _is_current(self, user_id, generation):
+        epoch, clock = generation
+        return epoch == self._epoch and self._generations.get(user_id, self._pruned_floor) <= clock
+
+    def _prune_generation(self, user_id):
+        generation = self._generations.pop(user_id, None)
+        if generation is not None:
+            self._pruned_floor = max(self._pruned_floor, generation)
+
+    def _remove(self, key, prune=True):
+        _, payload = self._entries.pop(key)
+        self._size -= len(payload)
+        user_keys = self._user_keys.get(key[0])
+        if user_keys is not None:
+            user_keys.discard(key)
+            if not user_keys:
+                del self._user_keys[key[0]]
+                # Last entry of the user evicted or expired
+                if prune:
+                    self._prune_generation(key[0])
+
+    def invalidate_user(self, user_id):
+        """Drop every entry of a user (after a rating write)"""
+        with self._lock:
+            return self._invalidate(user_id)
+
+    def invalidate_users(self, user_ids):
+        """Drop every entry of several users (after online model updates)"""
+        with self._lock:
+            return sum(self._invalidate(user_id) for user_id in set(user_ids))
+
+    def _invalidate(self, user_id):
+        self._clock += 1
+        self._generations[user_id] = self._clock
+        self._generations.move_to_end(user_id)
+        while len(self._generations) > self.max_entries:
+            self._prune_generation(next(iter(self._generations)))
+        keys = list(self._user_keys.get(user_id, ()))
+        for key in keys:
+            self._remove(key, prune=False)
+        self.invalidations += len(keys)
+        return len(keys)
+
+    def clear(self):
+        """Drop every entry (after a model reload)"""
+        with self._lock:
+            self._epoch += 1
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._user_keys.clear()
+            # Tokens taken before the new epoch are rejected anyway
+            self._generations.clear()
+            self._pruned_floor = 0
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'tracked_generations': len(self._generations),
+            }
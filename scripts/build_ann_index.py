@@ -0,0 +1,81 @@
+"""
+Build the approximate nearest-neighbor index of the collaborative filtering model
+and report its recall against the exact neighbor search.
+
+scripts/train_models.py already builds and publishes the index with each
+model set (--ann-tables, --ann-bits, --ann-probe-radius); this script
+compares the settings and rebuilds the index of an existing model.
+
+Usage:
+    python scripts/build_ann_index.py --tables 8 --bits 12 --probe-radius 1
+    python scripts/build_ann_index.py --report-only
+"""
+import os
+import sys
+import pickle
+import argparse
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from config import Config
+from my_recommender.models.ann import evaluate_recall
+
+# Settings compared by the recall report: (n_tables, n_bits, probe_radius)
+REPORT_GRID = [
+    (4, 12, 0), (4, 12, 1),
+    (8, 12, 0), (8, 12, 1),
+    (8, 10, 1), (16, 10, 1),
+    (16, 8, 1),
+]
+
+
+def print_report(cf_model, k, sample_size):
+    """Print recall@k and latency for every setting of REPORT_GRID"""
+    print("\n" + "="*78)
+    print(f"ANN RECALL REPORT (recall@{k} vs exact search, {sample_size} sampled users)")
+    print("="*78)
+    print(f"{'tables':>6} {'bits':>5} {'probe':>5} {'recall':>8} {'candidates':>11} "
+          f"{'fraction':>9} {'exact ms':>9} {'ann ms':>8}")
+
+    for n_tables, n_bits, probe_radius in REPORT_GRID:
+        cf_model.build_ann_index(n_tables, n_bits, probe_radius)
+        report = evaluate_recall(cf_model, k=k, sample_size=sample_size)
+        print(f"{n_tables:>6} {n_bits:>5} {probe_radius:>5} {report['recall_at_k']:>8.3f} "
+              f"{report['mean_candidates']:>11.1f} {report['candidate_fraction']:>9.3f} "
+              f"{report['exact_ms']:>9.2f} {report['approx_ms']:>8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default=Config.HYBRID_MODEL_PATH, help="Hybrid model pickle")
+    parser.add_argument('--output', default=Config.CF_ANN_INDEX_PATH, help="Where to write the index")
+    parser.add_argument('--tables', type=int, default=8, help="Number of hash tables")
+    parser.add_argument('--bits', type=int, default=12, help="Hyperplanes per table")
+    parser.add_argument('--probe-radius', type=int, default=1, choices=[0, 1], help="Hamming probe radius")
+    parser.add_argument('--k', type=int, default=20, help="Neighbors compared in the report")
+    parser.add_argument('--sample', type=int, default=200, help="Users sampled for the report")
+    parser.add_argument('--report-only', action='store_true', help="Only print the recall report")
+    args = parser.parse_args()
+
+    with open(args.model, 'rb') as f:
+        hybrid_system = pickle.load(f)
+    cf_model = hybrid_system.cf_model
+    if cf_model is None:
+        print("✗ The hybrid model has no collaborative filtering model.")
+        sys.exit(1)
+
+    print(f"Loaded CF model: {len(cf_model.user_ids)} users x {len(cf_model.movie_ids)} movies")
+    print_report(cf_model, args.k, args.sample)
+
+    if args.report_only:
+        return
+
+    index = cf_model.build_ann_index(args.tables, args.bits, args.probe_radius)
+    index.save(args.output)
+    print(f"\n✓ ANN index ({args.tables} tables x {args.bits} bits, probe radius "
+          f"{args.probe_radius}) saved to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
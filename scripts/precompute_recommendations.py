@@ -0,0 +1,120 @@
+"""
+Precompute the hybrid recommendations of every known user.
+
+Users are split into chunks scored by a pool of worker processes, each
+holding its own copy of the hybrid model; inside a chunk the CF part is
+scored in blocks with sparse/dense matrix products (`recommend_batch`).
+The API serves the stored lists to users who have not rated anything
+since the snapshot.
+
+Usage:
+    python scripts/precompute_recommendations.py --n 20 --workers 4
+    python scripts/precompute_recommendations.py --no-database
+"""
+import os
+import sys
+import time
+import pickle
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from config import Config
+from my_recommender.models.ann import RandomProjectionLSH
+from my_recommender.models.content import ImprovedContentBased
+from my_recommender.models.precomputed import PrecomputedRecommendations
+from my_recommender.utils.data_helpers import load_ratings
+
+# Hybrid model of the current worker process, loaded once by _init_worker
+_hybrid_system = None
+
+
+def _load_hybrid_system(model_path):
+    # Same models as the API serves (see create_app)
+    with open(model_path, 'rb') as f:
+        hybrid_system = pickle.load(f)
+    if os.path.exists(Config.CONTENT_MODEL_PATH):
+        hybrid_system.cb_model = ImprovedContentBased.load_model(Config.CONTENT_MODEL_PATH)
+    if hybrid_system.cf_model is not None and os.path.exists(Config.CF_ANN_INDEX_PATH):
+        hybrid_system.cf_model.attach_ann_index(RandomProjectionLSH.load(Config.CF_ANN_INDEX_PATH))
+    return hybrid_system
+
+
+def _init_worker(model_path):
+    global _hybrid_system
+    _hybrid_system = _load_hybrid_system(model_path)
+
+
+def _recommend_chunk(chunk_ratings, n, cf_mode):
+    """Recommendations of the users of one chunk, in a worker process"""
+    users = {
+        user_id: user_ratings
+        for user_id, user_ratings in chunk_ratings.groupby('user_id', sort=False)
+    }
+    return _hybrid_system.recommend_batch(users, n, explain=True, cf_mode=cf_mode)
+
+
+def main():
+    global _hybrid_system
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default=Config.HYBRID_MODEL_PATH, help="Hybrid model pickle")
+    parser.add_argument('--output', default=Config.PRECOMPUTED_RECS_PATH, help="Where to write the lists")
+    parser.add_argument('--n', type=int, default=20, help="Recommendations stored per user")
+    parser.add_argument('--cf-mode', default=None, help="CF backend (defaults to the model's)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Worker processes")
+    parser.add_argument('--chunk-size', type=int, default=128, help="Users per task")
+    parser.add_argument('--no-database', action='store_true', help="Skip the MongoDB ratings")
+    args = parser.parse_args()
+
+    # Taken before reading the ratings: anything rated during the job is newer
+    created_at = time.time()
+    ratings_df, includes_database = load_ratings(not args.no_database)
+    if not includes_database:
+        print("Users with MongoDB ratings will be served live by the API.")
+
+    hybrid_system = _load_hybrid_system(args.model)
+    cf_mode = args.cf_mode or hybrid_system.cf_mode
+    if cf_mode not in hybrid_system.CF_MODES:
+        print(f"✗ Unknown CF mode '{cf_mode}'. Expected one of {list(hybrid_system.CF_MODES)}")
+        sys.exit(1)
+    if cf_mode not in hybrid_system.cf_models:
+        print(f"✗ CF mode '{cf_mode}' is not in {args.model}. Train it with "
+              f"scripts/train_models.py --cf-modes {cf_mode}")
+        sys.exit(1)
+
+    user_ids = ratings_df['user_id'].unique()
+    chunks = [
+        ratings_df[ratings_df['user_id'].isin(user_ids[start:start + args.chunk_size])]
+        for start in range(0, len(user_ids), args.chunk_size)
+    ]
+    print(f"Precomputing top-{args.n} for {len(user_ids)} users "
+          f"({len(chunks)} chunks, {args.workers} workers, cf_mode={cf_mode})...")
+
+    start = time.perf_counter()
+    results = {}
+    if args.workers > 1:
+        with ProcessPoolExecutor(args.workers, initializer=_init_worker,
+                                 initargs=(args.model,)) as executor:
+            futures = [executor.submit(_recommend_chunk, chunk, args.n, cf_mode) for chunk in chunks]
+            for done, future in enumerate(futures, 1):
+                results.update(future.result())
+                print(f"  {done}/{len(chunks)} chunks done")
+    else:
+        _hybrid_system = hybrid_system
+        for done, chunk in enumerate(chunks, 1):
+            results.update(_recommend_chunk(chunk, args.n, cf_mode))
+            print(f"  {done}/{len(chunks)} chunks done")
+    elapsed = time.perf_counter() - start
+
+    store = PrecomputedRecommendations.from_results(
+        results, args.n, created_at, cf_mode, includes_database
+    )
+    store.save(args.output)
+    print(f"\n✓ {len(store)} recommendation lists saved to {args.output} "
+          f"in {elapsed:.1f}s ({1000 * elapsed / max(len(store), 1):.1f} ms/user)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,232 @@
+"""
+Train the recommendation models and write a versioned set of artifacts.
+
+The popularity, trending, segment popularity, collaborative filtering
+(one stage per CF backend) and content-based models are independent, so
+they are trained as parallel stages in a process pool. The hybrid system is then assembled from them.
+
+Artifacts go to models/<version>/ with a manifest.json: the memory-mapped
+model set (arrays/, loaded by the API), the pickles and the ANN index of
+the user-based CF model. Unless
+--no-publish is given, models/CURRENT is pointed at the new version and
+the pickles and the index are copied to the paths of config.py.
+
+Usage:
+    python scripts/train_models.py
+    python scripts/train_models.py --cf-modes user item --cf-mode item
+    python scripts/train_models.py --content-components 64
+    python scripts/train_models.py --no-database --no-publish
+"""
+import os
+import sys
+import json
+import time
+import pickle
+import shutil
+import argparse
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from config import Config
+from my_recommender.models.artifacts import save_artifacts
+from my_recommender.models.content import ImprovedContentBased
+from my_recommender.models.hybrid import HybridRecommender
+from my_recommender.models.popularity import PopularityModel
+from my_recommender.models.segments import SegmentPopularity
+from my_recommender.models.trending import TrendingModel
+from my_recommender.utils.data_helpers import load_movies, load_ratings, load_user_demographics
+
+MODELS_DIR = os.path.dirname(Config.HYBRID_MODEL_PATH)
+
+
+def train_popularity(movies_df, ratings_df, n_threads):
+    return PopularityModel(movies_df, ratings_df)
+
+
+def train_trending(movies_df, ratings_df, n_threads):
+    return TrendingModel(movies_df, ratings_df)
+
+
+def train_segments(users_df, movies_df, ratings_df, n_threads):
+    return SegmentPopularity(movies_df, ratings_df, users_df)
+
+
+def train_content(n_components, movies_df, ratings_df, n_threads):
+    return ImprovedContentBased(HybridRecommender.content_movies(movies_df), n_components=n_components)
+
+
+def train_collaborative(cf_mode, movies_df, ratings_df, n_threads):
+    cf_class = HybridRecommender.CF_MODES[cf_mode]
+    if cf_mode == 'als':
+        return cf_class(ratings_df, n_threads=n_threads)
+    return cf_class(ratings_df)
+
+
+def _run_stage(name, train, args):
+    """Train one model in a worker process, returns (name, model, seconds)"""
+    start = time.perf_counter()
+    model = train(*args)
+    return name, model, time.perf_counter() - start
+
+
+def _dump(obj, filepath):
+    with open(filepath, 'wb') as f:
+        pickle.dump(obj, f)
+
+
+def _publish(source, destination):
+    # Copy then rename, so the API never reads a half-written file
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    tmp_path = destination + '.tmp'
+    shutil.copyfile(source, tmp_path)
+    os.replace(tmp_path, destination)
+
+
+def _point_current(output_dir, version):
+    # Workers started from now on load the new model set; running ones keep their mapping
+    pointer = os.path.join(output_dir, 'CURRENT')
+    with open(pointer + '.tmp', 'w') as f:
+        f.write(version)
+    os.replace(pointer + '.tmp', pointer)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cf-modes', nargs='+', default=list(HybridRecommender.CF_MODES),
+                        choices=list(HybridRecommender.CF_MODES),
+                        help="CF backends to train and serve ('user' is always trained; "
+                             "the API rejects the others)")
+    parser.add_argument('--cf-mode', default='user', choices=list(HybridRecommender.CF_MODES),
+                        help="Default CF backend of the hybrid system")
+    parser.add_argument('--content-components', type=int, default=None,
+                        help="Embed genres + overview in this many SVD components (default: sparse genres)")
+    parser.add_argument('--ann-tables', type=int, default=8, help="Hash tables of the CF ANN index")
+    parser.add_argument('--ann-bits', type=int, default=12, help="Hyperplanes per table of the CF ANN index")
+    parser.add_argument('--ann-probe-radius', type=int, default=1, choices=[0, 1],
+                        help="Hamming probe radius of the CF ANN index")
+    parser.add_argument('--no-ann', action='store_true', help="Do not build the CF ANN index")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Worker processes")
+    parser.add_argument('--output-dir', default=MODELS_DIR, help="Directory of the versioned artifacts")
+    parser.add_argument('--version', default=None, help="Artifact version (defaults to a timestamp)")
+    parser.add_argument('--no-database', action='store_true', help="Skip the MongoDB ratings")
+    parser.add_argument('--no-publish', action='store_true',
+                        help="Do not copy the artifacts to the paths loaded by the API")
+    args = parser.parse_args()
+
+    cf_modes = list(dict.fromkeys(['user'] + args.cf_modes + [args.cf_mode]))
+    version = args.version or datetime.utcnow().strftime('%Y%m%d-%H%M%S')
+    version_dir = os.path.join(args.output_dir, version)
+    if os.path.exists(version_dir):
+        print(f"✗ Version '{version}' already exists in {args.output_dir}")
+        sys.exit(1)
+
+    timings = {}
+    total_start = time.perf_counter()
+
+    print("Loading data...")
+    start = time.perf_counter()
+    movies_df = load_movies()
+    ratings_df, includes_database = load_ratings(not args.no_database)
+    timings['load_data'] = time.perf_counter() - start
+    print(f"  {len(movies_df)} movies, {len(ratings_df)} ratings "
+          f"({'with' if includes_database else 'without'} MongoDB ratings)")
+
+    stages = [('popularity', train_popularity, ()), ('trending', train_trending, ()),
+              ('content', train_content, (args.content_components,))]
+    users_df = load_user_demographics()
+    if users_df is not None:
+        stages.append(('segments', train_segments, (users_df,)))
+    else:
+        print(f"  {Config.USERS_PATH} not found, no segment popularity")
+    stages += [(f'cf_{cf_mode}', train_collaborative, (cf_mode,)) for cf_mode in cf_modes]
+    workers = max(1, min(args.workers, len(stages)))
+    # Threads left to each stage (used by the ALS solves)
+    n_threads = max(1, (os.cpu_count() or 1) // workers)
+
+    print(f"Training {len(stages)} stages on {workers} worker processes...")
+    start = time.perf_counter()
+    models = {}
+    with ProcessPoolExecutor(workers) as executor:
+        futures = [
+            executor.submit(_run_stage, name, train, extra + (movies_df, ratings_df, n_threads))
+            for name, train, extra in stages
+        ]
+        for future in futures:
+            name, model, seconds = future.result()
+            models[name] = model
+            timings[name] = seconds
+            print(f"  ✓ {name} trained in {seconds:.2f}s")
+    timings['training_wall'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    hybrid_system = HybridRecommender.from_components(
+        movies_df, ratings_df, models['popularity'],
+        {cf_mode: models[f'cf_{cf_mode}'] for cf_mode in cf_modes},
+        models['content'], cf_mode=args.cf_mode, trending_model=models['trending'],
+        segment_model=models.get('segments')
+    )
+
+    os.makedirs(version_dir)
+    artifacts = {
+        'hybrid_system': os.path.join(version_dir, os.path.basename(Config.HYBRID_MODEL_PATH)),
+        'content_model': os.path.join(version_dir, os.path.basename(Config.CONTENT_MODEL_PATH)),
+        'popularity_model': os.path.join(version_dir, 'popularity_model.pkl'),
+        'cf_model': os.path.join(version_dir, 'cf_model.pkl'),
+    }
+    if not args.no_ann and hybrid_system.cf_model is not None:
+        # Built for these users: an index of a previous model set would be rejected by the API
+        ann_start = time.perf_counter()
+        artifacts['cf_ann_index'] = os.path.join(version_dir, os.path.basename(Config.CF_ANN_INDEX_PATH))
+        hybrid_system.cf_model.build_ann_index(
+            args.ann_tables, args.ann_bits, args.ann_probe_radius
+        ).save(artifacts['cf_ann_index'])
+        timings['ann_index'] = time.perf_counter() - ann_start
+    _dump(hybrid_system, artifacts['hybrid_system'])
+    hybrid_system.cb_model.save_model(artifacts['content_model'])
+    _dump(hybrid_system.popularity_model, artifacts['popularity_model'])
+    _dump(hybrid_system.cf_model, artifacts['cf_model'])
+    save_artifacts(hybrid_system, os.path.join(version_dir, 'arrays'), version)
+    timings['save'] = time.perf_counter() - start
+
+    manifest = {
+        'version': version,
+        'created_at': datetime.utcnow().isoformat(),
+        'n_movies': len(movies_df),
+        'n_ratings': len(ratings_df),
+        'n_users': int(ratings_df['user_id'].nunique()),
+        'includes_database': includes_database,
+        'cf_modes': cf_modes,
+        'cf_mode': args.cf_mode,
+        'content_components': args.content_components,
+        'artifacts': {name: os.path.basename(path) for name, path in artifacts.items()},
+        'arrays': 'arrays',
+        'timings': {name: round(seconds, 3) for name, seconds in timings.items()},
+    }
+    with open(os.path.join(version_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    if not args.no_publish:
+        _point_current(args.output_dir, version)
+        _publish(artifacts['hybrid_system'], Config.HYBRID_MODEL_PATH)
+        _publish(artifacts['content_model'], Config.CONTENT_MODEL_PATH)
+        _publish(artifacts['popularity_model'], os.path.join(MODELS_DIR, 'popularity_model.pkl'))
+        _publish(artifacts['cf_model'], os.path.join(MODELS_DIR, 'cf_model.pkl'))
+        if 'cf_ann_index' in artifacts:
+            _publish(artifacts['cf_ann_index'], Config.CF_ANN_INDEX_PATH)
+    timings['total'] = time.perf_counter() - total_start
+
+    print("\n" + "="*48)
+    print(f"TRAINING REPORT - version {version}")
+    print("="*48)
+    for name, seconds in timings.items():
+        print(f"{name:<20} {seconds:>10.2f}s")
+    print(f"\n✓ Artifacts written to {version_dir}")
+    if not args.no_publish:
+        print(f"✓ Published to {MODELS_DIR}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Regression tests of the vectorized Pearson engine against the per-pair
+`ImprovedCollaborativeFiltering.calculate_similarity` it replaced, and of
+the online updates applied on top of it
+"""
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.sparse import csr_matrix
+
+from my_recommender.models.collaborative import ImprovedCollaborativeFiltering, pearson_similarity
+
+
+def _ratings(n_users=60, n_movies=80, density=0.3, seed=0):
+    rng = np.random.default_rng(seed)
+    mask = rng.random((n_users, n_movies)) < density
+    users, movies = np.nonzero(mask)
+    return pd.DataFrame({
+        'user_id': users + 1,
+        'movie_id': movies + 1,
+        'rating': rng.integers(1, 6, len(users)).astype(float),
+    })
+
+
+def _reference_matrix(model):
+    dense = model.rating_matrix.toarray()
+    n_users = dense.shape[0]
+    reference = np.zeros((n_users, n_users))
+    for u in range(n_users):
+        for v in range(n_users):
+            reference[u, v] = model.calculate_similarity(dense[u], dense[v])
+    return reference
+
+
+def _reference_neighbors(model, reference, user_idx, k):
+    # Old find_k_neighbors: every other user, list.sort (stable) on the score,
+    # mathematically tied scores keeping the user order
+    scores = [
+        (model.user_ids[v], round(reference[user_idx, v], 9))
+        for v in range(len(model.user_ids)) if v != user_idx
+    ]
+    scores = [pair for pair in scores if pair[1] > 0]
+    scores.sort(key=lambda pair: pair[1], reverse=True)
+    return [user_id for user_id, _ in scores[:k]]
+
+
+# A threshold that no correlation hits exactly: at exactly 0.1, say, the
+# per-pair loop's rounding error can drop a pair the exact formula keeps
+@pytest.mark.parametrize('min_common_items,similarity_threshold', [(2, 0.0), (3, 0.0), (2, 0.123)])
+def test_similarity_matrix_matches_per_pair_pearson(min_common_items, similarity_threshold):
+    model = ImprovedCollaborativeFiltering(_ratings(), min_common_items, similarity_threshold)
+    reference = _reference_matrix(model)
+
+    np.testing.assert_allclose(model.compute_similarity_matrix(), reference, rtol=0, atol=1e-12)
+
+
+@pytest.mark.parametrize('seed', [0, 1])
+def test_neighbors_match_per_pair_pearson(seed):
+    # Few movies and star ratings: many users are exactly tied
+    model = ImprovedCollaborativeFiltering(_ratings(80, 12, 0.5, seed))
+    reference = _reference_matrix(model)
+
+    for user_idx, user_id in enumerate(model.user_ids):
+        neighbors = [neighbor_id for neighbor_id, _ in model.find_k_neighbors(user_id, k=10)]
+        assert neighbors == _reference_neighbors(model, reference, user_idx, 10)
+
+
+def test_blocks_and_fold_in_match_full_matrix():
+    model = ImprovedCollaborativeFiltering(_ratings())
+    full = pearson_similarity(model.rating_matrix)
+
+    np.testing.assert_array_equal(pearson_similarity(model.rating_matrix, block_size=7), full)
+    np.testing.assert_array_equal(pearson_similarity(model.rating_matrix, rows=[3, 17]), full[[3, 17]])
+    query = csr_matrix(model.rating_matrix[5])
+    np.testing.assert_array_equal(pearson_similarity(model.rating_matrix, query=query)[0], full[5])
+
+
+def test_reads_during_an_update_see_one_snapshot(monkeypatch):
+    model = ImprovedCollaborativeFiltering(_ratings())
+    user_ids = model.user_ids.values.tolist() + [1000]
+    before = model.recommend_many(user_ids, n=5)
+    during = []
+
+    def read_midway(*args):
+        # Runs once the new ratings are built, before they are published
+        during.append(model.recommend_many(user_ids, n=5))
+
+    monkeypatch.setattr(model, '_on_user_row_updated', read_midway)
+    model.update_user_ratings(1000, [1, 2, 3, 4], [5.0, 4.0, 2.0, 1.0])
+
+    assert during == [before]
+    after = model.recommend_many(user_ids, n=5)
+    assert set(after) == set(user_ids)
+    np.testing.assert_allclose(
+        model.similarity_matrix, pearson_similarity(model.rating_matrix), rtol=0, atol=1e-12
+    )